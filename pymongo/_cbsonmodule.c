@@ -32,15 +32,27 @@
 
 #include "time_helpers.h"
 #include "encoding_helpers.h"
+#include "json_helpers.h"
+
+#if defined(WIN32) || defined(_MSC_VER)
+#include <process.h>
+#define GETPID() _getpid()
+#else
+#include <unistd.h>
+#define GETPID() getpid()
+#endif
 
 static PyObject* InvalidName;
+static PyObject* InvalidBSON;
 static PyObject* InvalidDocument;
 static PyObject* InvalidStringData;
 static PyObject* SON;
 static PyObject* Binary;
 static PyObject* Code;
 static PyObject* ObjectId;
+static PyObject* ObjectIdSlot;
 static PyObject* DBRef;
+static PyObject* Timestamp;
 static PyObject* RECompile;
 static PyObject* UUID;
 
@@ -96,8 +108,34 @@ typedef struct {
     int position;
 } bson_buffer;
 
+/* Number of slots in a key cache - must be a power of two. */
+#define KEY_CACHE_SIZE 256
+
+/* Keys longer than this aren't worth caching. */
+#define KEY_CACHE_MAX_LENGTH 64
+
+/* A small direct-mapped cache of decoded document keys.
+ *
+ * Result sets tend to contain many documents with the same keys, so while
+ * decoding a batch we remember the unicode object we created for each raw
+ * key and hand out new references to it instead of decoding the same
+ * bytes over and over. Entries point into the buffer being decoded, so a
+ * cache must not outlive that buffer. */
+typedef struct {
+    const char* name;
+    int length;
+    unsigned long hash;
+    PyObject* key;
+} key_cache_entry;
+
+typedef struct {
+    key_cache_entry entries[KEY_CACHE_SIZE];
+} key_cache;
+
 static int write_dict(bson_buffer* buffer, PyObject* dict, unsigned char check_keys);
-static PyObject* elements_to_dict(const char* string, int max);
+static PyObject* elements_to_dict(const char* string, int max,
+                                  PyObject* as_class, unsigned char raw_dates,
+                                  key_cache* cache);
 
 static bson_buffer* buffer_new(void) {
     bson_buffer* buffer;
@@ -282,6 +320,28 @@ static int write_element_to_buffer(bson_buffer* buffer, int type_byte, PyObject*
         length = buffer->position - start_position;
         memcpy(buffer->buffer + length_location, &length, 4);
         return 1;
+    } else if (Timestamp && PyObject_IsInstance(value, Timestamp)) {
+        /* inc comes first on the wire, then time */
+        unsigned int parts[2];
+        PyObject* seconds = PyObject_GetAttrString(value, "time");
+        PyObject* inc;
+        if (!seconds) {
+            return 0;
+        }
+        inc = PyObject_GetAttrString(value, "inc");
+        if (!inc) {
+            Py_DECREF(seconds);
+            return 0;
+        }
+        parts[0] = (unsigned int)PyInt_AsUnsignedLongMask(inc);
+        parts[1] = (unsigned int)PyInt_AsUnsignedLongMask(seconds);
+        Py_DECREF(seconds);
+        Py_DECREF(inc);
+        if (PyErr_Occurred()) {
+            return 0;
+        }
+        *(buffer->buffer + type_byte) = 0x11;
+        return buffer_write_bytes(buffer, (const char*)parts, 8);
     } else if (PyObject_IsInstance(value, Binary)) {
         PyObject* subtype_object;
 
@@ -409,24 +469,35 @@ static int write_element_to_buffer(bson_buffer* buffer, int type_byte, PyObject*
         result = write_string(buffer, encoded);
         Py_DECREF(encoded);
         return result;
-    } else if (PyDateTime_CheckExact(value)) {
-        time_t rawtime;
-        struct tm timeinfo;
+    } else if (PyDateTime_Check(value)) {
         long long time_since_epoch;
 
-        time(&rawtime);
-        if (LOCALTIME(&timeinfo, &rawtime)) {
-            return 0;
+        time_since_epoch = days_from_civil(PyDateTime_GET_YEAR(value),
+                                           PyDateTime_GET_MONTH(value),
+                                           PyDateTime_GET_DAY(value));
+        time_since_epoch = time_since_epoch * 24 +
+            PyDateTime_DATE_GET_HOUR(value);
+        time_since_epoch = time_since_epoch * 60 +
+            PyDateTime_DATE_GET_MINUTE(value);
+        time_since_epoch = time_since_epoch * 60 +
+            PyDateTime_DATE_GET_SECOND(value);
+        time_since_epoch = time_since_epoch * 1000 +
+            PyDateTime_DATE_GET_MICROSECOND(value) / 1000;
+
+        /* Convert aware datetimes to UTC. */
+        if (((PyDateTime_DateTime*)value)->hastzinfo) {
+            PyObject* offset = PyObject_CallMethod(value, "utcoffset", NULL);
+            if (!offset) {
+                return 0;
+            }
+            if (PyDelta_Check(offset)) {
+                PyDateTime_Delta* delta = (PyDateTime_Delta*)offset;
+                time_since_epoch -= ((long long)delta->days * 86400 +
+                                     delta->seconds) * 1000 +
+                    delta->microseconds / 1000;
+            }
+            Py_DECREF(offset);
         }
-        timeinfo.tm_year = PyDateTime_GET_YEAR(value) - 1900;
-        timeinfo.tm_mon = PyDateTime_GET_MONTH(value) - 1;
-        timeinfo.tm_mday = PyDateTime_GET_DAY(value);
-        timeinfo.tm_hour = PyDateTime_DATE_GET_HOUR(value);
-        timeinfo.tm_min = PyDateTime_DATE_GET_MINUTE(value);
-        timeinfo.tm_sec = PyDateTime_DATE_GET_SECOND(value);
-        time_since_epoch = GMTIME_INVERSE(&timeinfo);
-        time_since_epoch = time_since_epoch * 1000;
-        time_since_epoch += PyDateTime_DATE_GET_MICROSECOND(value) / 1000;
 
         *(buffer->buffer + type_byte) = 0x09;
         return buffer_write_bytes(buffer, (const char*)&time_since_epoch, 8);
@@ -990,7 +1061,88 @@ static PyObject* _cbson_update_message(PyObject* self, PyObject* args) {
     return result;
 }
 
-static PyObject* get_value(const char* buffer, int* position, int type) {
+static void key_cache_init(key_cache* cache) {
+    memset(cache, 0, sizeof(key_cache));
+}
+
+static void key_cache_clear(key_cache* cache) {
+    int i;
+    for (i = 0; i < KEY_CACHE_SIZE; i++) {
+        Py_XDECREF(cache->entries[i].key);
+        cache->entries[i].key = NULL;
+    }
+}
+
+/* Return a new reference to the decoded key `name`, reusing a previously
+ * decoded key from `cache` if possible. `cache` may be NULL. */
+static PyObject* get_key(const char* name, int length, key_cache* cache) {
+    unsigned long hash = 2166136261UL;
+    key_cache_entry* entry;
+    PyObject* key;
+    int i;
+
+    if (!cache || length > KEY_CACHE_MAX_LENGTH) {
+        return PyUnicode_DecodeUTF8(name, length, "strict");
+    }
+
+    /* FNV-1a */
+    for (i = 0; i < length; i++) {
+        hash = (hash ^ (unsigned char)name[i]) * 16777619UL;
+    }
+    entry = &cache->entries[hash & (KEY_CACHE_SIZE - 1)];
+    if (entry->key && entry->hash == hash && entry->length == length &&
+        memcmp(entry->name, name, length) == 0) {
+        Py_INCREF(entry->key);
+        return entry->key;
+    }
+
+    key = PyUnicode_DecodeUTF8(name, length, "strict");
+    if (!key) {
+        return NULL;
+    }
+    Py_XDECREF(entry->key);
+    Py_INCREF(key);
+    entry->key = key;
+    entry->name = name;
+    entry->length = length;
+    entry->hash = hash;
+    return key;
+}
+
+/* Create an ObjectId from 12 bytes of binary data.
+ *
+ * If we can, we skip ObjectId.__init__ (and its validation) entirely by
+ * allocating the instance ourselves and setting its __id slot through the
+ * slot's descriptor. */
+static PyObject* new_object_id(const char* binary) {
+    PyObject* oid;
+    PyObject* id;
+
+    if (!ObjectIdSlot) {
+        return PyObject_CallFunction(ObjectId, "s#", binary, 12);
+    }
+
+    id = PyString_FromStringAndSize(binary, 12);
+    if (!id) {
+        return NULL;
+    }
+    oid = ((PyTypeObject*)ObjectId)->tp_alloc((PyTypeObject*)ObjectId, 0);
+    if (!oid) {
+        Py_DECREF(id);
+        return NULL;
+    }
+    if (Py_TYPE(ObjectIdSlot)->tp_descr_set(ObjectIdSlot, oid, id) < 0) {
+        Py_DECREF(id);
+        Py_DECREF(oid);
+        return NULL;
+    }
+    Py_DECREF(id);
+    return oid;
+}
+
+static PyObject* get_value(const char* buffer, int* position, int type,
+                           PyObject* as_class, unsigned char raw_dates,
+                           key_cache* cache) {
     PyObject* value;
     switch (type) {
     case 1:
@@ -1021,20 +1173,33 @@ static PyObject* get_value(const char* buffer, int* position, int type) {
         {
             int size;
             memcpy(&size, buffer + *position, 4);
-            value = elements_to_dict(buffer + *position + 4, size - 5);
-            if (!value) {
-                return NULL;
-            }
 
             /* Decoding for DBRefs */
             if (strcmp(buffer + *position + 5, "$ref") == 0) { /* DBRef */
-                PyObject* id = PyDict_GetItemString(value, "$id");
-                PyObject* collection = PyDict_GetItemString(value, "$ref");
-                PyObject* database = PyDict_GetItemString(value, "$db");
+                PyObject* dict = elements_to_dict(buffer + *position + 4,
+                                                  size - 5,
+                                                  (PyObject*)&PyDict_Type,
+                                                  raw_dates, cache);
+                PyObject* id;
+                PyObject* collection;
+                PyObject* database;
+                if (!dict) {
+                    return NULL;
+                }
+                id = PyDict_GetItemString(dict, "$id");
+                collection = PyDict_GetItemString(dict, "$ref");
+                database = PyDict_GetItemString(dict, "$db");
 
                 /* This works even if there is no $db since database will be NULL and
                    the call will be as if there were only two arguments specified. */
                 value = PyObject_CallFunctionObjArgs(DBRef, collection, id, database, NULL);
+                Py_DECREF(dict);
+            } else {
+                value = elements_to_dict(buffer + *position + 4, size - 5,
+                                         as_class, raw_dates, cache);
+            }
+            if (!value) {
+                return NULL;
             }
 
             *position += size;
@@ -1059,7 +1224,8 @@ static PyObject* get_value(const char* buffer, int* position, int type) {
                 int type = (int)buffer[(*position)++];
                 int key_size = strlen(buffer + *position);
                 *position += key_size + 1; /* just skip the key, they're in order. */
-                to_append = get_value(buffer, position, type);
+                to_append = get_value(buffer, position, type, as_class,
+                                      raw_dates, cache);
                 if (!to_append) {
                     return NULL;
                 }
@@ -1139,7 +1305,7 @@ static PyObject* get_value(const char* buffer, int* position, int type) {
         }
     case 7:
         {
-            value = PyObject_CallFunction(ObjectId, "s#", buffer + *position, 12);
+            value = new_object_id(buffer + *position);
             if (!value) {
                 return NULL;
             }
@@ -1154,25 +1320,43 @@ static PyObject* get_value(const char* buffer, int* position, int type) {
         }
     case 9:
         {
-            long long millis;
-            int microseconds;
-            time_t seconds;
-            struct tm timeinfo;
+            long long millis,
+                days;
+            int year,
+                month,
+                day,
+                millis_of_day;
 
             memcpy(&millis, buffer + *position, 8);
-            microseconds = (millis % 1000) * 1000;
-            seconds = millis / 1000;
-            if (GMTIME(&timeinfo, &seconds)) {
+            if (raw_dates) {
+                value = PyLong_FromLongLong(millis);
+                if (!value) {
+                    return NULL;
+                }
+                *position += 8;
+                break;
+            }
+
+            /* floor division, so dates before the epoch work too */
+            days = millis / 86400000;
+            if (millis % 86400000 < 0) {
+                days--;
+            }
+            millis_of_day = (int)(millis - days * 86400000);
+            civil_from_days(days, &year, &month, &day);
+            if (year < 1 || year > 9999) {
+                PyErr_SetString(PyExc_OverflowError, "date value out of range");
                 return NULL;
             }
 
-            value = PyDateTime_FromDateAndTime(timeinfo.tm_year + 1900,
-                                               timeinfo.tm_mon + 1,
-                                               timeinfo.tm_mday,
-                                               timeinfo.tm_hour,
-                                               timeinfo.tm_min,
-                                               timeinfo.tm_sec,
-                                               microseconds);
+            value = PyDateTime_FromDateAndTime(year, month, day,
+                                               millis_of_day / 3600000,
+                                               (millis_of_day / 60000) % 60,
+                                               (millis_of_day / 1000) % 60,
+                                               (millis_of_day % 1000) * 1000);
+            if (!value) {
+                return NULL;
+            }
             *position += 8;
             break;
         }
@@ -1223,7 +1407,7 @@ static PyObject* get_value(const char* buffer, int* position, int type) {
                 return NULL;
             }
             *position += collection_length + 1;
-            id = PyObject_CallFunction(ObjectId, "s#", buffer + *position, 12);
+            id = new_object_id(buffer + *position);
             if (!id) {
                 Py_DECREF(collection);
                 return NULL;
@@ -1250,7 +1434,9 @@ static PyObject* get_value(const char* buffer, int* position, int type) {
             *position += code_length + 1;
 
             memcpy(&scope_size, buffer + *position, 4);
-            scope = elements_to_dict(buffer + *position + 4, scope_size - 5);
+            scope = elements_to_dict(buffer + *position + 4, scope_size - 5,
+                                     (PyObject*)&PyDict_Type, raw_dates,
+                                     cache);
             if (!scope) {
                 Py_DECREF(code);
                 return NULL;
@@ -1275,11 +1461,13 @@ static PyObject* get_value(const char* buffer, int* position, int type) {
         }
     case 17:
         {
-            int i,
-                j;
-            memcpy(&i, buffer + *position, 4);
-            memcpy(&j, buffer + *position + 4, 4);
-            value = Py_BuildValue("(ii)", i, j);
+            unsigned int inc,
+                seconds;
+            memcpy(&inc, buffer + *position, 4);
+            memcpy(&seconds, buffer + *position + 4, 4);
+            value = PyObject_CallFunction(Timestamp, "kk",
+                                          (unsigned long)seconds,
+                                          (unsigned long)inc);
             if (!value) {
                 return NULL;
             }
@@ -1304,41 +1492,324 @@ static PyObject* get_value(const char* buffer, int* position, int type) {
     return value;
 }
 
-static PyObject* elements_to_dict(const char* string, int max) {
+/* Decode the elements of a document into an instance of `as_class`.
+ *
+ * For plain dicts we fill the dict directly. Anything else gets called
+ * with a list of (key, value) tuples, so the document is only ever built
+ * once, in its final type. If `raw_dates` is set dates are left as
+ * milliseconds since the epoch. Keys are looked up in `cache`, which may
+ * be NULL. */
+static PyObject* elements_to_dict(const char* string, int max,
+                                  PyObject* as_class, unsigned char raw_dates,
+                                  key_cache* cache) {
     int position = 0;
-    PyObject* dict = PyDict_New();
+    int is_dict = (as_class == (PyObject*)&PyDict_Type);
+    PyObject* result;
+    PyObject* dict = is_dict ? PyDict_New() : PyList_New(0);
     if (!dict) {
         return NULL;
     }
     while (position < max) {
         int type = (int)string[position++];
         int name_length = strlen(string + position);
-        PyObject* name = PyUnicode_DecodeUTF8(string + position, name_length, "strict");
+        PyObject* name = get_key(string + position, name_length, cache);
         PyObject* value;
         if (!name) {
+            Py_DECREF(dict);
             return NULL;
         }
         position += name_length + 1;
-        value = get_value(string, &position, type);
+        value = get_value(string, &position, type, as_class, raw_dates,
+                          cache);
         if (!value) {
+            Py_DECREF(name);
+            Py_DECREF(dict);
             return NULL;
         }
 
-        PyDict_SetItem(dict, name, value);
+        if (is_dict) {
+            PyDict_SetItem(dict, name, value);
+        } else {
+            PyObject* item = PyTuple_Pack(2, name, value);
+            if (!item || PyList_Append(dict, item) < 0) {
+                Py_XDECREF(item);
+                Py_DECREF(name);
+                Py_DECREF(value);
+                Py_DECREF(dict);
+                return NULL;
+            }
+            Py_DECREF(item);
+        }
         Py_DECREF(name);
         Py_DECREF(value);
     }
-    return dict;
+    if (is_dict) {
+        return dict;
+    }
+    result = PyObject_CallFunctionObjArgs(as_class, dict, NULL);
+    Py_DECREF(dict);
+    return result;
+}
+
+/* Validate the document at the start of `buffer`, which holds `max` bytes.
+ *
+ * Returns the size of the document, or -1 if it isn't valid BSON. Nothing
+ * here touches Python objects, so this is safe to call without holding the
+ * GIL. */
+static int validate_document(const char* buffer, int max, int is_array) {
+    int size,
+        position = 4,
+        end;
+
+    if (max < 5) {
+        return -1;
+    }
+    memcpy(&size, buffer, 4);
+    if (size < 5 || size > max || buffer[size - 1] != 0x00) {
+        return -1;
+    }
+    end = size - 1;
+
+    while (position < end) {
+        int type = (unsigned char)buffer[position++];
+        const char* name = buffer + position;
+        const char* name_end = memchr(name, 0, end - position);
+        int length;
+
+        if (!name_end) {
+            return -1;
+        }
+        if (is_array) {
+            const char* c;
+            if (name == name_end) {
+                return -1;
+            }
+            for (c = name; c < name_end; c++) {
+                if (*c < '0' || *c > '9') {
+                    return -1;
+                }
+            }
+        }
+        position += (int)(name_end - name) + 1;
+
+        switch (type) {
+        case 1:
+        case 9:
+        case 17:
+        case 18:
+            position += 8;
+            break;
+        case 2:
+        case 13:
+        case 14:
+        case 12:
+            if (end - position < 4) {
+                return -1;
+            }
+            memcpy(&length, buffer + position, 4);
+            position += 4;
+            if (length < 1 || length > end - position ||
+                buffer[position + length - 1] != 0x00) {
+                return -1;
+            }
+            position += length;
+            if (type == 12) {
+                position += 12;
+            }
+            break;
+        case 3:
+        case 4:
+            length = validate_document(buffer + position, end - position,
+                                       type == 4);
+            if (length < 0) {
+                return -1;
+            }
+            position += length;
+            break;
+        case 5:
+            if (end - position < 4) {
+                return -1;
+            }
+            memcpy(&length, buffer + position, 4);
+            if (length < 0 || length > end - position) {
+                return -1;
+            }
+            /* + 1 for the subtype byte */
+            position += 4 + 1 + length;
+            break;
+        case 6:
+        case 10:
+            break;
+        case 7:
+            position += 12;
+            break;
+        case 8:
+            position += 1;
+            break;
+        case 11:
+            {
+                int i;
+                /* pattern and options */
+                for (i = 0; i < 2; i++) {
+                    const char* string_end = memchr(buffer + position, 0,
+                                                    end - position);
+                    if (!string_end) {
+                        return -1;
+                    }
+                    position = (int)(string_end - buffer) + 1;
+                }
+                break;
+            }
+        case 15:
+            if (end - position < 4) {
+                return -1;
+            }
+            memcpy(&length, buffer + position, 4);
+            if (length < 4 || length > end - position) {
+                return -1;
+            }
+            position += length;
+            break;
+        case 16:
+            position += 4;
+            break;
+        default:
+            return -1;
+        }
+        if (position > end) {
+            return -1;
+        }
+    }
+    return size;
+}
+
+/* Find the documents in `buffer`, which holds `max` bytes of concatenated
+ * BSON documents, optionally validating each one.
+ *
+ * On success returns the number of documents and sets `*offsets` to a
+ * malloc'd array holding the start of each document followed by the end
+ * of the last one. The caller must free it. Returns -1 for invalid data
+ * and -2 if we're out of memory. Like `validate_document` this is safe to
+ * call without the GIL. */
+static int split_documents(const char* buffer, int max, int validate,
+                           int** offsets) {
+    int count = 0,
+        capacity = 16,
+        position = 0;
+    int* result = (int*)malloc(capacity * sizeof(int));
+    if (!result) {
+        return -2;
+    }
+
+    while (position < max) {
+        int size;
+        if (validate) {
+            size = validate_document(buffer + position, max - position, 0);
+        } else if (max - position < 5) {
+            size = -1;
+        } else {
+            memcpy(&size, buffer + position, 4);
+            if (size < 5 || size > max - position ||
+                buffer[position + size - 1] != 0x00) {
+                size = -1;
+            }
+        }
+        if (size < 0) {
+            free(result);
+            return -1;
+        }
+        if (count + 1 >= capacity) {
+            int* bigger;
+            capacity *= 2;
+            bigger = (int*)realloc(result, capacity * sizeof(int));
+            if (!bigger) {
+                free(result);
+                return -2;
+            }
+            result = bigger;
+        }
+        result[count++] = position;
+        position += size;
+    }
+    result[count] = position;
+    *offsets = result;
+    return count;
+}
+
+static PyObject* _cbson_is_valid(PyObject* self, PyObject* args) {
+    const char* string;
+    int length,
+        size;
+
+    if (!PyArg_ParseTuple(args, "s#", &string, &length)) {
+        return NULL;
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    size = validate_document(string, length, 0);
+    Py_END_ALLOW_THREADS
+
+    return PyBool_FromLong(size >= 0 && size == length);
+}
+
+static PyObject* _cbson_split_documents(PyObject* self, PyObject* args) {
+    const char* string;
+    int length,
+        count,
+        i;
+    int* offsets = NULL;
+    unsigned char validate = 0;
+    PyObject* result;
+
+    if (!PyArg_ParseTuple(args, "s#|b", &string, &length, &validate)) {
+        return NULL;
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    count = split_documents(string, length, validate, &offsets);
+    Py_END_ALLOW_THREADS
+
+    if (count == -2) {
+        return PyErr_NoMemory();
+    }
+    if (count < 0) {
+        PyErr_SetString(InvalidBSON, "invalid BSON data");
+        return NULL;
+    }
+
+    result = PyList_New(count);
+    if (!result) {
+        free(offsets);
+        return NULL;
+    }
+    for (i = 0; i < count; i++) {
+        PyObject* bounds = Py_BuildValue("(ii)", offsets[i], offsets[i + 1]);
+        if (!bounds) {
+            free(offsets);
+            Py_DECREF(result);
+            return NULL;
+        }
+        PyList_SET_ITEM(result, i, bounds);
+    }
+    free(offsets);
+    return result;
 }
 
-static PyObject* _cbson_bson_to_dict(PyObject* self, PyObject* bson) {
+static PyObject* _cbson_bson_to_dict(PyObject* self, PyObject* args) {
     int size;
     Py_ssize_t total_size;
     const char* string;
+    PyObject* bson;
+    PyObject* as_class = (PyObject*)&PyDict_Type;
+    unsigned char raw_dates = 0;
     PyObject* dict;
     PyObject* remainder;
     PyObject* result;
+    key_cache cache;
 
+    if (!PyArg_ParseTuple(args, "O|Ob", &bson, &as_class, &raw_dates)) {
+        return NULL;
+    }
     if (!PyString_Check(bson)) {
         PyErr_SetString(PyExc_TypeError, "argument to _bson_to_dict must be a string");
         return NULL;
@@ -1350,7 +1821,10 @@ static PyObject* _cbson_bson_to_dict(PyObject* self, PyObject* bson) {
     }
     memcpy(&size, string, 4);
 
-    dict = elements_to_dict(string + 4, size - 5);
+    key_cache_init(&cache);
+    dict = elements_to_dict(string + 4, size - 5, as_class, raw_dates,
+                            &cache);
+    key_cache_clear(&cache);
     if (!dict) {
         return NULL;
     }
@@ -1365,48 +1839,264 @@ static PyObject* _cbson_bson_to_dict(PyObject* self, PyObject* bson) {
     return result;
 }
 
-static PyObject* _cbson_to_dicts(PyObject* self, PyObject* bson) {
-    int size;
-    Py_ssize_t total_size;
+static PyObject* _cbson_to_dicts(PyObject* self, PyObject* args) {
+    int size,
+        count,
+        i;
     const char* string;
+    int* offsets = NULL;
+    PyObject* bson;
+    PyObject* as_class = (PyObject*)&PyDict_Type;
+    unsigned char raw_dates = 0;
     PyObject* dict;
     PyObject* result;
+    key_cache cache;
 
+    if (!PyArg_ParseTuple(args, "O|Ob", &bson, &as_class, &raw_dates)) {
+        return NULL;
+    }
     if (!PyString_Check(bson)) {
         PyErr_SetString(PyExc_TypeError, "argument to _to_dicts must be a string");
         return NULL;
     }
-    total_size = PyString_Size(bson);
+    size = (int)PyString_Size(bson);
     string = PyString_AsString(bson);
     if (!string) {
         return NULL;
     }
 
-    result = PyList_New(0);
+    /* Only check the document boundaries here, that's one read per
+     * document. Fully validating the reply would walk all of it a second
+     * time - use _split_documents(data, True) or is_valid for that. The
+     * scan doesn't need the GIL (our args tuple keeps `bson` alive), so
+     * other threads can run while we do it. */
+    Py_BEGIN_ALLOW_THREADS
+    count = split_documents(string, size, 0, &offsets);
+    Py_END_ALLOW_THREADS
 
-    while (total_size > 0) {
-        memcpy(&size, string, 4);
+    if (count == -2) {
+        return PyErr_NoMemory();
+    }
+    if (count < 0) {
+        PyErr_SetString(InvalidBSON, "invalid BSON data");
+        return NULL;
+    }
+
+    result = PyList_New(count);
+    if (!result) {
+        free(offsets);
+        return NULL;
+    }
 
-        dict = elements_to_dict(string + 4, size - 5);
+    /* One key cache for the whole batch: the documents in a reply almost
+     * always share their keys. */
+    key_cache_init(&cache);
+    for (i = 0; i < count; i++) {
+        const char* document = string + offsets[i];
+        size = offsets[i + 1] - offsets[i];
+
+        dict = elements_to_dict(document + 4, size - 5, as_class, raw_dates,
+                                &cache);
         if (!dict) {
+            key_cache_clear(&cache);
+            free(offsets);
+            Py_DECREF(result);
             return NULL;
         }
-        PyList_Append(result, dict);
-        Py_DECREF(dict);
-        string += size;
-        total_size -= size;
+        PyList_SET_ITEM(result, i, dict);
     }
+    key_cache_clear(&cache);
+    free(offsets);
 
     return result;
 }
 
+/* The counter used for the last three bytes of generated ObjectIds. We
+ * only touch it while holding the GIL, so it needs no lock of its own. */
+static long object_id_inc = 0;
+
+/* Fill `oid` with a 12 byte ObjectId: 4 bytes time, 3 bytes machine,
+ * 2 bytes pid and 3 bytes counter, all big-endian. */
+static void write_object_id(unsigned char* oid, unsigned long seconds,
+                            const char* machine, unsigned int pid,
+                            unsigned long inc) {
+    oid[0] = (unsigned char)(seconds >> 24);
+    oid[1] = (unsigned char)(seconds >> 16);
+    oid[2] = (unsigned char)(seconds >> 8);
+    oid[3] = (unsigned char)seconds;
+    memcpy(oid + 4, machine, 3);
+    oid[7] = (unsigned char)(pid >> 8);
+    oid[8] = (unsigned char)pid;
+    oid[9] = (unsigned char)(inc >> 16);
+    oid[10] = (unsigned char)(inc >> 8);
+    oid[11] = (unsigned char)inc;
+}
+
+static PyObject* _cbson_generate_id(PyObject* self, PyObject* args) {
+    const char* machine;
+    int machine_length;
+    unsigned char oid[12];
+
+    if (!PyArg_ParseTuple(args, "s#", &machine, &machine_length)) {
+        return NULL;
+    }
+    if (machine_length != 3) {
+        PyErr_SetString(PyExc_ValueError, "machine bytes must be of length 3");
+        return NULL;
+    }
+
+    write_object_id(oid, (unsigned long)time(NULL), machine,
+                    GETPID() % 0xFFFF, object_id_inc);
+    object_id_inc = (object_id_inc + 1) % 0xFFFFFF;
+
+    return PyString_FromStringAndSize((const char*)oid, 12);
+}
+
+static PyObject* _cbson_generate_ids(PyObject* self, PyObject* args) {
+    const char* machine;
+    int machine_length;
+    Py_ssize_t n,
+        i;
+    unsigned long seconds,
+        inc;
+    unsigned int pid;
+    unsigned char oid[12];
+    PyObject* result;
+
+    if (!PyArg_ParseTuple(args, "s#n", &machine, &machine_length, &n)) {
+        return NULL;
+    }
+    if (machine_length != 3) {
+        PyErr_SetString(PyExc_ValueError, "machine bytes must be of length 3");
+        return NULL;
+    }
+    if (n < 0) {
+        PyErr_SetString(PyExc_ValueError, "n must be non-negative");
+        return NULL;
+    }
+
+    /* Reserve the whole counter range up front. */
+    inc = object_id_inc;
+    object_id_inc = (long)((inc + (unsigned long)(n % 0xFFFFFF)) % 0xFFFFFF);
+
+    seconds = (unsigned long)time(NULL);
+    pid = GETPID() % 0xFFFF;
+
+    result = PyList_New(n);
+    if (!result) {
+        return NULL;
+    }
+    for (i = 0; i < n; i++) {
+        PyObject* binary;
+        write_object_id(oid, seconds, machine, pid, inc);
+        inc = (inc + 1) % 0xFFFFFF;
+        binary = PyString_FromStringAndSize((const char*)oid, 12);
+        if (!binary) {
+            Py_DECREF(result);
+            return NULL;
+        }
+        PyList_SET_ITEM(result, i, binary);
+    }
+    return result;
+}
+
+/* Turn a json_result_t from the transcoders into a Python exception. */
+static PyObject* _json_error(json_result_t status, const char* message,
+                             int position) {
+    PyObject* exception;
+    switch (status) {
+    case JSON_NO_MEMORY:
+        return PyErr_NoMemory();
+    case JSON_INVALID_BSON:
+        exception = InvalidBSON;
+        break;
+    case JSON_INVALID_KEY:
+        exception = InvalidDocument;
+        break;
+    case JSON_OVERFLOW:
+        exception = PyExc_OverflowError;
+        break;
+    default:
+        exception = PyExc_ValueError;
+    }
+    PyErr_Format(exception, "%s (at byte %d)", message, position);
+    return NULL;
+}
+
+static PyObject* _cbson_dumps_bson(PyObject* self, PyObject* args) {
+    const char* string;
+    int length;
+    char* out = NULL;
+    int out_length = 0;
+    const char* message = NULL;
+    int position = 0;
+    json_result_t status;
+    PyObject* result;
+
+    if (!PyArg_ParseTuple(args, "s#", &string, &length)) {
+        return NULL;
+    }
+
+    /* The transcoder doesn't touch any Python objects. */
+    Py_BEGIN_ALLOW_THREADS
+    status = bson_to_json(string, length, &out, &out_length,
+                          &message, &position);
+    Py_END_ALLOW_THREADS
+
+    if (status != JSON_OK) {
+        return _json_error(status, message, position);
+    }
+    result = PyString_FromStringAndSize(out, out_length);
+    free(out);
+    return result;
+}
+
+static PyObject* _cbson_loads_to_bson(PyObject* self, PyObject* args) {
+    const char* string;
+    int length;
+    char* out = NULL;
+    int out_length = 0;
+    const char* message = NULL;
+    int position = 0;
+    json_result_t status;
+    PyObject* result;
+
+    if (!PyArg_ParseTuple(args, "s#", &string, &length)) {
+        return NULL;
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    status = json_to_bson(string, length, &out, &out_length,
+                          &message, &position);
+    Py_END_ALLOW_THREADS
+
+    if (status != JSON_OK) {
+        return _json_error(status, message, position);
+    }
+    result = PyString_FromStringAndSize(out, out_length);
+    free(out);
+    return result;
+}
+
 static PyMethodDef _CBSONMethods[] = {
     {"_dict_to_bson", _cbson_dict_to_bson, METH_VARARGS,
      "convert a dictionary to a string containing it's BSON representation."},
-    {"_bson_to_dict", _cbson_bson_to_dict, METH_O,
+    {"_bson_to_dict", _cbson_bson_to_dict, METH_VARARGS,
      "convert a BSON string to a SON object."},
-    {"_to_dicts", _cbson_to_dicts, METH_O,
+    {"_to_dicts", _cbson_to_dicts, METH_VARARGS,
      "convert binary data to a sequence of SON objects."},
+    {"_is_valid", _cbson_is_valid, METH_VARARGS,
+     "check if a string is a single valid BSON document."},
+    {"_split_documents", _cbson_split_documents, METH_VARARGS,
+     "find the (start, end) offsets of concatenated BSON documents."},
+    {"_dumps_bson", _cbson_dumps_bson, METH_VARARGS,
+     "convert a BSON document straight to a JSON string."},
+    {"_loads_to_bson", _cbson_loads_to_bson, METH_VARARGS,
+     "convert a JSON string straight to a BSON document."},
+    {"_generate_id", _cbson_generate_id, METH_VARARGS,
+     "generate the binary value for a new ObjectId."},
+    {"_generate_ids", _cbson_generate_ids, METH_VARARGS,
+     "generate the binary values for a number of new ObjectIds."},
     {"_insert_message", _cbson_insert_message, METH_VARARGS,
      "create an insert message to be sent to MongoDB"},
     {"_update_message", _cbson_update_message, METH_VARARGS,
@@ -1429,6 +2119,7 @@ PyMODINIT_FUNC init_cbson(void) {
         return;
     }
     InvalidName = PyObject_GetAttrString(module, "InvalidName");
+    InvalidBSON = PyObject_GetAttrString(module, "InvalidBSON");
     InvalidDocument = PyObject_GetAttrString(module, "InvalidDocument");
     InvalidStringData = PyObject_GetAttrString(module, "InvalidStringData");
     Py_DECREF(module);
@@ -1461,6 +2152,19 @@ PyMODINIT_FUNC init_cbson(void) {
     ObjectId = PyObject_GetAttrString(module, "ObjectId");
     Py_DECREF(module);
 
+    /* The descriptor for ObjectId's __id slot, used to build ObjectIds
+     * without calling __init__. Fall back to calling the class if it
+     * doesn't look like we expect. */
+    ObjectIdSlot = NULL;
+    if (ObjectId && PyType_Check(ObjectId)) {
+        ObjectIdSlot = PyObject_GetAttrString(ObjectId, "_ObjectId__id");
+        if (!ObjectIdSlot || !Py_TYPE(ObjectIdSlot)->tp_descr_set) {
+            PyErr_Clear();
+            Py_XDECREF(ObjectIdSlot);
+            ObjectIdSlot = NULL;
+        }
+    }
+
     module = PyImport_ImportModule("pymongo.dbref");
     if (!module) {
         return;
@@ -1468,6 +2172,13 @@ PyMODINIT_FUNC init_cbson(void) {
     DBRef = PyObject_GetAttrString(module, "DBRef");
     Py_DECREF(module);
 
+    module = PyImport_ImportModule("pymongo.timestamp");
+    if (!module) {
+        return;
+    }
+    Timestamp = PyObject_GetAttrString(module, "Timestamp");
+    Py_DECREF(module);
+
     module = PyImport_ImportModule("re");
     if (!module) {
         return;
@@ -16,15 +16,18 @@
 
 Generally not needed to be used by application developers."""
 
+import functools
 import struct
+import sys
 import re
+import mmap
 import datetime
-import calendar
 
 from .binary import Binary
 from .code import Code
 from .objectid import ObjectId
 from .dbref import DBRef
+from .timestamp import Timestamp
 from .son import SON
 from .errors import InvalidBSON, InvalidDocument
 from .errors import InvalidName, InvalidStringData
@@ -42,7 +45,7 @@ except ImportError:
     _use_uuid = False
 
 
-def _get_int(data):
+def _get_int(data, as_class=None, raw_dates=False):
     try:
         value = struct.unpack("<i", data[:4])[0]
     except struct.error:
@@ -84,7 +87,7 @@ def _validate_number(data):
 def _validate_string(data):
     (length, data) = _get_int(data)
     assert len(data) >= length
-    assert data[length - 1] == b"\x00"
+    assert data[length - 1] == 0x00
     return data[length:]
 
 
@@ -92,7 +95,7 @@ def _validate_object(data):
     return _validate_document(data, None)
 
 
-_valid_array_name = re.compile("^\d+$")
+_valid_array_name = re.compile(rb"^\d+$")
 
 
 def _validate_array(data):
@@ -150,8 +153,9 @@ _validate_code = _validate_string
 
 def _validate_code_w_scope(data):
     (length, data) = _get_int(data)
-    assert len(data) >= length + 1
-    return data[length + 1:]
+    # length includes the four bytes we just read
+    assert length >= 4 and len(data) >= length - 4
+    return data[length - 4:]
 
 
 _validate_symbol = _validate_string
@@ -230,35 +234,37 @@ def _validate_document(data, valid_name=None):
     return data[obj_size:]
 
 
-def _get_number(data):
+def _get_number(data, as_class, raw_dates):
     return (struct.unpack("<d", data[:8])[0], data[8:])
 
 
-def _get_string(data):
+def _get_string(data, as_class=None, raw_dates=False):
     return _get_c_string(data[4:], struct.unpack("<i", data[:4])[0] - 1)
 
 
-def _get_object(data):
-    (object, data) = _bson_to_dict(data)
-    if "$ref" in object:
-        return (DBRef(object["$ref"], object["$id"], object.get("$db", None)), data)
-    return (object, data)
+def _get_object(data, as_class, raw_dates):
+    # DBRefs always have "$ref" as their first key, so we can spot them
+    # before building the document (same check as the C decoder).
+    if data[5:10] == b"$ref\x00":
+        (object, data) = _bson_to_dict(data, dict, raw_dates)
+        return (DBRef(object["$ref"], object["$id"],
+                      object.get("$db", None)), data)
+    return _bson_to_dict(data, as_class, raw_dates)
 
 
-def _get_array(data):
-    (obj, data) = _get_object(data)
+def _get_array(data, as_class, raw_dates):
+    obj_size = struct.unpack("<i", data[:4])[0]
+    elements = data[4:obj_size - 1]
     result = []
-    i = 0
-    while True:
-        try:
-            result.append(obj[str(i)])
-            i += 1
-        except KeyError:
-            break
-    return (result, data)
+    while elements:
+        # array keys are just indexes, and they're in order
+        (_, value, elements) = _element_to_dict(elements, as_class,
+                                                raw_dates)
+        result.append(value)
+    return (result, data[obj_size:])
 
 
-def _get_binary(data):
+def _get_binary(data, as_class, raw_dates):
     (length, data) = _get_int(data)
     subtype = data[0]
     data = data[1:]
@@ -272,31 +278,37 @@ def _get_binary(data):
     return (Binary(data[:length], subtype), data[length:])
 
 
-def _get_oid(data):
-    return (ObjectId(data[:12]), data[12:])
+def _get_oid(data, as_class=None, raw_dates=False):
+    return (ObjectId._from_binary(data[:12]), data[12:])
 
 
-def _get_boolean(data):
+def _get_boolean(data, as_class, raw_dates):
     return (data[0] == 0x01, data[1:])
 
 
-def _get_date(data):
-    seconds = float(struct.unpack("<q", data[:8])[0]) / 1000.0
-    return (datetime.datetime.utcfromtimestamp(seconds), data[8:])
+_EPOCH = datetime.datetime(1970, 1, 1)
 
 
-def _get_code_w_scope(data):
+def _get_date(data, as_class, raw_dates):
+    millis = struct.unpack("<q", data[:8])[0]
+    if raw_dates:
+        return (millis, data[8:])
+    # integer math, so no precision is lost going through a float
+    return (_EPOCH + datetime.timedelta(milliseconds=millis), data[8:])
+
+
+def _get_code_w_scope(data, as_class, raw_dates):
     (_, data) = _get_int(data)
     (code, data) = _get_string(data)
-    (scope, data) = _get_object(data)
+    (scope, data) = _get_object(data, dict, raw_dates)
     return (Code(code, scope), data)
 
 
-def _get_null(data):
+def _get_null(data, as_class, raw_dates):
     return (None, data)
 
 
-def _get_regex(data):
+def _get_regex(data, as_class, raw_dates):
     (pattern, data) = _get_c_string(data)
     (bson_flags, data) = _get_c_string(data)
 
@@ -317,18 +329,17 @@ def _get_regex(data):
     return (re.compile(pattern, flags), data)
 
 
-def _get_ref(data):
+def _get_ref(data, as_class, raw_dates):
     (collection, data) = _get_c_string(data[4:])
     (oid, data) = _get_oid(data)
     return (DBRef(collection, oid), data)
 
 
-def _get_timestamp(data):
-    (timestamp, data) = _get_int(data)
-    (inc, data) = _get_int(data)
-    return ((timestamp, inc), data)
+def _get_timestamp(data, as_class, raw_dates):
+    (inc, timestamp) = struct.unpack("<II", data[:8])
+    return (Timestamp(timestamp, inc), data[8:])
 
-def _get_long(data):
+def _get_long(data, as_class, raw_dates):
     return (struct.unpack("<q", data[:8])[0], data[8:])
 
 _element_getter = {
@@ -353,27 +364,50 @@ _element_getter = {
 }
 
 
-def _element_to_dict(data):
+# Maximum number of decoded keys to remember.
+_KEY_CACHE_SIZE = 1024
+
+
+def _get_key(name):
+    """The interned string for the raw key bytes `name`.
+
+    Result sets repeat the same handful of keys in every document, so the
+    most recently used keys are cached to save decoding (and storing) the
+    same key over and over.
+    """
+    return sys.intern(name.decode())
+_get_key = functools.lru_cache(maxsize=_KEY_CACHE_SIZE)(_get_key)
+
+
+def _element_to_dict(data, as_class, raw_dates):
     element_type = data[0]
     (element_name, data) = _get_c_string(data[1:])
-    (value, data) = _element_getter[element_type](data)
+    (value, data) = _element_getter[element_type](data, as_class, raw_dates)
     if isinstance(value, bytes) and not isinstance(value, Binary):
         value = value.decode()
-    return (element_name.decode(), value, data)
+    return (_get_key(element_name), value, data)
 
 
-def _elements_to_dict(data):
-    result = {}
+def _elements_to_dict(data, as_class, raw_dates):
+    if as_class is dict:
+        result = {}
+        while data:
+            (key, value, data) = _element_to_dict(data, as_class, raw_dates)
+            result[key] = value
+        return result
+
+    items = []
     while data:
-        (key, value, data) = _element_to_dict(data)
-        result[key] = value
-    return result
+        (key, value, data) = _element_to_dict(data, as_class, raw_dates)
+        items.append((key, value))
+    return as_class(items)
 
 
-def _bson_to_dict(data):
+def _bson_to_dict(data, as_class=dict, raw_dates=False):
     obj_size = struct.unpack("<i", data[:4])[0]
     elements = data[4:obj_size - 1]
-    return (_elements_to_dict(elements), data[obj_size:])
+    return (_elements_to_dict(elements, as_class, raw_dates),
+            data[obj_size:])
 if _use_c:
     _bson_to_dict = _cbson._bson_to_dict
 
@@ -427,6 +461,8 @@ def _element_to_bson(key, value, check_keys):
         return b"\x02" + name + length + cstring
     if isinstance(value, dict):
         return b"\x03" + name + _dict_to_bson(value, check_keys)
+    if isinstance(value, Timestamp):
+        return b"\x11" + name + struct.pack("<II", value.inc, value.time)
     if isinstance(value, (list, tuple)):
         as_dict = SON(list(zip([str(i) for i in range(len(value))], value)))
         return b"\x04" + name + _dict_to_bson(as_dict, check_keys)
@@ -446,8 +482,12 @@ def _element_to_bson(key, value, check_keys):
             return b"\x12" + name + struct.pack("<q", value)
         return b"\x10" + name + struct.pack("<i", value)
     if isinstance(value, datetime.datetime):
-        millis = int(calendar.timegm(value.timetuple()) * 1000 +
-                     value.microsecond / 1000)
+        offset = value.utcoffset()
+        if offset is not None:
+            value = value.replace(tzinfo=None) - offset
+        delta = value - _EPOCH
+        millis = ((delta.days * 86400 + delta.seconds) * 1000 +
+                  delta.microseconds // 1000)
         return b"\x09" + name + struct.pack("<q", millis)
     if value is None:
         return b"\x0A" + name
@@ -494,29 +534,36 @@ if _use_c:
     _dict_to_bson = _cbson._dict_to_bson
 
 
-def _to_dicts(data):
-    """Convert binary data to sequence of SON objects.
+def _to_dicts(data, as_class=dict, raw_dates=False):
+    """Convert binary data to sequence of documents.
 
     Data must be concatenated strings of valid BSON data.
 
     :Parameters:
       - `data`: bson data
+      - `as_class` (optional): the class to use for the resulting
+        documents - it is called with a single argument, a list of
+        ``(key, value)`` pairs in document order, so any mapping class
+        with a ``dict``-like constructor (e.g. :class:`~pymongo.son.SON`)
+        or a plain factory function can be used
+      - `raw_dates` (optional): decode dates as ``int`` milliseconds since
+        the epoch instead of :class:`datetime.datetime` instances
     """
     if isinstance(data, str):
         data = data.encode()
     dicts = []
     while len(data):
-        (son, data) = _bson_to_dict(data)
+        (son, data) = _bson_to_dict(data, as_class, raw_dates)
         dicts.append(son)
     return dicts
 if _use_c:
     _to_dicts = _cbson._to_dicts
 
 
-def _to_dict(data):
+def _to_dict(data, as_class=dict, raw_dates=False):
     if isinstance(data, str):
         data = data.encode()
-    (son, _) = _bson_to_dict(data)
+    (son, _) = _bson_to_dict(data, as_class, raw_dates)
     return son
 
 
@@ -539,6 +586,9 @@ def is_valid(bson):
     if len(bson) > 4 * 1024 * 1024:
         raise InvalidBSON("BSON documents are limited to 4MB")
 
+    if _use_c:
+        return _cbson._is_valid(bson)
+
     try:
         remainder = _validate_document(bson)
         return remainder == b""
@@ -546,6 +596,44 @@ def is_valid(bson):
         return False
 
 
+def _split_documents(data, validate=False):
+    """Find the documents in a string of concatenated BSON documents.
+
+    Returns a list of ``(start, end)`` offsets, one per document. Raises
+    InvalidBSON if the data can't be split (or, if `validate` is True, if
+    any document isn't valid BSON).
+
+    Without `validate` only each document's length (and terminating null)
+    is checked. The C version does all of its work with the GIL released,
+    so several threads can split and validate replies at the same time.
+
+    :Parameters:
+      - `data`: concatenated BSON documents
+      - `validate` (optional): validate each document too
+    """
+    offsets = []
+    position = 0
+    while position < len(data):
+        try:
+            size = struct.unpack("<i", data[position:position + 4])[0]
+        except struct.error:
+            raise InvalidBSON()
+        if size < 5 or position + size > len(data):
+            raise InvalidBSON()
+        if data[position + size - 1] != 0:
+            raise InvalidBSON()
+        if validate:
+            try:
+                _validate_document(data[position:position + size])
+            except AssertionError:
+                raise InvalidBSON()
+        offsets.append((position, position + size))
+        position += size
+    return offsets
+if _use_c:
+    _split_documents = _cbson._split_documents
+
+
 class BSON(bytes):
     """BSON data.
 
@@ -580,7 +668,194 @@ class BSON(bytes):
         return cls(_dict_to_bson(dict, check_keys))
     from_dict = classmethod(from_dict)
 
-    def to_dict(self):
-        """Get the dictionary representation of this data."""
-        (son, _) = _bson_to_dict(self)
+    def to_dict(self, as_class=dict, raw_dates=False):
+        """Get the dictionary representation of this data.
+
+        :Parameters:
+          - `as_class` (optional): the class to use for the resulting
+            document - see :func:`_to_dicts` for what is accepted
+          - `raw_dates` (optional): decode dates as ``int`` milliseconds
+            since the epoch instead of :class:`datetime.datetime` instances
+
+        .. versionadded:: 1.3+
+           The `as_class` and `raw_dates` parameters.
+
+        .. versionchanged:: 1.3+
+           Timestamps are decoded as :class:`~pymongo.timestamp.Timestamp`
+           instances. They used to be ``(inc, time)`` tuples; a
+           :class:`~pymongo.timestamp.Timestamp` isn't a tuple, so code
+           that unpacks or indexes them raises :class:`TypeError`.
+        """
+        (son, _) = _bson_to_dict(self, as_class, raw_dates)
         return son
+
+
+class BSONFile(object):
+    """A file of concatenated BSON documents, like the ``.bson`` files
+    written by ``mongodump``.
+
+    The file is memory-mapped rather than read, and documents are only
+    decoded as they are asked for, so even very large dumps can be
+    iterated over or randomly accessed by offset without reading the
+    whole file into memory.
+
+    Iterating over a :class:`BSONFile` yields its documents in order.
+    With `index` set, the offset of every document is found up front,
+    which makes ``len(f)`` and ``f[i]`` available too.
+
+    .. versionadded:: 1.3+
+    """
+
+    def __init__(self, filename, as_class=dict, index=False,
+                 raw_dates=False):
+        """Open the BSON file `filename` for reading.
+
+        :Parameters:
+          - `filename`: path to the file
+          - `as_class` (optional): the class to use for the resulting
+            documents - see :func:`_to_dicts` for what is accepted
+          - `index` (optional): build an index of document offsets
+          - `raw_dates` (optional): decode dates as ``int`` milliseconds
+            since the epoch instead of :class:`datetime.datetime` instances
+        """
+        self.__file = open(filename, "rb")
+        self.__as_class = as_class
+        self.__raw_dates = raw_dates
+        self.__data = b""
+        self.__index = None
+        try:
+            try:
+                self.__data = mmap.mmap(self.__file.fileno(), 0,
+                                        access=mmap.ACCESS_READ)
+            except ValueError:
+                # can't map an empty file
+                pass
+            if index:
+                self.__index = list(self.offsets())
+        except BaseException:
+            self.close()
+            raise
+
+    def __document_size(self, offset):
+        try:
+            size = struct.unpack("<i", self.__data[offset:offset + 4])[0]
+        except struct.error:
+            raise InvalidBSON("no document at offset %d" % offset)
+        if size < 5 or offset + size > len(self.__data):
+            raise InvalidBSON("no document at offset %d" % offset)
+        return size
+
+    def offsets(self):
+        """Iterate over the offsets of the documents in this file.
+
+        Only the length prefix of each document is read.
+        """
+        offset = 0
+        end = len(self.__data)
+        while offset < end:
+            yield offset
+            offset += self.__document_size(offset)
+
+    def read(self, offset):
+        """Decode the document starting at byte `offset`.
+
+        Raises InvalidBSON if there's no document at `offset`.
+
+        :Parameters:
+          - `offset`: offset of the document in the file
+        """
+        size = self.__document_size(offset)
+        (document, _) = _bson_to_dict(self.__data[offset:offset + size],
+                                      self.__as_class, self.__raw_dates)
+        return document
+
+    def __iter__(self):
+        for offset in self.offsets():
+            yield self.read(offset)
+
+    def __len__(self):
+        if self.__index is None:
+            raise TypeError("len() of a BSONFile requires index=True")
+        return len(self.__index)
+
+    def __getitem__(self, index):
+        if self.__index is None:
+            raise TypeError("indexing a BSONFile requires index=True")
+        return self.read(self.__index[index])
+
+    def close(self):
+        """Close this file.
+        """
+        if isinstance(self.__data, mmap.mmap):
+            self.__data.close()
+        self.__file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class BSONFileWriter(object):
+    """Write documents to a file of concatenated BSON documents.
+
+    Documents are encoded one at a time and written straight to the file,
+    so the output can be read by :class:`BSONFile` or ``mongorestore``.
+
+    .. versionadded:: 1.3+
+    """
+
+    def __init__(self, file, check_keys=False, append=False):
+        """Open a BSON file for writing.
+
+        :Parameters:
+          - `file`: path to the file, or an object with a ``write`` method
+          - `check_keys` (optional): check if keys start with '$' or
+            contain '.', raising `pymongo.errors.InvalidName` in either case
+          - `append` (optional): append to `file` if it is a path, instead
+            of truncating it
+        """
+        if hasattr(file, "write"):
+            self.__file = file
+            self.__owned = False
+        else:
+            self.__file = open(file, append and "ab" or "wb")
+            self.__owned = True
+        self.__check_keys = check_keys
+
+    def write(self, document):
+        """Encode and write a single document.
+
+        :Parameters:
+          - `document`: mapping type representing a Mongo document
+        """
+        self.__file.write(_dict_to_bson(document, self.__check_keys))
+
+    def write_many(self, documents):
+        """Encode and write each document in an iterable.
+
+        :Parameters:
+          - `documents`: iterable of documents
+        """
+        for document in documents:
+            self.write(document)
+
+    def flush(self):
+        """Flush the underlying file.
+        """
+        self.__file.flush()
+
+    def close(self):
+        """Flush the file, closing it if we opened it.
+        """
+        if self.__owned:
+            self.__file.close()
+        else:
+            self.__file.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
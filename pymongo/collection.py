@@ -14,21 +14,54 @@
 
 """Collection level utilities for Mongo."""
 
+import asyncio
+import time
 import types
 import warnings
 import struct
 
+from . import bson
 from . import helpers
+from . import json_util
 from . import message
 from .objectid import ObjectId
 from .cursor import Cursor
 from .son import SON
-from .errors import InvalidName, OperationFailure
+from .errors import (InvalidName, OperationFailure, AutoReconnect,
+                     CursorNotFound)
 from .code import Code
 
 _ZERO = "\x00\x00\x00\x00"
 
 
+class _AsyncIterator(object):
+    """Asynchronous iterator running a blocking iterator in an executor.
+    """
+
+    def __init__(self, iterator, executor=None):
+        self.__iterator = iterator
+        self.__executor = executor
+
+    def __next(self):
+        try:
+            return next(self.__iterator)
+        except StopIteration:
+            raise StopAsyncIteration
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.__executor, self.__next)
+
+    async def aclose(self):
+        """Close the underlying iterator (and its cursor).
+        """
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.__executor, self.__iterator.close)
+
+
 class Collection(object):
     """A Mongo collection.
     """
@@ -98,11 +131,21 @@ class Collection(object):
 
         :Parameters:
           - `name`: the name of the collection to get
+
+        .. versionchanged:: 1.3+
+           Names starting with an underscore raise :class:`AttributeError`
+           rather than being looked up (use ``collection[name]`` for
+           those).
         """
-        return Collection(self.__database, "%s.%s" % (self.__name, name))
+        if name.startswith("_"):
+            raise AttributeError("Collection has no attribute %r. To access "
+                                 "the %s.%s collection, use "
+                                 "collection[%r]." %
+                                 (name, self.__name, name, name))
+        return self.__getitem__(name)
 
     def __getitem__(self, name):
-        return self.__getattr__(name)
+        return self.__database["%s.%s" % (self.__name, name)]
 
     def __repr__(self):
         return "Collection(%r, %r)" % (self.__database, self.__name)
@@ -148,7 +191,7 @@ class Collection(object):
         return self.__database_w
     database = property(database)
 
-    def save(self, to_save, manipulate=True, safe=False):
+    def save(self, to_save, manipulate=True, safe=False, deadline=None):
         """Save a document in this collection.
 
         If `to_save` already has an '_id' then an update (upsert) operation
@@ -166,19 +209,24 @@ class Collection(object):
           - `to_save`: the SON object to be saved
           - `manipulate` (optional): manipulate the SON object before saving it
           - `safe` (optional): check that the save succeeded?
+          - `deadline` (optional): seconds the operation may take, raising
+            :class:`~pymongo.errors.OperationTimeout` if it takes longer
+
+        .. versionadded:: 1.3+
+           The `deadline` parameter.
         """
         if not isinstance(to_save, dict):
             raise TypeError("cannot save object of type %s" % type(to_save))
 
         if "_id" not in to_save:
-            return self.insert(to_save, manipulate, safe)
+            return self.insert(to_save, manipulate, safe, deadline=deadline)
         else:
             self.update({"_id": to_save["_id"]}, to_save, True,
-                        manipulate, safe)
+                        manipulate, safe, deadline=deadline)
             return to_save.get("_id", None)
 
     def insert(self, doc_or_docs,
-               manipulate=True, safe=False, check_keys=True):
+               manipulate=True, safe=False, check_keys=True, deadline=None):
         """Insert a document(s) into this collection.
 
         If manipulate is set the document(s) are manipulated using any
@@ -195,25 +243,34 @@ class Collection(object):
           - `safe` (optional): check that the insert succeeded?
           - `check_keys` (optional): check if keys start with '$' or
             contain '.', raising `pymongo.errors.InvalidName` in either case
+          - `deadline` (optional): seconds the operation may take, raising
+            :class:`~pymongo.errors.OperationTimeout` if it takes longer
 
+        .. versionadded:: 1.3+
+           The `deadline` parameter.
         .. versionchanged:: 1.1
            Bulk insert works with any iterable
         """
+        deadline = helpers._deadline(deadline)
         docs = doc_or_docs
         if isinstance(docs, dict):
             docs = [docs]
 
         if manipulate:
-            docs = [self.__database._fix_incoming(doc, self) for doc in docs]
+            if not isinstance(docs, list):
+                docs = list(docs)
+            docs = self.__database._fix_incoming_many(docs, self)
 
         self.__database.connection._send_message(
-            message.insert(self.__full_name, docs, check_keys, safe), safe)
+            message.insert(self.__full_name, docs, check_keys, safe), safe,
+            _deadline=deadline)
 
         ids = [doc.get("_id", None) for doc in docs]
         return len(ids) == 1 and ids[0] or ids
 
     def update(self, spec, document,
-               upsert=False, manipulate=False, safe=False, multi=False):
+               upsert=False, manipulate=False, safe=False, multi=False,
+               deadline=None):
         """Update a document(s) in this collection.
 
         Raises :class:`TypeError` if either `spec` or `document` is not an
@@ -251,7 +308,11 @@ class Collection(object):
             ``True``. It is recommended that you specify this argument
             explicitly for all update operations in order to prepare your code
             for that change.
+          - `deadline` (optional): seconds the operation may take, raising
+            :class:`~pymongo.errors.OperationTimeout` if it takes longer
 
+        .. versionadded:: 1.3+
+           The `deadline` parameter.
         .. versionadded:: 1.1.1
            The `multi` parameter.
 
@@ -263,15 +324,16 @@ class Collection(object):
             raise TypeError("document must be an instance of dict")
         if not isinstance(upsert, bool):
             raise TypeError("upsert must be an instance of bool")
+        deadline = helpers._deadline(deadline)
 
         if upsert and manipulate:
             document = self.__database._fix_incoming(document, self)
 
         self.__database.connection._send_message(
             message.update(self.__full_name, upsert, multi,
-                           spec, document, safe), safe)
+                           spec, document, safe), safe, _deadline=deadline)
 
-    def remove(self, spec_or_object_id=None, safe=False):
+    def remove(self, spec_or_object_id=None, safe=False, deadline=None):
         """Remove a document(s) from this collection.
 
         .. warning:: Calls to :meth:`remove` should be performed with
@@ -297,7 +359,11 @@ class Collection(object):
             :class:`~pymongo.objectid.ObjectId` specifying the value of the
             ``_id`` field for the document to be removed
           - `safe` (optional): check that the remove succeeded?
+          - `deadline` (optional): seconds the operation may take, raising
+            :class:`~pymongo.errors.OperationTimeout` if it takes longer
 
+        .. versionadded:: 1.3+
+           The `deadline` parameter.
         .. versionchanged:: 1.2
            The `spec_or_object_id` parameter is now optional. If it is
            not specified *all* documents in the collection will be
@@ -314,12 +380,15 @@ class Collection(object):
         if not isinstance(spec, dict):
             raise TypeError("spec must be an instance of dict, not %s" %
                             type(spec))
+        deadline = helpers._deadline(deadline)
 
         self.__database.connection._send_message(
-            message.delete(self.__full_name, spec, safe), safe)
+            message.delete(self.__full_name, spec, safe), safe,
+            _deadline=deadline)
 
     def find_one(self, spec_or_object_id=None, fields=None, slave_okay=None,
-                 _sock=None, _must_use_master=False, _is_command=False):
+                 as_class=None, raw_dates=False, deadline=None, _sock=None,
+                 _must_use_master=False, _is_command=False):
         """Get a single object from the database.
 
         Raises TypeError if the argument is of an improper type. Returns a
@@ -334,6 +403,14 @@ class Collection(object):
           - `slave_okay` (optional): DEPRECATED this option is deprecated and
             will be removed - see the slave_okay parameter to
             `pymongo.Connection.__init__`.
+          - `as_class` (optional): class to use for the returned document -
+            see :meth:`find`
+          - `raw_dates` (optional): see :meth:`find`
+          - `deadline` (optional): seconds the operation may take, raising
+            :class:`~pymongo.errors.OperationTimeout` if it takes longer
+
+        .. versionadded:: 1.3+
+           The `as_class`, `raw_dates` and `deadline` parameters.
         """
         spec = spec_or_object_id
         if spec is None:
@@ -342,7 +419,9 @@ class Collection(object):
             spec = SON({"_id": spec})
 
         for result in self.find(spec, limit=-1, fields=fields,
-                                slave_okay=slave_okay, _sock=_sock,
+                                slave_okay=slave_okay, as_class=as_class,
+                                raw_dates=raw_dates, deadline=deadline,
+                                _sock=_sock,
                                 _must_use_master=_must_use_master,
                                 _is_command=_is_command):
             return result
@@ -367,7 +446,9 @@ class Collection(object):
 
     def find(self, spec=None, fields=None, skip=0, limit=0,
              slave_okay=None, timeout=True, snapshot=False, tailable=False,
-             _sock=None, _must_use_master=False, _is_command=False):
+             as_class=None, raw_dates=False, await_data=False,
+             oplog_replay=False, deadline=None, _sock=None,
+             _must_use_master=False, _is_command=False, _raw=False):
         """Query the database.
 
         The `spec` argument is a prototype document that all results must
@@ -412,7 +493,36 @@ class Collection(object):
             the cursor will continue from the last document received. For
             details, see the `tailable cursor documentation
             <http://www.mongodb.org/display/DOCS/Tailable+Cursors>`_.
-
+          - `as_class` (optional): class to use for documents in the query
+            result - defaults to the
+            :attr:`~pymongo.connection.Connection.document_class` of the
+            connection. It is called with a single argument, a list of
+            ``(key, value)`` pairs in document order, so any mapping class
+            with a ``dict``-like constructor (e.g.
+            :class:`~pymongo.son.SON`) or a plain factory function can be
+            used. Embedded documents are built with it too.
+          - `raw_dates` (optional): if True, dates in the query result are
+            returned as ``int`` milliseconds since the epoch (UTC) instead
+            of :class:`datetime.datetime` instances. This skips building
+            datetime objects, which adds up when reading lots of
+            time-series data.
+          - `await_data` (optional): if True, and `tailable` is True, the
+            server will block for a while waiting for new data when a
+            tailable cursor reaches the end of the collection, instead of
+            returning nothing straight away.
+          - `oplog_replay` (optional): if True, and `tailable` is True, lets
+            the server find the starting point of a query on an oplog
+            collection by its ``ts`` field quickly, rather than scanning.
+            The spec must include a ``$gt`` or ``$gte`` condition on
+            ``ts``.
+          - `deadline` (optional): seconds each round trip to the server
+            (the query, and each time the cursor fetches more results) may
+            take, raising :class:`~pymongo.errors.OperationTimeout` if one
+            takes longer. Not to be confused with `timeout`.
+
+        .. versionadded:: 1.3+
+           The `as_class`, `raw_dates`, `await_data`, `oplog_replay` and
+           `deadline` parameters.
         .. versionadded:: 1.1
            The `tailable` parameter.
         """
@@ -425,6 +535,8 @@ class Collection(object):
                           "deprecated. Please set slave_okay on the Connection "
                           "itself.",
                           DeprecationWarning)
+        if as_class is None:
+            as_class = self.__database.connection.document_class
 
         if not isinstance(spec, dict):
             raise TypeError("spec must be an instance of dict")
@@ -442,6 +554,14 @@ class Collection(object):
             raise TypeError("snapshot must be an instance of bool")
         if not isinstance(tailable, bool):
             raise TypeError("tailable must be an instance of bool")
+        if not isinstance(raw_dates, bool):
+            raise TypeError("raw_dates must be an instance of bool")
+        if not isinstance(await_data, bool):
+            raise TypeError("await_data must be an instance of bool")
+        if not isinstance(oplog_replay, bool):
+            raise TypeError("oplog_replay must be an instance of bool")
+        if not isinstance(deadline, (int, float, type(None))):
+            raise TypeError("deadline must be an instance of (int, float)")
 
         if fields is not None:
             if not fields:
@@ -449,9 +569,180 @@ class Collection(object):
             fields = self._fields_list_to_dict(fields)
 
         return Cursor(self, spec, fields, skip, limit, slave_okay, timeout,
-                      tailable, snapshot, _sock=_sock,
+                      tailable, snapshot, as_class, raw_dates, await_data,
+                      oplog_replay, deadline, _sock=_sock,
                       _must_use_master=_must_use_master,
-                      _is_command=_is_command)
+                      _is_command=_is_command, _raw=_raw)
+
+    def tail(self, spec=None, fields=None, resume_field="_id",
+             await_data=True, min_delay=0.01, max_delay=1.0,
+             max_failures=10, **kwargs):
+        """Follow this (capped) collection, yielding new documents as they
+        are inserted.
+
+        This is a generator that never finishes on its own - stop iterating
+        (or call its ``close()`` method) when done. A tailable cursor is kept
+        open between batches. When it has no new data the generator sleeps
+        before asking again, starting at `min_delay` seconds and doubling up
+        to `max_delay` while nothing arrives, so an idle tail neither spins
+        nor adds latency once documents start flowing again.
+
+        If the cursor is lost (the server closes it, or the connection
+        fails) the query is issued again, resuming after the last document
+        seen: the spec gets ``{resume_field: {"$gt": last value}}``, so
+        `resume_field` must increase with insertion order (``_id`` for
+        documents with ObjectIds, ``ts`` for an oplog). Once that has
+        failed `max_failures` times in a row, without a document in
+        between, the last error is raised. Any other
+        :class:`~pymongo.errors.OperationFailure` (e.g. for a collection
+        that isn't capped) is raised straight away.
+
+        :Parameters:
+          - `spec` (optional): a SON object specifying elements which must be
+            present for a document to be yielded
+          - `fields` (optional): a list of field names that should be
+            returned ("_id" will always be included)
+          - `resume_field` (optional): field to resume from after losing the
+            cursor
+          - `await_data` (optional): use await data cursors, so that the
+            server waits for new data for a while before returning an empty
+            batch
+          - `min_delay` (optional): shortest time to sleep (in seconds) when
+            there is no new data
+          - `max_delay` (optional): longest time to sleep (in seconds) when
+            there is no new data
+          - `max_failures` (optional): number of times in a row to try
+            again after losing the cursor
+          - `**kwargs` (optional): any other options to :meth:`find`
+
+        .. versionadded:: 1.3+
+        """
+        return self._tail(None, spec, fields, resume_field,
+                          await_data, min_delay, max_delay, max_failures,
+                          **kwargs)
+
+    def _tail(self, idle, spec=None, fields=None,
+              resume_field="_id", await_data=True, min_delay=0.01,
+              max_delay=1.0, max_failures=10, **kwargs):
+        """The generator behind :meth:`tail`.
+
+        If `idle` isn't None it is yielded whenever there is no new data,
+        before going to sleep.
+        """
+        if spec is None:
+            spec = SON()
+        if not isinstance(spec, dict):
+            raise TypeError("spec must be an instance of dict")
+        if fields is not None and resume_field not in fields:
+            fields = list(fields) + [resume_field]
+
+        last = None
+        delay = min_delay
+        failures = 0
+        while True:
+            query = SON(spec)
+            if last is not None:
+                query[resume_field] = {"$gt": last}
+
+            cursor = self.find(query, fields, tailable=True,
+                               await_data=await_data, **kwargs)
+            try:
+                while cursor.alive:
+                    found = False
+                    for document in cursor:
+                        found = True
+                        failures = 0
+                        last = document.get(resume_field, last)
+                        yield document
+                    if found:
+                        delay = min_delay
+                    elif cursor.alive:
+                        # idle lets callers (e.g. OplogReader) know that
+                        # there's nothing new before we go to sleep
+                        if idle is not None:
+                            yield idle
+                        time.sleep(delay)
+                        delay = min(delay * 2, max_delay)
+            except (AutoReconnect, CursorNotFound):
+                # lost the cursor - fall through and query again
+                failures += 1
+                if failures >= max_failures:
+                    raise
+            finally:
+                cursor.close()
+
+            if idle is not None:
+                yield idle
+            time.sleep(delay)
+            delay = min(delay * 2, max_delay)
+
+    def tail_async(self, spec=None, fields=None, executor=None, **kwargs):
+        """Follow this (capped) collection from :mod:`asyncio` code.
+
+        Returns an asynchronous iterator over the same documents as
+        :meth:`tail`, for use with ``async for``. The (blocking) network
+        operations and backoff sleeps happen in `executor` (the event loop's
+        default executor unless given), so the event loop isn't blocked.
+        Call ``aclose()`` on the iterator when done to close the cursor.
+
+        Takes the same arguments as :meth:`tail`.
+
+        .. versionadded:: 1.3+
+        """
+        return _AsyncIterator(self.tail(spec, fields, **kwargs), executor)
+
+    def export(self, spec, fileobj, format="bson", fields=None,
+               batch_size=10000, **kwargs):
+        """Write the documents matching `spec` to `fileobj`.
+
+        Replies are streamed straight from the server to `fileobj` without
+        decoding documents, so this is much cheaper than iterating over
+        :meth:`find` and encoding each document again. SON manipulators are
+        *not* applied.
+
+        With format ``"bson"`` the documents are written back to back as
+        BSON, the same layout ``mongodump`` uses and
+        :class:`~pymongo.bson.BSONFile` reads. With ``"jsonl"`` each
+        document is written as one line of JSON, as produced by
+        :func:`~pymongo.json_util.dumps_bson`, encoded as UTF-8.
+
+        Raises ValueError if `format` isn't one of the above. Returns the
+        number of documents written.
+
+        :Parameters:
+          - `spec`: a SON object specifying elements which must be present
+            for a document to be exported
+          - `fileobj`: file-like object opened for writing *bytes* (e.g. a
+            file opened in binary mode or a socket's ``makefile("wb")``)
+          - `format` (optional): ``"bson"`` or ``"jsonl"``
+          - `fields` (optional): a list of field names that should be
+            exported ("_id" will always be included)
+          - `batch_size` (optional): documents to ask for per reply
+          - `**kwargs` (optional): any other options to :meth:`find`
+
+        .. versionadded:: 1.3+
+        """
+        if format not in ("bson", "jsonl"):
+            raise ValueError("format must be 'bson' or 'jsonl'")
+
+        cursor = self.find(spec, fields, _raw=True, **kwargs)
+        cursor.batch_size(batch_size)
+
+        count = 0
+        write = fileobj.write
+        if format == "bson":
+            for (n, data) in cursor:
+                write(data)
+                count += n
+        else:
+            dumps_bson = json_util.dumps_bson
+            for (n, data) in cursor:
+                lines = [dumps_bson(data[start:end])
+                         for (start, end) in bson._split_documents(data)]
+                lines.append("")
+                write("\n".join(lines).encode("utf-8"))
+                count += n
+        return count
 
     def count(self):
         """Get the number of documents in this collection.
@@ -602,7 +893,8 @@ class Collection(object):
         create_index()) and the values are lists of (key, direction) pairs
         specifying the index (as passed to create_index()).
         """
-        raw = self.__database.system.indexes.find({"ns": self.__full_name})
+        raw = self.__database.system.indexes.find({"ns": self.__full_name},
+                                                  as_class=dict)
         info = {}
         for index in raw:
             info[index["name"]] = list(index["key"].items())
@@ -617,7 +909,7 @@ class Collection(object):
         has not been created yet.
         """
         result = self.__database.system.namespaces.find_one(
-            {"name": self.__full_name})
+            {"name": self.__full_name}, as_class=dict)
 
         if not result:
             return {}
@@ -42,11 +42,14 @@ import random
 import errno
 import datetime
 import warnings
+import weakref
 
 from .errors import ConnectionFailure, ConfigurationError, AutoReconnect
-from .errors import OperationFailure
+from .errors import OperationFailure, OperationTimeout
 from .database import Database
-from .cursor_manager import CursorManager
+from .cursor_manager import CursorManager, CursorRegistry
+from .monitor import TopologyMonitor
+from .retry import RetryPolicy
 from . import bson
 from . import message
 from . import helpers
@@ -54,39 +57,104 @@ from . import helpers
 _CONNECT_TIMEOUT = 20.0
 
 
-class Pool(threading.local):
+class Pool(object):
     """A simple connection pool.
 
-    Uses thread-local socket per thread. By calling return_socket() a thread
-    can return a socket to the pool.
+    Each operation checks a socket out with socket() and checks it back in
+    with return_socket() - or discard_socket() if it can't be reused - as
+    soon as it's done. Idle sockets are shared between threads, but not
+    between pools. A socket checked out with `pin` set stays with its
+    thread until release() is called.
     """
 
-    # Non thread-locals
-    __slots__ = ["sockets", "socket_factory"]
-    sockets = []
-
-    sock = None
-
     def __init__(self, socket_factory):
         self.socket_factory = socket_factory
+        self.sockets = []
+        self.__local = threading.local()
+        self.__credentials = weakref.WeakKeyDictionary()
+
+    def __get_sock(self):
+        return getattr(self.__local, "sock", None)
+
+    def __set_sock(self, sock):
+        self.__local.sock = sock
 
-    def socket(self):
+    sock = property(__get_sock, __set_sock, doc="""This thread's pinned
+    socket, or None.
+    """)
+
+    def socket(self, deadline=None, pin=False):
+        """Check out a socket: this thread's pinned socket if it has one,
+        otherwise an idle socket or a new one.
+
+        :Parameters:
+          - `deadline` (optional): :func:`time.monotonic` by which a new
+            socket has to be connected
+          - `pin` (optional): keep the socket for this thread
+        """
         if self.sock is not None:
             return self.sock
 
         try:
-            self.sock = self.sockets.pop()
+            sock = self.sockets.pop()
         except IndexError:
-            self.sock = self.socket_factory()
-        return self.sock
+            sock = self.socket_factory(deadline)
+        if pin:
+            self.sock = sock
+        return sock
+
+    def return_socket(self, sock):
+        """Check `sock` back in, unless it's pinned to this thread.
+        """
+        if sock is not self.sock:
+            self.sockets.append(sock)
 
-    def return_socket(self):
+    def discard_socket(self, sock):
+        """Close `sock` instead of checking it back in.
+        """
+        if sock is self.sock:
+            self.sock = None
+        sock.close()
+
+    def release(self):
+        """Check this thread's pinned socket back in.
+        """
         if self.sock is not None:
             self.sockets.append(self.sock)
         self.sock = None
 
+    def credentials(self, sock):
+        """The credentials `sock` has authenticated with, as a dictionary of
+        database name to ``(username, password digest)``.
 
-class Connection(object): # TODO support auth for pooling
+        The dictionary can be modified to record new authentications.
+        """
+        return self.__credentials.setdefault(sock, {})
+
+    def fill(self, size):
+        """Open new sockets until there are `size` idle ones.
+
+        Returns the number of sockets opened.
+        """
+        opened = 0
+        while len(self.sockets) < size:
+            self.sockets.append(self.socket_factory(None))
+            opened += 1
+        return opened
+
+
+def _topology_listener(connection_ref):
+    """A :class:`~pymongo.monitor.TopologyMonitor` listener that passes
+    the results on to a connection, without keeping it alive.
+    """
+    def listener(monitor):
+        connection = connection_ref()
+        if connection is not None:
+            connection._topology_checked(monitor)
+    return listener
+
+
+class Connection(object):
     """Connection to MongoDB.
     """
 
@@ -95,7 +163,8 @@ class Connection(object): # TODO support auth for pooling
 
     def __init__(self, host=None, port=None, pool_size=None,
                  auto_start_request=None, timeout=None, slave_okay=False,
-                 network_timeout=None, _connect=True):
+                 network_timeout=None, document_class=dict, retry_policy=None,
+                 min_pool_size=0, compression=None, _connect=True):
         """Create a new connection to a single MongoDB instance at *host:port*.
 
         The resultant connection object has connection-pooling built in. It
@@ -123,8 +192,25 @@ class Connection(object): # TODO support auth for pooling
           - `timeout` (optional): DEPRECATED
           - `network_timeout` (optional): timeout (in seconds) to use for socket
             operations - default is no timeout
+          - `document_class` (optional): default class to use for documents
+            returned from queries on this connection - see
+            :attr:`document_class`
+          - `retry_policy` (optional): :class:`~pymongo.retry.RetryPolicy`
+            for retrying reads that fail with
+            :class:`~pymongo.errors.AutoReconnect` - see
+            :attr:`retry_policy`
+          - `min_pool_size` (optional): number of sockets to open as soon
+            as the connection is made, so that the first requests don't
+            have to - see :meth:`warm_up`
+          - `compression` (optional): compress messages to and from the
+            server - see :attr:`compression`
 
         .. seealso:: :meth:`end_request`
+        .. versionadded:: 1.3+
+           The `retry_policy`, `min_pool_size` and `compression`
+           parameters.
+        .. versionadded:: 1.3+
+           The `document_class` parameter.
         .. versionchanged:: 1.3+
            DEPRECATED The `pool_size`, `auto_start_request`, and `timeout`
            parameters.
@@ -150,6 +236,14 @@ class Connection(object): # TODO support auth for pooling
             raise TypeError("host must be an instance of (str, unicode)")
         if not isinstance(port, int):
             raise TypeError("port must be an instance of int")
+        if not isinstance(min_pool_size, int):
+            raise TypeError("min_pool_size must be an instance of int")
+        if min_pool_size < 0:
+            raise ValueError("min_pool_size must be non-negative")
+        if compression is not None and compression not in message._COMPRESSORS:
+            raise ConfigurationError("compression must be one of %s, not %r" %
+                                     (sorted(message._COMPRESSORS.keys()),
+                                      compression))
 
         self.__host = None
         self.__port = None
@@ -158,16 +252,33 @@ class Connection(object): # TODO support auth for pooling
         self.__slave_okay = slave_okay
 
         self.__cursor_manager = CursorManager(self)
+        self.__cursor_registry = CursorRegistry()
 
         self.__pool = Pool(self.__connect)
+        # whether each thread is in a request (see start_request)
+        self.__request = threading.local()
+        self.__min_pool_size = min_pool_size
+        self.__compression = compression
+        # database name -> (username, password digest), for authenticating
+        # each pooled socket
+        self.__credentials = {}
+        self.__monitor = None
 
         self.__network_timeout = network_timeout
+        self.__document_class = document_class
+        self.__retry_policy = None
+        self.retry_policy = retry_policy
 
         # cache of existing indexes used by ensure_index ops
         self.__index_cache = {}
 
+        # Database instances handed out by __getattr__, so that repeated
+        # lookups like `connection.db` don't build a new one each time
+        self.__databases = {}
+
         if _connect:
             self.__find_master()
+            self.warm_up()
 
     def __pair_with(self, host, port):
         """Pair this connection with a Mongo instance running on host:port.
@@ -219,12 +330,13 @@ class Connection(object): # TODO support auth for pooling
         return connection
     paired = classmethod(paired)
 
-    def __master(self, sock):
+    def __master(self, sock, deadline=None):
         """Get the hostname and port of the master Mongo instance.
 
         Return a tuple (host, port).
         """
-        result = self["admin"].command({"ismaster": 1}, _sock=sock)
+        result = self["admin"].command({"ismaster": 1}, _sock=sock,
+                                       deadline=helpers._time_left(deadline))
 
         if result["ismaster"] == 1:
             return True
@@ -313,33 +425,110 @@ class Connection(object): # TODO support auth for pooling
         return helpers.callable_value(self.__port, "Connection.port")
     port = property(port)
 
+    def _address(self):
+        """``(host, port)`` of the current master, or ``(None, None)``.
+        """
+        return (self.__host, self.__port)
+    _address = property(_address)
+
     def slave_okay(self):
         """Is it okay for this connection to connect directly to a slave?
         """
         return self.__slave_okay
     slave_okay = property(slave_okay)
 
-    def __find_master(self):
+    def min_pool_size(self):
+        """Number of sockets :meth:`warm_up` opens by default.
+
+        .. versionadded:: 1.3+
+        """
+        return self.__min_pool_size
+    min_pool_size = property(min_pool_size)
+
+    def compression(self):
+        """The compressor used for messages to and from the server, or
+        None.
+
+        Every message is sent wrapped in an **OP_COMPRESSED** message,
+        compressed with ``"zlib"`` (always available) or ``"snappy"`` or
+        ``"zstd"`` (if the `python-snappy` or `zstandard` package is
+        installed). The server answers in kind. A server that doesn't
+        support compression itself can be reached through the sidecar
+        proxy in ``tools/compression_proxy.py``. Compressed replies are
+        handled whatever this is set to.
+
+        .. versionadded:: 1.3+
+        """
+        return self.__compression
+    compression = property(compression)
+
+    def __get_document_class(self):
+        return self.__document_class
+
+    def __set_document_class(self, klass):
+        self.__document_class = klass
+
+    document_class = property(__get_document_class, __set_document_class,
+                              doc="""Default class to use for documents
+                              returned on this connection.
+
+                              Can be ``dict``, :class:`~pymongo.son.SON`,
+                              any other mapping class with a
+                              ``dict``-like constructor, or any callable
+                              that takes a list of ``(key, value)`` pairs.
+                              Individual queries can override it with the
+                              `as_class` parameter to
+                              :meth:`~pymongo.collection.Collection.find`.
+
+                              .. versionadded:: 1.3+
+                              """)
+
+    def __get_retry_policy(self):
+        return self.__retry_policy
+
+    def __set_retry_policy(self, policy):
+        if policy is not None and not isinstance(policy, RetryPolicy):
+            raise TypeError("retry_policy must be an instance of "
+                            "RetryPolicy or None")
+        self.__retry_policy = policy
+
+    retry_policy = property(__get_retry_policy, __set_retry_policy,
+                            doc="""The :class:`~pymongo.retry.RetryPolicy`
+                            used to retry reads, or None.
+
+                            Queries and read only commands that fail
+                            with :class:`~pymongo.errors.AutoReconnect`
+                            are retried as the policy allows. Writes,
+                            and fetching more results for a cursor that
+                            is already open, are never retried. The
+                            default is None - no retries.
+
+                            .. versionadded:: 1.3+
+                            """)
+
+    def __find_master(self, deadline=None):
         """Create a new socket and use it to figure out who the master is.
 
         Sets __host and __port so that :attr:`host` and :attr:`port` will return the
-        address of the master.
+        address of the master. Raises OperationTimeout if `deadline` passes
+        first.
         """
         self.__host = None
         self.__port = None
         sock = None
         for (host, port) in self.__nodes:
+            connect_timeout = self.__timeout(deadline, _CONNECT_TIMEOUT)
             try:
                 try:
                     sock = socket.socket()
                     sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
-                    sock.settimeout(_CONNECT_TIMEOUT)
+                    sock.settimeout(connect_timeout)
                     try:
                         sock.connect((host, port))
                     except OverflowError as e:
                         raise ConnectionFailure(e)
                     sock.settimeout(self.__network_timeout)
-                    master = self.__master(sock)
+                    master = self.__master(sock, deadline)
                     if master is True:
                         self.__host = host
                         self.__port = port
@@ -364,26 +553,299 @@ class Connection(object): # TODO support auth for pooling
             finally:
                 if sock is not None:
                     sock.close()
+        if helpers._timed_out(deadline):
+            raise OperationTimeout("could not find master before the "
+                                   "deadline")
         raise AutoReconnect("could not find master")
 
-    def __connect(self):
+    def __monitored_master(self):
+        """The address to use according to the monitor's last check.
+
+        Returns None if the monitor hasn't found one (or hasn't finished
+        its first check yet).
+        """
+        monitor = self.__monitor
+        if monitor is None or not monitor.checks:
+            return None
+        address = monitor.master
+        if address is None and self.__slave_okay:
+            for status in monitor.nodes:
+                if status.reachable:
+                    return status.address
+        return address
+
+    def __use_monitor(self):
+        """Switch to the master the monitor last saw, instead of looking for
+        it ourselves.
+
+        Returns False if there is no monitor to ask (or it hasn't finished
+        its first check yet). Raises AutoReconnect, and has the monitor
+        check again, if it didn't find a master.
+        """
+        monitor = self.__monitor
+        if monitor is None or not monitor.checks:
+            return False
+        address = self.__monitored_master()
+        if address is None:
+            self.__host = None
+            self.__port = None
+            monitor.wake()
+            raise AutoReconnect("could not find master")
+        (self.__host, self.__port) = address
+        return True
+
+    def _topology_checked(self, monitor):
+        """Called after every check by the topology monitor.
+
+        Switches to a new master as soon as the monitor sees one.
+        """
+        if monitor is not self.__monitor:
+            return
+        address = self.__monitored_master()
+        if address is not None and address != (self.__host, self.__port):
+            self.__host, self.__port = address
+            self.disconnect()
+
+    def _probe(self, address, timeout):
+        """Run ``ismaster`` against `address` on a new socket.
+        """
+        sock = socket.socket()
+        try:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.settimeout(timeout)
+            try:
+                sock.connect(address)
+            except OverflowError as e:
+                raise ConnectionFailure(e)
+            return self["admin"].command({"ismaster": 1}, _sock=sock)
+        finally:
+            sock.close()
+
+    def start_monitor(self, interval=5.0, connect_timeout=2.0):
+        """Watch this connection's nodes from a background thread.
+
+        The monitor runs ``ismaster`` against every node (both sides of a
+        pair) every `interval` seconds and caches the results. Once it has
+        finished its first check this connection switches to a new master
+        as soon as the monitor sees one, and after a connection failure it
+        uses the master the monitor last saw instead of searching for one
+        while the failed request waits. Until the monitor sees a master
+        again, requests fail straight away with
+        :class:`~pymongo.errors.AutoReconnect`.
+
+        Returns the :class:`~pymongo.monitor.TopologyMonitor`. Starting a
+        new monitor stops the old one.
+
+        :Parameters:
+          - `interval` (optional): seconds between checks
+          - `connect_timeout` (optional): timeout, in seconds, for each
+            check of a node
+
+        .. versionadded:: 1.3+
+        """
+        self.stop_monitor()
+        self.__monitor = TopologyMonitor(self.__nodes, self._probe, interval,
+                                         connect_timeout,
+                                         _topology_listener(weakref.ref(self)))
+        self.__monitor.start()
+        return self.__monitor
+
+    def stop_monitor(self):
+        """Stop the monitor started by :meth:`start_monitor`, if there is
+        one.
+
+        .. versionadded:: 1.3+
+        """
+        if self.__monitor is not None:
+            self.__monitor.stop()
+            self.__monitor = None
+
+    def monitor(self):
+        """The :class:`~pymongo.monitor.TopologyMonitor` started by
+        :meth:`start_monitor`, or None.
+
+        .. versionadded:: 1.3+
+        """
+        return self.__monitor
+    monitor = property(monitor)
+
+    def __connect(self, deadline=None):
         """(Re-)connect to Mongo and return a new (connected) socket.
 
-        Connect to the master if this is a paired connection.
+        Connect to the master if this is a paired connection. Raises
+        OperationTimeout if that can't be done by `deadline`.
         """
         if self.__host is None or self.__port is None:
-            self.__find_master()
+            if not self.__use_monitor():
+                self.__find_master(deadline)
 
+        connect_timeout = self.__timeout(deadline, _CONNECT_TIMEOUT)
         try:
             sock = socket.socket()
             sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
-            sock.settimeout(_CONNECT_TIMEOUT)
+            sock.settimeout(connect_timeout)
             sock.connect((self.__host, self.__port))
             sock.settimeout(self.__network_timeout)
-            return sock
         except socket.error:
+            if helpers._timed_out(deadline):
+                raise OperationTimeout("could not connect to %r before the "
+                                       "deadline" % self.__nodes)
             raise AutoReconnect("could not connect to %r" % self.__nodes)
 
+        # authenticate straight away, so that sockets opened by warm_up are
+        # ready to use
+        try:
+            self.__check_auth(sock, deadline)
+        except:
+            sock.close()
+            raise
+        return sock
+
+    def __check_auth(self, sock, deadline=None):
+        """Bring `sock` up to date with the connection's credentials.
+
+        Authenticates it to each database it hasn't authenticated to yet
+        (or has, but with different credentials), and logs it out of
+        databases the connection has since logged out of. Does nothing, and
+        costs nothing, if the socket is up to date. Raises OperationFailure
+        if the credentials are no longer accepted.
+        """
+        authenticated = self.__pool.credentials(sock)
+        credentials = self.__credentials.copy()
+        if authenticated == credentials:
+            return
+
+        for (name, (username, digest)) in credentials.items():
+            if authenticated.get(name) == (username, digest):
+                continue
+            if not self[name]._authenticate_socket(username, digest, sock,
+                                                   deadline):
+                raise OperationFailure("authentication to %r as %r failed" %
+                                       (name, username))
+            authenticated[name] = (username, digest)
+
+        for name in list(authenticated.keys()):
+            if name not in credentials:
+                self[name].command({"logout": 1}, _sock=sock,
+                                   deadline=helpers._time_left(deadline))
+                del authenticated[name]
+
+    def _authenticate(self, name, username, digest):
+        """Authenticate to database `name`, on a pooled socket, and
+        remember the credentials so that every other pooled socket does the
+        same when it is next used.
+
+        Returns True if the credentials were accepted.
+        """
+        pool = self.__pool
+        sock = self.__socket(pool)
+        try:
+            self.__check_auth(sock)
+            accepted = self[name]._authenticate_socket(username, digest, sock)
+            if accepted:
+                self.__credentials[name] = (username, digest)
+                pool.credentials(sock)[name] = (username, digest)
+        except (ConnectionFailure, socket.error) as e:
+            pool.discard_socket(sock)
+            self._reset()
+            raise AutoReconnect(str(e))
+        except BaseException:
+            pool.discard_socket(sock)
+            raise
+        pool.return_socket(sock)
+        return accepted
+
+    def _logout(self, name):
+        """Log out of database `name`, on a pooled socket now and on every
+        other pooled socket when it is next used.
+        """
+        self.__credentials.pop(name, None)
+        pool = self.__pool
+        sock = self.__socket(pool)
+        try:
+            pool.credentials(sock).pop(name, None)
+            self[name].command({"logout": 1}, _sock=sock)
+        except AutoReconnect:
+            pool.discard_socket(sock)
+            self._reset()
+            raise
+        except BaseException:
+            pool.discard_socket(sock)
+            raise
+        pool.return_socket(sock)
+
+    def __timeout(self, deadline, timeout):
+        """The socket timeout to use for a step of an operation that has to
+        finish by `deadline`: whichever of `timeout` and the time left is
+        shorter.
+
+        Raises OperationTimeout if the deadline has already passed.
+        """
+        remaining = helpers._time_left(deadline)
+        if remaining is None:
+            return timeout
+        if timeout is None:
+            return remaining
+        return min(timeout, remaining)
+
+    def __bound(self, sock, deadline):
+        """Make the next send or recv on `sock` give up at `deadline`.
+        """
+        if deadline is not None:
+            sock.settimeout(self.__timeout(deadline, self.__network_timeout))
+
+    def __unbound(self, sock, deadline):
+        """Put back the timeout :meth:`__bound` changed, once `sock` is
+        between messages again.
+        """
+        if deadline is not None:
+            sock.settimeout(self.__network_timeout)
+
+    def __socket(self, pool, deadline=None):
+        """Check a socket out of `pool`, pinning it to this thread if the
+        thread is in a request.
+        """
+        return pool.socket(deadline, getattr(self.__request, "active", False))
+
+    def warm_up(self, size=None, background=False):
+        """Open sockets ahead of time, so that operations don't have to.
+
+        Sockets are otherwise only opened when an operation finds no idle
+        one in the pool. This tops the pool up with idle sockets to the
+        master until there are `size` of them, so that up to `size`
+        concurrent operations can start without connecting. Sockets closed
+        by :meth:`disconnect` (or after a connection failure) aren't
+        replaced until this is called again.
+
+        Called with :attr:`min_pool_size` when the connection is made.
+        Returns the number of sockets opened, or None if `background` is
+        set.
+
+        :Parameters:
+          - `size` (optional): number of idle sockets to have, defaults to
+            :attr:`min_pool_size`
+          - `background` (optional): open the sockets from a background
+            thread and return straight away - any errors are ignored
+
+        .. versionadded:: 1.3+
+        """
+        if size is None:
+            size = self.__min_pool_size
+        if not background:
+            return self.__pool.fill(size)
+        thread = threading.Thread(target=self.__fill_quietly, args=(size,))
+        thread.daemon = True
+        thread.start()
+
+    def __fill_quietly(self, size):
+        """Warming up is best effort - if it fails requests will just
+        connect as usual.
+        """
+        try:
+            self.__pool.fill(size)
+        except (ConnectionFailure, ConfigurationError):
+            pass
+
     def disconnect(self):
         """Disconnect from MongoDB.
 
@@ -405,10 +867,14 @@ class Connection(object): # TODO support auth for pooling
         Closes all open sockets and resets them to None. Re-finds the master.
 
         This should be done in case of a connection failure or a "not master"
-        error.
+        error. If there is a monitor, it is asked to check the nodes again and
+        the master it last saw is used in the meantime.
         """
         self.disconnect()
-        self.__find_master()
+        if self.__monitor is not None:
+            self.__monitor.wake()
+        if not self.__use_monitor():
+            self.__find_master()
 
     def set_cursor_manager(self, manager_class):
         """Set this connection's cursor manager.
@@ -428,6 +894,18 @@ class Connection(object): # TODO support auth for pooling
 
         self.__cursor_manager = manager
 
+    def cursor_registry(self):
+        """The :class:`~pymongo.cursor_manager.CursorRegistry` tracking every
+        cursor that is open on the server for this connection.
+
+        Use it to find (and kill) cursors that are being kept open, e.g.
+        ``timeout=False`` cursors that are never exhausted.
+
+        .. versionadded:: 1.3+
+        """
+        return self.__cursor_registry
+    cursor_registry = property(cursor_registry)
+
     def __check_response_to_last_error(self, response):
         """Check a response to a lastError message for errors.
 
@@ -446,121 +924,199 @@ class Connection(object): # TODO support auth for pooling
             self._reset()
         raise OperationFailure(error["err"])
 
-    def _send_message(self, message, with_last_error=False):
+    def _send_message(self, message, with_last_error=False, _deadline=None):
         """Say something to Mongo.
 
         Raises ConnectionFailure if the message cannot be sent. Raises
         OperationFailure if `with_last_error` is ``True`` and the response to
-        the getLastError call returns an error.
+        the getLastError call returns an error. Raises OperationTimeout if
+        `_deadline` passes first.
 
         :Parameters:
           - `message`: message to send
           - `with_last_error`: check getLastError status after sending the
             message
+          - `_deadline` (optional): :func:`time.monotonic` by which the
+            message has to be sent (and the response received, for
+            `with_last_error`)
         """
-        sock = self.__pool.socket()
+        pool = self.__pool
+        sock = self.__socket(pool, _deadline)
+        try:
+            # nothing has been sent yet, so the socket is still fine to reuse
+            helpers._time_left(_deadline)
+        except OperationTimeout:
+            pool.return_socket(sock)
+            raise
         try:
+            self.__check_auth(sock, _deadline)
             (request_id, data) = message
-            sock.sendall(data)
+            self.__bound(sock, _deadline)
+            sock.sendall(self.__compress(data))
             # Safe mode. We pack the message together with a lastError
             # message and send both. We then get the response (to the
             # lastError) and raise OperationFailure if it is an error
             # response.
             if with_last_error:
-                response = self.__receive_message_on_socket(1, request_id, sock)
-                self.__check_response_to_last_error(response)
+                response = self.__receive_message_on_socket(1, request_id,
+                                                            sock, _deadline)
+            self.__unbound(sock, _deadline)
         except (ConnectionFailure, socket.error) as e:
+            # the socket may be in the middle of a message
+            pool.discard_socket(sock)
+            if helpers._timed_out(_deadline):
+                # the connection is fine, so it isn't reset
+                raise OperationTimeout("operation exceeded its deadline")
             self._reset()
             raise AutoReconnect(str(e))
-
-    def __receive_data_on_socket(self, length, sock):
+        except BaseException:
+            # e.g. mismatched reply ids or KeyboardInterrupt - the socket
+            # can't be trusted to be between messages either
+            pool.discard_socket(sock)
+            raise
+        pool.return_socket(sock)
+        if with_last_error:
+            self.__check_response_to_last_error(response)
+
+    def __receive_data_on_socket(self, length, sock, deadline=None):
         """Lowest level receive operation.
 
         Takes length to receive and repeatedly calls recv until able to
         return a buffer of that length, raising ConnectionFailure on error.
+        Every recv gives up at `deadline`.
         """
         message = b""
         while len(message) < length:
+            self.__bound(sock, deadline)
             chunk = sock.recv(length - len(message))
             if chunk == b"":
                 raise ConnectionFailure("connection closed")
             message += chunk
         return message
 
-    def __receive_message_on_socket(self, operation, request_id, sock):
+    def __receive_message_on_socket(self, operation, request_id, sock,
+                                    deadline=None):
         """Receive a message in response to `request_id` on `sock`.
 
         Returns the response data with the header removed.
         """
-        header = self.__receive_data_on_socket(16, sock)
+        header = self.__receive_data_on_socket(16, sock, deadline)
         length = struct.unpack("<i", header[:4])[0]
         assert request_id == struct.unpack("<i", header[8:12])[0], \
             "ids don't match %r %r" % (request_id,
                                        struct.unpack("<i", header[8:12])[0])
-        assert operation == struct.unpack("<i", header[12:])[0]
+        received = struct.unpack("<i", header[12:])[0]
+        data = self.__receive_data_on_socket(length - 16, sock, deadline)
+
+        if received == message.OP_COMPRESSED:
+            (received, data) = message.decompress(data)
+        assert operation == received
+        return data
 
-        return self.__receive_data_on_socket(length - 16, sock)
+    def __compress(self, data):
+        """Compress the messages in `data`, if compression is on.
+        """
+        if self.__compression is None:
+            return data
+        return message.compress(data, self.__compression)
 
-    def __send_and_receive(self, message, sock):
+    def __send_and_receive(self, message, sock, deadline=None):
         """Send a message on the given socket and return the response data.
         """
         (request_id, data) = message
-        sock.sendall(data)
-        return self.__receive_message_on_socket(1, request_id, sock)
+        self.__bound(sock, deadline)
+        sock.sendall(self.__compress(data))
+        response = self.__receive_message_on_socket(1, request_id, sock,
+                                                    deadline)
+        self.__unbound(sock, deadline)
+        return response
 
     # we just ignore _must_use_master here: it's only relavant for
     # MasterSlaveConnection instances.
-    def _send_message_with_response(self, message,
-                                    _sock=None, _must_use_master=False):
+    def _send_message_with_response(self, message, _sock=None,
+                                    _must_use_master=False, _deadline=None):
         """Send a message to Mongo and return the response.
 
-        Sends the given message and returns the response.
+        Sends the given message and returns the response. Raises
+        OperationTimeout if `_deadline` passes first.
 
         :Parameters:
           - `message`: (request_id, data) pair making up the message to send
+          - `_deadline` (optional): :func:`time.monotonic` by which the
+            response has to be received
         """
         # hack so we can do find_master on a specific socket...
-        reset = False
-        if _sock is None:
-            reset = True
-            _sock = self.__pool.socket()
-
+        if _sock is not None:
+            helpers._time_left(_deadline)
+            try:
+                return self.__send_and_receive(message, _sock, _deadline)
+            except (ConnectionFailure, socket.error) as e:
+                if helpers._timed_out(_deadline):
+                    raise OperationTimeout("operation exceeded its deadline")
+                raise AutoReconnect(str(e))
+
+        pool = self.__pool
+        sock = self.__socket(pool, _deadline)
+        try:
+            # nothing has been sent yet, so the socket is still fine to reuse
+            helpers._time_left(_deadline)
+        except OperationTimeout:
+            pool.return_socket(sock)
+            raise
         try:
-            return self.__send_and_receive(message, _sock)
+            self.__check_auth(sock, _deadline)
+            response = self.__send_and_receive(message, sock, _deadline)
         except (ConnectionFailure, socket.error) as e:
-            if reset:
-                self._reset()
+            # the socket may be in the middle of a message
+            pool.discard_socket(sock)
+            if helpers._timed_out(_deadline):
+                # the connection is fine, so it isn't reset
+                raise OperationTimeout("operation exceeded its deadline")
+            self._reset()
             raise AutoReconnect(str(e))
+        except BaseException:
+            # e.g. mismatched reply ids or KeyboardInterrupt - the socket
+            # can't be trusted to be between messages either
+            pool.discard_socket(sock)
+            raise
+        pool.return_socket(sock)
+        return response
 
     def start_request(self):
-        """DEPRECATED all operations will start a request.
+        """Start a "request".
+
+        Each operation normally borrows a socket from the pool for just as
+        long as it takes, so consecutive operations from a thread can be
+        sent on different sockets. Start a request for a sequence of
+        operations in which order matters - e.g. an unsafe write followed
+        by a read that has to see it, or by
+        :meth:`~pymongo.database.Database.error` - and this thread's
+        operations will all use the same socket until :meth:`end_request`
+        is called.
 
+        .. seealso:: :meth:`end_request`
         .. versionchanged:: 1.3+
-           DEPRECATED
+           No longer DEPRECATED: operations only use the same socket
+           within a request.
         """
-        warnings.warn("the Connection.start_request method is deprecated",
-                      DeprecationWarning)
+        self.__request.active = True
 
     def end_request(self):
-        """Allow this thread's connection to return to the pool.
-
-        Calling :meth:`end_request` allows the :class:`~socket.socket`
-        that has been reserved for this thread to be returned to the
-        pool. Other threads will then be able to re-use that
-        :class:`~socket.socket`. If your application uses many
-        threads, or has long-running threads that infrequently perform
-        MongoDB operations, then judicious use of this method can lead
-        to performance gains. Care should be taken, however, to make
-        sure that :meth:`end_request` is not called in the middle of a
-        sequence of operations in which ordering is important. This
-        could lead to unexpected results.
-
-        One important case is when a thread is dying permanently. It
-        is best to call :meth:`end_request` when you know a thread is
-        finished, as otherwise its :class:`~socket.socket` will not be
-        reclaimed.
+        """End the current "request", if this thread has started one.
+
+        The :class:`~socket.socket` reserved for this thread by
+        :meth:`start_request` is returned to the pool, to be used by other
+        threads. Care should be taken to make sure that
+        :meth:`end_request` is not called in the middle of a sequence of
+        operations in which ordering is important. This could lead to
+        unexpected results.
+
+        A thread that dies in the middle of a request keeps its
+        :class:`~socket.socket` out of the pool, so it is best to call
+        :meth:`end_request` when you know a thread is finished.
         """
-        self.__pool.return_socket()
+        self.__request.active = False
+        self.__pool.release()
 
     def __ne__(self, other):
         if isinstance(other, Connection):
@@ -587,8 +1143,18 @@ class Connection(object): # TODO support auth for pooling
 
         :Parameters:
           - `name`: the name of the database to get
+
+        .. versionchanged:: 1.3+
+           The same :class:`~pymongo.database.Database` instance is
+           returned for every lookup of `name`. Names starting with an
+           underscore raise :class:`AttributeError` rather than being
+           looked up (use ``connection[name]`` for those).
         """
-        return Database(self, name)
+        if name.startswith("_"):
+            raise AttributeError("Connection has no attribute %r. To "
+                                 "access the %s database, use "
+                                 "connection[%r]." % (name, name, name))
+        return self.__getitem__(name)
 
     def __getitem__(self, name):
         """Get a database by name.
@@ -598,7 +1164,12 @@ class Connection(object): # TODO support auth for pooling
         :Parameters:
           - `name`: the name of the database to get
         """
-        return self.__getattr__(name)
+        try:
+            return self.__databases[name]
+        except KeyError:
+            # setdefault is atomic, so racing threads all end up sharing
+            # whichever instance got there first
+            return self.__databases.setdefault(name, Database(self, name))
 
     def close_cursor(self, cursor_id):
         """Close a single database cursor.
@@ -17,9 +17,11 @@
 import types
 import struct
 import warnings
+from collections import deque
 
 from . import helpers
 from . import message
+from . import retry
 from .son import SON
 from .code import Code
 from .errors import InvalidOperation, OperationFailure, AutoReconnect
@@ -28,7 +30,8 @@ _QUERY_OPTIONS = {
     "tailable_cursor": 2,
     "slave_okay": 4,
     "oplog_replay": 8,
-    "no_timeout": 16
+    "no_timeout": 16,
+    "await_data": 32
 }
 
 
@@ -37,8 +40,10 @@ class Cursor(object):
     """
 
     def __init__(self, collection, spec, fields, skip, limit, slave_okay,
-                 timeout, tailable, snapshot=False,
-                 _sock=None, _must_use_master=False, _is_command=False):
+                 timeout, tailable, snapshot=False, as_class=dict,
+                 raw_dates=False, await_data=False, oplog_replay=False,
+                 deadline=None, _sock=None, _must_use_master=False, _is_command=False,
+                 _raw=False):
         """Create a new cursor.
 
         Should not be called directly by application developers.
@@ -51,15 +56,22 @@ class Cursor(object):
         self.__slave_okay = slave_okay
         self.__timeout = timeout
         self.__tailable = tailable
+        self.__await_data = await_data
+        self.__oplog_replay = oplog_replay
+        self.__deadline = deadline
         self.__snapshot = snapshot
+        self.__as_class = as_class
+        self.__raw_dates = raw_dates
         self.__ordering = None
         self.__explain = False
         self.__hint = None
         self.__socket = _sock
         self.__must_use_master = _must_use_master
         self.__is_command = _is_command
+        self.__raw = _raw
+        self.__batch_size = 0
 
-        self.__data = []
+        self.__data = deque()
         self.__id = None
         self.__connection_id = None
         self.__retrieved = 0
@@ -74,10 +86,37 @@ class Cursor(object):
         return self.__collection
     collection = property(collection)
 
+    def alive(self):
+        """Can this cursor return more data?
+
+        Always True for a cursor that hasn't been evaluated yet. Once the
+        server closes the cursor (e.g. a regular cursor has been exhausted,
+        or a tailable cursor lost its position) or :meth:`close` is called,
+        this becomes False as soon as any data already retrieved has been
+        consumed. A tailable cursor with no new data is still alive.
+
+        .. versionadded:: 1.3+
+        """
+        return bool(len(self.__data) or not self.__killed)
+    alive = property(alive)
+
     def __del__(self):
         if self.__id and not self.__killed:
             self.__die()
 
+    def close(self):
+        """Explicitly close this cursor.
+
+        Kills the cursor on the server (according to the connection's cursor
+        manager) without waiting for it to be garbage collected. Any data
+        that has already been retrieved is discarded and further iteration
+        will stop.
+
+        .. versionadded:: 1.3+
+        """
+        self.__die()
+        self.__data = deque()
+
     def rewind(self):
         """Rewind this cursor to it's unevaluated state.
 
@@ -86,8 +125,12 @@ class Cursor(object):
         Future iterating performed on this cursor will cause new queries to
         be sent to the server, even if the resultant data has already been
         retrieved by this cursor.
+
+        .. versionchanged:: 1.3+
+           Closes the cursor that was open on the server, if any.
         """
-        self.__data = []
+        self.__die()
+        self.__data = deque()
         self.__id = None
         self.__connection_id = None
         self.__retrieved = 0
@@ -105,10 +148,14 @@ class Cursor(object):
         """
         copy = Cursor(self.__collection, self.__spec, self.__fields,
                       self.__skip, self.__limit, self.__slave_okay,
-                      self.__timeout, self.__tailable, self.__snapshot)
+                      self.__timeout, self.__tailable, self.__snapshot,
+                      self.__as_class, self.__raw_dates, self.__await_data,
+                      self.__oplog_replay, self.__deadline)
         copy.__ordering = self.__ordering
         copy.__explain = self.__explain
         copy.__hint = self.__hint
+        copy.__batch_size = self.__batch_size
+        copy.__raw = self.__raw
         copy.__socket = self.__socket
         return copy
 
@@ -117,10 +164,12 @@ class Cursor(object):
         """
         if self.__id and not self.__killed:
             connection = self.__collection.database.connection
-            if self.__connection_id is not None:
-                connection.close_cursor(self.__id, self.__connection_id)
-            else:
-                connection.close_cursor(self.__id)
+            # unless the registry has killed it already
+            if connection.cursor_registry._untrack(self):
+                if self.__connection_id is not None:
+                    connection.close_cursor(self.__id, self.__connection_id)
+                else:
+                    connection.close_cursor(self.__id)
         self.__killed = True
 
     def __query_spec(self):
@@ -149,6 +198,10 @@ class Cursor(object):
             options |= _QUERY_OPTIONS["slave_okay"]
         if not self.__timeout:
             options |= _QUERY_OPTIONS["no_timeout"]
+        if self.__tailable and self.__await_data:
+            options |= _QUERY_OPTIONS["await_data"]
+        if self.__tailable and self.__oplog_replay:
+            options |= _QUERY_OPTIONS["oplog_replay"]
         return options
 
     def __check_okay_to_chain(self):
@@ -174,6 +227,40 @@ class Cursor(object):
         self.__limit = limit
         return self
 
+    def batch_size(self, batch_size):
+        """Set the number of documents to ask the server for in each reply.
+
+        This only changes how results are fetched, not which results are
+        returned. By default the server decides (replies are limited to a
+        few megabytes either way). Larger batches mean fewer round trips for
+        big result sets.
+
+        Raises TypeError if `batch_size` is not an instance of int. Raises
+        ValueError if `batch_size` is negative. Raises InvalidOperation if
+        this cursor has already been used.
+
+        :Parameters:
+          - `batch_size`: documents per batch, or 0 to let the server decide
+
+        .. versionadded:: 1.3+
+        """
+        if not isinstance(batch_size, int):
+            raise TypeError("batch_size must be an int")
+        if batch_size < 0:
+            raise ValueError("batch_size must be >= 0")
+        self.__check_okay_to_chain()
+
+        self.__batch_size = batch_size
+        return self
+
+    def __number_to_return(self, limit):
+        """How many documents to ask for, given how many we can still return.
+        """
+        if self.__batch_size and (limit == 0 or 0 < self.__batch_size < limit):
+            # the server treats 1 as -1, which would close the cursor
+            return max(self.__batch_size, 2)
+        return limit
+
     def skip(self, skip):
         """Skips the first `skip` results of this cursor.
 
@@ -411,34 +498,75 @@ class Cursor(object):
                   "_must_use_master": self.__must_use_master}
         if self.__connection_id is not None:
             kwargs["_connection_to_use"] = self.__connection_id
+        # the deadline covers every attempt at this message, retries too
+        if self.__deadline is not None:
+            kwargs["_deadline"] = helpers._deadline(self.__deadline)
 
-        response = db.connection._send_message_with_response(message,
-                                                             **kwargs)
+        def exchange():
+            response = db.connection._send_message_with_response(message,
+                                                                 **kwargs)
 
-        if isinstance(response, tuple):
-            (connection_id, response) = response
+            if isinstance(response, tuple):
+                (connection_id, response) = response
+            else:
+                connection_id = None
+
+            try:
+                unpacked = helpers._unpack_response(response, self.__id,
+                                                    self.__as_class,
+                                                    self.__raw_dates,
+                                                    self.__raw)
+            except AutoReconnect:
+                db.connection._reset()
+                raise
+            return (connection_id, unpacked, len(response))
+
+        # only the first batch of a query can be fetched again elsewhere
+        policy = db.connection.retry_policy
+        if policy is not None and self.__is_retryable():
+            (connection_id, response, nbytes) = policy.run(exchange)
         else:
-            connection_id = None
+            (connection_id, response, nbytes) = exchange()
 
         self.__connection_id = connection_id
-
-        try:
-            response = helpers._unpack_response(response, self.__id)
-        except AutoReconnect:
-            db.connection._reset()
-            raise
         self.__id = response["cursor_id"]
+        db.connection.cursor_registry._track(self, self.__id,
+                                             self.__collection.full_name,
+                                             not self.__timeout, nbytes,
+                                             response["number_returned"],
+                                             connection_id)
 
         # starting from doesn't get set on getmore's for tailable cursors
         if not self.__tailable:
             assert response["starting_from"] == self.__retrieved
 
         self.__retrieved += response["number_returned"]
-        self.__data = response["data"]
+        if self.__raw:
+            # one (number of documents, BSON bytes) item per reply
+            self.__data = deque()
+            if response["number_returned"]:
+                self.__data.append((response["number_returned"],
+                                    response["data"]))
+        else:
+            # manipulate the whole batch at once
+            self.__data = deque(db._fix_outgoing_many(response["data"],
+                                                      self.__collection))
 
         if self.__limit and self.__id and self.__limit <= self.__retrieved:
             self.__die()
 
+    def __is_retryable(self):
+        """Can this cursor's next message safely be sent again?
+
+        True for the initial query, unless it is a command that writes or
+        it's tied to a particular socket.
+        """
+        if self.__id is not None or self.__socket is not None:
+            return False
+        if self.__collection.name == "$cmd":
+            return retry._is_read_command(self.__spec)
+        return True
+
     def _refresh(self):
         """Refreshes the cursor with more data from Mongo.
 
@@ -454,12 +582,19 @@ class Cursor(object):
             self.__send_message(
                 message.query(self.__query_options(),
                               self.__collection.full_name,
-                              self.__skip, self.__limit,
+                              self.__skip,
+                              self.__number_to_return(self.__limit),
                               self.__query_spec(), self.__fields))
             if not self.__id:
                 self.__killed = True
         elif self.__id:
             # Get More
+            registry = self.__collection.database.connection.cursor_registry
+            if not registry._tracking(self):
+                # killed by the registry
+                self.__killed = True
+                return 0
+
             limit = 0
             if self.__limit:
                 if self.__limit > self.__retrieved:
@@ -470,7 +605,9 @@ class Cursor(object):
 
             self.__send_message(
                 message.get_more(self.__collection.full_name,
-                                 limit, self.__id))
+                                 self.__number_to_return(limit), self.__id))
+            if not self.__id:
+                self.__killed = True
 
         return len(self.__data)
 
@@ -478,9 +615,6 @@ class Cursor(object):
         return self
 
     def __next__(self):
-        db = self.__collection.database
         if len(self.__data) or self._refresh():
-            next = db._fix_outgoing(self.__data.pop(0), self.__collection)
-        else:
-            raise StopIteration
-        return next
+            return self.__data.popleft()
+        raise StopIteration
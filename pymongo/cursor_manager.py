@@ -18,7 +18,17 @@ New cursor managers should be defined as subclasses of CursorManager and can be
 installed on a connection by calling
 `pymongo.connection.Connection.set_cursor_manager`."""
 
+import itertools
+import os
+import threading
+import time
+import traceback
 import types
+import weakref
+
+from .errors import ConnectionFailure
+
+_DRIVER = os.path.dirname(os.path.abspath(__file__)) + os.sep
 
 
 class CursorManager(object):
@@ -86,3 +96,485 @@ class BatchCursorManager(CursorManager):
         if len(self.__dying_cursors) > self.__max_dying_cursors:
             self.__connection.kill_cursors(self.__dying_cursors)
             self.__dying_cursors = []
+
+
+def _flush_when_due(manager_ref):
+    """Body of a :class:`TimedBatchCursorManager`'s flushing thread.
+
+    Only holds a weak reference to the manager between flushes so that the
+    manager (and its connection) can still be garbage collected. Exits once
+    there is nothing left to flush, the manager starts a new thread when
+    more cursors are closed.
+    """
+    while True:
+        manager = manager_ref()
+        if manager is None:
+            return
+        delay = manager._flush_delay()
+        if delay is None:
+            return
+        if delay <= 0:
+            manager.flush()
+        del manager
+        if delay > 0:
+            time.sleep(delay)
+
+
+class TimedBatchCursorManager(CursorManager):
+    """A cursor manager that kills cursors in batches, by size and by age.
+
+    Closed cursors are killed with a single message once
+    :attr:`max_batch_size` of them are waiting, or once the oldest of them
+    has been waiting for :attr:`max_delay` seconds, whichever comes first.
+    The delay is enforced by a background thread that only runs while there
+    are cursors waiting to be killed.
+
+    Each cursor id is only ever sent to the server it was closed on: if the
+    connection has moved to a different server (e.g. after a failover) by the
+    time the batch is flushed those ids are dropped rather than being sent to
+    a server that doesn't own them.
+
+    To use different limits, subclass and override :attr:`max_batch_size`
+    and :attr:`max_delay` before passing the class to
+    :meth:`~pymongo.connection.Connection.set_cursor_manager`.
+
+    .. versionadded:: 1.3+
+    """
+
+    max_batch_size = 100
+    """Kill waiting cursors once this many have been closed."""
+
+    max_delay = 1.0
+    """Kill waiting cursors once the oldest has waited this many seconds."""
+
+    def __init__(self, connection):
+        """Instantiate the manager.
+
+        :Parameters:
+          - `connection`: a Mongo Connection
+        """
+        CursorManager.__init__(self, connection)
+        self.__connection = connection
+
+        self.__lock = threading.Lock()
+        # (host, port) -> list of cursor ids waiting to be killed
+        self.__pending = {}
+        self.__pending_count = 0
+        self.__oldest = None
+        self.__thread = None
+
+        self.__closed = 0
+        self.__killed = 0
+        self.__messages = 0
+        self.__dropped = 0
+        self.__errors = 0
+
+    def __del__(self):
+        """Cleanup - be sure to kill any outstanding cursors.
+        """
+        try:
+            self.flush()
+        except Exception:
+            pass
+
+    def close(self, cursor_id):
+        """Close a cursor by adding it to the next batch to be killed.
+
+        Raises TypeError if cursor_id is not an instance of (int, long).
+
+        :Parameters:
+          - `cursor_id`: cursor id to close
+        """
+        if not isinstance(cursor_id, int):
+            raise TypeError("cursor_id must be an instance of (int, long)")
+
+        address = self.__connection._address
+        self.__lock.acquire()
+        try:
+            self.__pending.setdefault(address, []).append(cursor_id)
+            self.__pending_count += 1
+            self.__closed += 1
+            if self.__oldest is None:
+                self.__oldest = time.time()
+
+            full = self.__pending_count >= self.max_batch_size
+            if not full and self.__thread is None:
+                self.__thread = threading.Thread(target=_flush_when_due,
+                                                 args=(weakref.ref(self),))
+                self.__thread.daemon = True
+                self.__thread.start()
+        finally:
+            self.__lock.release()
+
+        if full:
+            self.flush()
+
+    def _flush_delay(self):
+        """Seconds until the waiting cursors are due to be killed.
+
+        Returns None, and forgets about the calling thread, if there is
+        nothing waiting.
+        """
+        self.__lock.acquire()
+        try:
+            if self.__oldest is None:
+                self.__thread = None
+                return None
+            return self.__oldest + self.max_delay - time.time()
+        finally:
+            self.__lock.release()
+
+    def flush(self):
+        """Kill all of the cursors that are waiting to be killed now.
+
+        Sends one message per server.
+        """
+        self.__lock.acquire()
+        try:
+            pending = self.__pending
+            self.__pending = {}
+            self.__pending_count = 0
+            self.__oldest = None
+        finally:
+            self.__lock.release()
+
+        if not pending:
+            return
+
+        killed = messages = dropped = errors = 0
+        current = self.__connection._address
+        for (address, cursor_ids) in pending.items():
+            if address != current:
+                dropped += len(cursor_ids)
+                continue
+            try:
+                self.__connection.kill_cursors(cursor_ids)
+            except ConnectionFailure:
+                errors += 1
+                dropped += len(cursor_ids)
+            else:
+                messages += 1
+                killed += len(cursor_ids)
+
+        self.__lock.acquire()
+        try:
+            self.__killed += killed
+            self.__messages += messages
+            self.__dropped += dropped
+            self.__errors += errors
+        finally:
+            self.__lock.release()
+
+    def stats(self):
+        """Counters describing what this manager has done.
+
+        A dictionary with the number of cursors ``"closed"``, ``"killed"``,
+        ``"pending"`` (closed but not killed yet) and ``"dropped"`` (not
+        killed because their server is gone or couldn't be reached), the
+        number of kill cursors ``"messages"`` sent and the number of
+        ``"errors"`` sending them.
+        """
+        self.__lock.acquire()
+        try:
+            return {"closed": self.__closed,
+                    "killed": self.__killed,
+                    "pending": self.__pending_count,
+                    "dropped": self.__dropped,
+                    "messages": self.__messages,
+                    "errors": self.__errors}
+        finally:
+            self.__lock.release()
+    stats = property(stats)
+
+
+class CursorInfo(object):
+    """What a :class:`CursorRegistry` knows about one open cursor.
+
+    .. versionadded:: 1.3+
+    """
+
+    def __init__(self, cursor, cursor_id, namespace, no_timeout, stack,
+                 connection_id=None):
+        self.__cursor = weakref.ref(cursor)
+        self.__cursor_id = cursor_id
+        self.__connection_id = connection_id
+        self.__namespace = namespace
+        self.__no_timeout = no_timeout
+        self.__stack = stack
+        self.__created = time.time()
+        self.__last_used = self.__created
+        self.__documents = 0
+        self.__bytes = 0
+
+    def _update(self, nbytes, ndocuments):
+        self.__last_used = time.time()
+        self.__bytes += nbytes
+        self.__documents += ndocuments
+
+    def cursor(self):
+        """The :class:`~pymongo.cursor.Cursor`, or None if it has already
+        been garbage collected.
+        """
+        return self.__cursor()
+    cursor = property(cursor)
+
+    def cursor_id(self):
+        """The server side id of the cursor.
+        """
+        return self.__cursor_id
+    cursor_id = property(cursor_id)
+
+    def connection_id(self):
+        """Id of the connection the cursor was opened on, for a
+        :class:`~pymongo.master_slave_connection.MasterSlaveConnection`,
+        otherwise None.
+        """
+        return self.__connection_id
+    connection_id = property(connection_id)
+
+    def namespace(self):
+        """Full name of the collection being queried.
+        """
+        return self.__namespace
+    namespace = property(namespace)
+
+    def no_timeout(self):
+        """Was the cursor opened with ``timeout=False``? The server will never
+        time these out on its own.
+        """
+        return self.__no_timeout
+    no_timeout = property(no_timeout)
+
+    def age(self):
+        """Seconds since the server opened the cursor.
+        """
+        return time.time() - self.__created
+    age = property(age)
+
+    def idle(self):
+        """Seconds since the last batch was retrieved from the cursor.
+        """
+        return time.time() - self.__last_used
+    idle = property(idle)
+
+    def documents(self):
+        """Number of documents retrieved so far.
+        """
+        return self.__documents
+    documents = property(documents)
+
+    def bytes(self):
+        """Number of bytes of replies retrieved so far.
+        """
+        return self.__bytes
+    bytes = property(bytes)
+
+    def stack(self):
+        """The stack (as a string) of the code that opened the cursor.
+        """
+        return "".join(self.__stack.format())
+    stack = property(stack)
+
+    def __repr__(self):
+        return ("CursorInfo(%r, %r, age=%.1f, idle=%.1f, bytes=%d)" %
+                (self.__namespace, self.__cursor_id, self.age, self.idle,
+                 self.__bytes))
+
+
+def _in_driver(item):
+    """Is the ``(frame, line number)`` `item` in the driver itself?
+    """
+    return os.path.abspath(item[0].f_code.co_filename).startswith(_DRIVER)
+
+
+def _opening_stack(limit):
+    """The calling stack, innermost frame last, without the frames in the
+    driver itself.
+    """
+    frames = itertools.dropwhile(_in_driver, traceback.walk_stack(None))
+    stack = traceback.StackSummary.extract(frames, limit=limit,
+                                           lookup_lines=False)
+    stack.reverse()
+    return stack
+
+
+def _reap(registry_ref, max_idle, interval, stop):
+    """Body of a :class:`CursorRegistry`'s reaper thread.
+    """
+    while not stop.wait(interval):
+        registry = registry_ref()
+        if registry is None:
+            return
+        registry.kill_idle(max_idle)
+        del registry
+
+
+class CursorRegistry(object):
+    """Tracks every cursor that has a cursor open on the server.
+
+    Each :class:`~pymongo.connection.Connection` has one of these, available
+    as :attr:`~pymongo.connection.Connection.cursor_registry`. Cursors are
+    added when the server first returns a cursor id for them and removed once
+    they are exhausted, closed or garbage collected, so anything listed here
+    is pinning memory on the server. Cursors are only weakly referenced.
+
+    :meth:`kill_idle` kills cursors that haven't been used for a while, and
+    :meth:`start_reaper` does that periodically from a background thread.
+    A killed cursor stops once it has returned the data it already
+    retrieved, as if the server had closed it.
+
+    .. versionadded:: 1.3+
+    """
+
+    stack_depth = 16
+    """Number of frames of the opening stack to keep for each cursor."""
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        # id(cursor) -> CursorInfo
+        self.__cursors = {}
+        self.__reaper_stop = None
+
+    def _track(self, cursor, cursor_id, namespace, no_timeout,
+               nbytes, ndocuments, connection_id=None):
+        """Record a reply for `cursor`.
+
+        Called by the cursor after each reply. Starts tracking the cursor
+        the first time the server returns an id for it, stops when it
+        returns 0.
+        """
+        key = id(cursor)
+        if not cursor_id:
+            # most queries never open a cursor, don't take the lock for them
+            if key in self.__cursors:
+                self._untrack(cursor)
+            return
+
+        self.__lock.acquire()
+        try:
+            info = self.__cursors.get(key)
+        finally:
+            self.__lock.release()
+
+        if info is None or info.cursor_id != cursor_id:
+            info = CursorInfo(cursor, cursor_id, namespace, no_timeout,
+                              _opening_stack(self.stack_depth),
+                              connection_id)
+            self.__lock.acquire()
+            try:
+                self.__cursors[key] = info
+            finally:
+                self.__lock.release()
+
+        info._update(nbytes, ndocuments)
+
+    def _untrack(self, cursor):
+        """Stop tracking `cursor`.
+
+        Returns False if it wasn't being tracked, e.g. because
+        :meth:`kill_idle` has already killed it.
+        """
+        self.__lock.acquire()
+        try:
+            return self.__cursors.pop(id(cursor), None) is not None
+        finally:
+            self.__lock.release()
+
+    def _tracking(self, cursor):
+        """Is `cursor` being tracked (i.e. not killed by :meth:`kill_idle`)?
+        """
+        return id(cursor) in self.__cursors
+
+    def __len__(self):
+        return len(self.__cursors)
+
+    def cursors(self, min_idle=0):
+        """Get a list of :class:`CursorInfo` for the open cursors.
+
+        Sorted with the longest idle first.
+
+        :Parameters:
+          - `min_idle` (optional): only include cursors that have been idle
+            for at least this many seconds
+        """
+        self.__lock.acquire()
+        try:
+            infos = list(self.__cursors.values())
+        finally:
+            self.__lock.release()
+
+        infos = [info for info in infos
+                 if info.cursor is not None and info.idle >= min_idle]
+        infos.sort(key=lambda info: info.idle, reverse=True)
+        return infos
+
+    def kill_idle(self, max_idle):
+        """Kill every cursor that has been idle for `max_idle` seconds.
+
+        The cursors are killed on the server (according to their
+        connection's cursor manager) and stop being tracked, but aren't
+        touched otherwise - this is safe to call while other threads are
+        using them. Returns the number of cursors that were killed.
+
+        :Parameters:
+          - `max_idle`: kill cursors idle for at least this many seconds
+        """
+        idle = []
+        self.__lock.acquire()
+        try:
+            for (key, info) in list(self.__cursors.items()):
+                cursor = info.cursor
+                # a collected cursor kills itself
+                if cursor is not None and info.idle >= max_idle:
+                    del self.__cursors[key]
+                    idle.append((cursor.collection.database.connection,
+                                 info))
+        finally:
+            self.__lock.release()
+
+        killed = 0
+        for (connection, info) in idle:
+            try:
+                if info.connection_id is not None:
+                    connection.close_cursor(info.cursor_id,
+                                            info.connection_id)
+                else:
+                    connection.close_cursor(info.cursor_id)
+            except ConnectionFailure:
+                # the cursor went away with the connection
+                continue
+            killed += 1
+        return killed
+
+    def start_reaper(self, max_idle, interval=None):
+        """Start a background thread that periodically calls
+        :meth:`kill_idle`.
+
+        Any reaper that was already running is stopped first.
+
+        :Parameters:
+          - `max_idle`: kill cursors idle for at least this many seconds
+          - `interval` (optional): seconds between checks, defaults to half
+            of `max_idle`
+        """
+        if interval is None:
+            interval = max_idle / 2.0
+        self.stop_reaper()
+
+        stop = threading.Event()
+        thread = threading.Thread(target=_reap,
+                                  args=(weakref.ref(self), max_idle,
+                                        interval, stop))
+        thread.daemon = True
+        thread.start()
+        self.__reaper_stop = stop
+
+    def stop_reaper(self):
+        """Stop the reaper thread started by :meth:`start_reaper`, if any.
+        """
+        if self.__reaper_stop is not None:
+            self.__reaper_stop.set()
+            self.__reaper_stop = None
+
+    def __del__(self):
+        self.stop_reaper()
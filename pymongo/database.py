@@ -24,9 +24,45 @@ from .son_manipulator import ObjectIdInjector, ObjectIdShuffler
 from .collection import Collection
 from .errors import InvalidName, CollectionInvalid, OperationFailure
 from .code import Code
+from . import bson
 from . import helpers
 
 
+def _no_op(son_or_sons, collection):
+    return son_or_sons
+
+
+def _compile(manipulators, method):
+    """Compile a chain of manipulators into a single function.
+
+    The function takes ``(son_or_sons, collection)`` and calls `method` on
+    each of `manipulators` in turn.
+    """
+    transforms = [getattr(manipulator, method)
+                  for manipulator in manipulators]
+    if not transforms:
+        return _no_op
+    if len(transforms) == 1:
+        return transforms[0]
+
+    def apply(son_or_sons, collection):
+        for transform in transforms:
+            son_or_sons = transform(son_or_sons, collection)
+        return son_or_sons
+    return apply
+
+
+def _id_key(value):
+    """A hashable key for the ``_id`` `value`: its BSON encoding, with
+    numbers normalized first.
+
+    Ids the server matches with each other (``1`` and ``1.0``) get the same
+    key, ids that are only equal in Python (``1`` and ``True``) get
+    different keys, and embedded documents can be used as keys too.
+    """
+    return bson.BSON.from_dict({"_id": helpers._canonical(value)})
+
+
 class Database(object):
     """A Mongo database.
     """
@@ -48,6 +84,8 @@ class Database(object):
 
         self.__name = str(name)
         self.__connection = connection
+        # Collection instances handed out by __getattr__
+        self.__collections = {}
         # TODO remove the callable_value wrappers after deprecation is complete
         self.__name_w = helpers.callable_value(self.__name, "Database.name")
         self.__connection_w = helpers.callable_value(self.__connection, "Database.connection")
@@ -58,6 +96,26 @@ class Database(object):
         self.__outgoing_copying_manipulators = []
         self.add_son_manipulator(ObjectIdInjector())
 
+    def __compile_manipulators(self):
+        """Build the functions used to apply our manipulators.
+
+        Called whenever the manipulators change, so that applying them is a
+        single call: no manipulators is a no-op and a single manipulator is
+        called directly, with no loops over (empty) lists in between.
+        """
+        incoming = (self.__incoming_manipulators +
+                    self.__incoming_copying_manipulators)
+        outgoing = (list(helpers._reversed(self.__outgoing_manipulators)) +
+                    list(helpers._reversed(
+                        self.__outgoing_copying_manipulators)))
+
+        self.__fix_incoming = _compile(incoming, "transform_incoming")
+        self.__fix_incoming_many = _compile(incoming,
+                                            "transform_incoming_many")
+        self.__fix_outgoing = _compile(outgoing, "transform_outgoing")
+        self.__fix_outgoing_many = _compile(outgoing,
+                                            "transform_outgoing_many")
+
     def __check_name(self, name):
         for invalid_char in [" ", ".", "$", "/", "\\"]:
             if invalid_char in name:
@@ -70,24 +128,43 @@ class Database(object):
         """Add a new son manipulator to this database.
 
         Newly added manipulators will be applied before existing ones.
+        Adding a manipulator that has already been added does nothing.
 
         :Parameters:
           - `manipulator`: the manipulator to add
+
+        .. versionchanged:: 1.3+
+           Adding the same manipulator instance again is a no-op. Every
+           lookup of a database on a connection returns the same
+           :class:`Database`, so code that adds its manipulators on each
+           lookup would otherwise stack duplicates.
         """
         def method_overwritten(instance, method):
             return getattr(instance, method) != getattr(super(instance.__class__, instance), method)
 
+        def overwritten(instance, direction):
+            return (method_overwritten(instance, "transform_" + direction) or
+                    method_overwritten(instance,
+                                       "transform_%s_many" % direction))
+
+        for manipulators in (self.__incoming_manipulators,
+                             self.__incoming_copying_manipulators,
+                             self.__outgoing_manipulators,
+                             self.__outgoing_copying_manipulators):
+            if manipulator in manipulators:
+                return
 
         if manipulator.will_copy():
-            if method_overwritten(manipulator, "transform_incoming"):
+            if overwritten(manipulator, "incoming"):
                 self.__incoming_copying_manipulators.insert(0, manipulator)
-            if method_overwritten(manipulator, "transform_outgoing"):
+            if overwritten(manipulator, "outgoing"):
                 self.__outgoing_copying_manipulators.insert(0, manipulator)
         else:
-            if method_overwritten(manipulator, "transform_incoming"):
+            if overwritten(manipulator, "incoming"):
                 self.__incoming_manipulators.insert(0, manipulator)
-            if method_overwritten(manipulator, "transform_outgoing"):
+            if overwritten(manipulator, "outgoing"):
                 self.__outgoing_manipulators.insert(0, manipulator)
+        self.__compile_manipulators()
 
     def connection(self):
         """The :class:`~pymongo.connection.Connection` instance for this
@@ -128,8 +205,18 @@ class Database(object):
 
         :Parameters:
           - `name`: the name of the collection to get
+
+        .. versionchanged:: 1.3+
+           The same :class:`~pymongo.collection.Collection` instance is
+           returned for every lookup of `name`. Names starting with an
+           underscore raise :class:`AttributeError` rather than being
+           looked up (use ``database[name]`` for those).
         """
-        return Collection(self, name)
+        if name.startswith("_"):
+            raise AttributeError("Database has no attribute %r. To access the "
+                                 "%s collection, use database[%r]." %
+                                 (name, name, name))
+        return self.__getitem__(name)
 
     def __getitem__(self, name):
         """Get a collection of this database by name.
@@ -139,7 +226,12 @@ class Database(object):
         :Parameters:
           - `name`: the name of the collection to get
         """
-        return self.__getattr__(name)
+        try:
+            return self.__collections[name]
+        except KeyError:
+            # setdefault is atomic, so racing threads all end up sharing
+            # whichever instance got there first
+            return self.__collections.setdefault(name, Collection(self, name))
 
     def create_collection(self, name, options={}):
         """Create a new collection in this database.
@@ -172,11 +264,18 @@ class Database(object):
           - `son`: the son object going into the database
           - `collection`: the collection the son object is being saved in
         """
-        for manipulator in self.__incoming_manipulators:
-            son = manipulator.transform_incoming(son, collection)
-        for manipulator in self.__incoming_copying_manipulators:
-            son = manipulator.transform_incoming(son, collection)
-        return son
+        return self.__fix_incoming(son, collection)
+
+    def _fix_incoming_many(self, sons, collection):
+        """Apply manipulators to a list of incoming SON objects.
+
+        Returns a list of the transformed objects.
+
+        :Parameters:
+          - `sons`: list of son objects going into the database
+          - `collection`: the collection the son objects are being saved in
+        """
+        return self.__fix_incoming_many(sons, collection)
 
     def _fix_outgoing(self, son, collection):
         """Apply manipulators to a SON object as it comes out of the database.
@@ -185,18 +284,27 @@ class Database(object):
           - `son`: the son object coming out of the database
           - `collection`: the collection the son object was saved in
         """
-        for manipulator in helpers._reversed(self.__outgoing_manipulators):
-            son = manipulator.transform_outgoing(son, collection)
-        for manipulator in helpers._reversed(self.__outgoing_copying_manipulators):
-            son = manipulator.transform_outgoing(son, collection)
-        return son
+        return self.__fix_outgoing(son, collection)
+
+    def _fix_outgoing_many(self, sons, collection):
+        """Apply manipulators to a list of SON objects coming out of the
+        database, like a batch of query results.
+
+        Returns a list of the transformed objects.
+
+        :Parameters:
+          - `sons`: list of son objects coming out of the database
+          - `collection`: the collection the son objects were saved in
+        """
+        return self.__fix_outgoing_many(sons, collection)
 
     def _command(self, command, allowable_errors=[], check=True, sock=None):
         warnings.warn("The '_command' method is deprecated. "
                       "Please use 'command' instead.", DeprecationWarning)
-        return self.command(command, check, allowable_errors, sock)
+        return self.command(command, check, allowable_errors, _sock=sock)
 
-    def command(self, command, check=True, allowable_errors=[], _sock=None):
+    def command(self, command, check=True, allowable_errors=[],
+                deadline=None, _sock=None):
         """Issue a MongoDB command.
 
         Send a command to the database and return the response.
@@ -207,10 +315,13 @@ class Database(object):
             :class:`~pymongo.errors.OperationFailure` if there are any
           - `allowable_errors`: if `check` is ``True``, error messages in this
             list will be ignored by error-checking
+          - `deadline` (optional): seconds the command may take, raising
+            :class:`~pymongo.errors.OperationTimeout` if it takes longer
 
         .. versionadded:: 1.3+
         """
-        result = self["$cmd"].find_one(command, _sock=_sock,
+        result = self["$cmd"].find_one(command, as_class=dict,
+                                       deadline=deadline, _sock=_sock,
                                        _must_use_master=True,
                                        _is_command=True)
 
@@ -224,7 +335,8 @@ class Database(object):
     def collection_names(self):
         """Get a list of all the collection names in this database.
         """
-        results = self["system.namespaces"].find(_must_use_master=True)
+        results = self["system.namespaces"].find(as_class=dict,
+                                                 _must_use_master=True)
         names = [r["name"] for r in results]
         names = [n[len(self.__name) + 1:] for n in names
                  if n.startswith(self.__name + ".")]
@@ -402,18 +514,33 @@ class Database(object):
         to *all* databases. Effectively, "admin" access means root access to
         the database.
 
+        The connection remembers the credentials, and every socket in its
+        pool authenticates with them the first time it is used.
+
         :Parameters:
           - `name`: the name of the user to authenticate
           - `password`: the password of the user to authenticate
+
+        .. versionchanged:: 1.3+
+           Authentication applies to every pooled socket, not just the one
+           the calling thread happens to be using.
         """
         if not isinstance(name, str):
             raise TypeError("name must be an instance of (str, unicode)")
         if not isinstance(password, str):
             raise TypeError("password must be an instance of (str, unicode)")
 
-        result = self.command({"getnonce": 1})
-        nonce = result["nonce"]
         digest = self._password_digest(name, password)
+        return self.__connection._authenticate(self.__name, name, digest)
+
+    def _authenticate_socket(self, name, digest, sock, deadline=None):
+        """Run ``getnonce`` and ``authenticate`` on `sock`.
+
+        Returns True if the credentials were accepted.
+        """
+        result = self.command({"getnonce": 1}, _sock=sock,
+                              deadline=helpers._time_left(deadline))
+        nonce = result["nonce"]
         md5hash = _md5func()
         md5hash.update(("%s%s%s" % (nonce, str(name), digest)).encode())
         key = str(md5hash.hexdigest())
@@ -421,7 +548,8 @@ class Database(object):
             result = self.command(SON([("authenticate", 1),
                                        ("user", str(name)),
                                        ("nonce", nonce),
-                                       ("key", key)]))
+                                       ("key", key)]), _sock=sock,
+                                  deadline=helpers._time_left(deadline))
             return True
         except OperationFailure:
             return False
@@ -430,8 +558,12 @@ class Database(object):
         """Deauthorize use of this database for this connection.
 
         Note that other databases may still be authorized.
+
+        .. versionchanged:: 1.3+
+           Every pooled socket is logged out, not just the one the calling
+           thread happens to be using.
         """
-        self.command({"logout": 1})
+        self.__connection._logout(self.__name)
 
     def dereference(self, dbref):
         """Dereference a DBRef, getting the SON object it points to.
@@ -452,6 +584,50 @@ class Database(object):
                                                                self.__name))
         return self[dbref.collection].find_one({"_id": dbref.id})
 
+    def dereference_many(self, dbrefs):
+        """Dereference a list of DBRefs, getting the SON objects they point to.
+
+        References are grouped by collection and each collection is queried
+        once, using ``$in``, rather than once per reference. Returns a list
+        with the object (or None) for each reference in `dbrefs`, in the same
+        order. References that appear more than once resolve to the same
+        object.
+
+        Raises TypeError if any of `dbrefs` is not an instance of DBRef.
+        Raises ValueError if any of them has a database specified that is
+        different from the current database.
+
+        :Parameters:
+          - `dbrefs`: list of references
+
+        .. versionadded:: 1.3+
+        """
+        dbrefs = list(dbrefs)
+        ids_by_collection = {}
+        keys = []
+        for dbref in dbrefs:
+            if not isinstance(dbref, DBRef):
+                raise TypeError("cannot dereference a %s" % type(dbref))
+            if dbref.database is not None and dbref.database != self.__name:
+                raise ValueError("trying to dereference a DBRef that points "
+                                 "to another database (%r not %r)" %
+                                 (dbref.database, self.__name))
+            key = _id_key(dbref.id)
+            keys.append((dbref.collection, key))
+            ids_by_collection.setdefault(dbref.collection, {})[key] = dbref.id
+
+        found = {}
+        for (collection, ids) in ids_by_collection.items():
+            ids = list(ids.values())
+            if len(ids) == 1:
+                spec = {"_id": ids[0]}
+            else:
+                spec = {"_id": {"$in": ids}}
+            for document in self[collection].find(spec):
+                found[(collection, _id_key(document["_id"]))] = document
+
+        return [found.get(key) for key in keys]
+
     def eval(self, code, *args):
         """Evaluate a JavaScript expression on the Mongo server.
 
@@ -32,6 +32,18 @@ class AutoReconnect(ConnectionFailure):
     """
 
 
+class OperationTimeout(ConnectionFailure):
+    """Raised when an operation doesn't finish by the deadline it was given.
+
+    The operation may or may not have been carried out by the server. The
+    connection itself is still fine - it isn't reset and the operation isn't
+    retried - but a socket that was left in the middle of a message is
+    closed.
+
+    .. versionadded:: 1.3+
+    """
+
+
 class ConfigurationError(Exception):
     """Raised when something is incorrectly configured.
     """
@@ -42,6 +54,14 @@ class OperationFailure(Exception):
     """
 
 
+class CursorNotFound(OperationFailure):
+    """Raised when the server no longer knows about a cursor, e.g. because
+    it timed out or was killed.
+
+    .. versionadded:: 1.3+
+    """
+
+
 class InvalidOperation(Exception):
     """Raised when a client attempts to perform an invalid operation.
     """
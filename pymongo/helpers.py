@@ -16,10 +16,12 @@
 
 import sys
 import struct
+import time
 import warnings
 
 from .son import SON
-from .errors import OperationFailure, AutoReconnect
+from .errors import (OperationFailure, AutoReconnect, OperationTimeout,
+                     CursorNotFound)
 from . import bson
 import pymongo
 
@@ -69,7 +71,24 @@ if sys.version_info[:3] >= (2, 4, 0):
     _reversed = reversed
 
 
-def _unpack_response(response, cursor_id=None):
+def _canonical(value):
+    """`value` with numbers that the server considers equal (e.g. ``1`` and
+    ``1.0``) converted to the same type, so that they encode the same.
+    """
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, float) and value.is_integer() and \
+            -2 ** 63 <= value < 2 ** 63:
+        return int(value)
+    if isinstance(value, dict):
+        return dict([(k, _canonical(v)) for (k, v) in value.items()])
+    if isinstance(value, list):
+        return [_canonical(v) for v in value]
+    return value
+
+
+def _unpack_response(response, cursor_id=None, as_class=dict,
+                     raw_dates=False, raw=False):
     """Unpack a response from the database.
 
     Check the response for errors and unpack, returning a dictionary
@@ -80,14 +99,18 @@ def _unpack_response(response, cursor_id=None):
       - `cursor_id` (optional): cursor_id we sent to get this response -
         used for raising an informative exception when we get cursor id not
         valid at server response
+      - `as_class` (optional): class to use for resulting documents
+      - `raw_dates` (optional): decode dates as ``int`` milliseconds
+      - `raw` (optional): don't decode the documents, "data" is the BSON
+        bytes of all of them
     """
     response_flag = struct.unpack("<i", response[:4])[0]
     if response_flag == 1:
         # Shouldn't get this response if we aren't doing a getMore
         assert cursor_id is not None
 
-        raise OperationFailure("cursor id '%s' not valid at server" %
-                               cursor_id)
+        raise CursorNotFound("cursor id '%s' not valid at server" %
+                             cursor_id)
     elif response_flag == 2:
         error_object = bson.BSON(response[20:]).to_dict()
         if error_object["$err"] == "not master":
@@ -101,11 +124,49 @@ def _unpack_response(response, cursor_id=None):
     result["cursor_id"] = struct.unpack("<q", response[4:12])[0]
     result["starting_from"] = struct.unpack("<i", response[12:16])[0]
     result["number_returned"] = struct.unpack("<i", response[16:20])[0]
-    result["data"] = bson._to_dicts(response[20:])
+    if raw:
+        result["data"] = response[20:]
+        return result
+    result["data"] = bson._to_dicts(response[20:], as_class, raw_dates)
     assert len(result["data"]) == result["number_returned"]
     return result
 
 
+def _deadline(seconds):
+    """The :func:`time.monotonic` by which an operation that is allowed
+    `seconds` must finish, or None if `seconds` is None.
+
+    Deadlines use the monotonic clock, like socket timeouts, so that steps
+    of the wall clock don't make them pass early or never.
+    """
+    if seconds is None:
+        return None
+    if not isinstance(seconds, (int, float)) or isinstance(seconds, bool):
+        raise TypeError("deadline must be an instance of (int, float)")
+    if seconds <= 0:
+        raise ValueError("deadline must be positive")
+    return time.monotonic() + seconds
+
+
+def _time_left(deadline):
+    """Seconds left until `deadline`, or None if there isn't one.
+
+    Raises OperationTimeout if the deadline has already passed.
+    """
+    if deadline is None:
+        return None
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise OperationTimeout("operation exceeded its deadline")
+    return remaining
+
+
+def _timed_out(deadline):
+    """Has `deadline` passed?
+    """
+    return deadline is not None and time.monotonic() >= deadline
+
+
 # These two functions are some magic to get values we can use for deprecating
 # method style access in favor of property style access while remaining
 # backwards compatible.
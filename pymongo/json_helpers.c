@@ -0,0 +1,1538 @@
+/*
+ * Copyright 2009 10gen, Inc.
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ * http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+/*
+ * BSON <-> JSON transcoding, without building any Python objects.
+ *
+ * The JSON produced matches json.dumps(doc, default=json_util.default)
+ * (ASCII only, ", " and ": " separators, floats formatted like repr()), and
+ * uses Mongo Extended JSON's Strict mode for types json_util doesn't cover.
+ */
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <math.h>
+
+#include "json_helpers.h"
+
+/* TODO our platform better be little-endian w/ 4-byte ints! */
+
+#define MAX_DEPTH 1000
+
+typedef struct {
+    char* buffer;
+    int size;
+    int position;
+} json_buffer;
+
+static int jb_init(json_buffer* jb, int size) {
+    jb->buffer = (char*)malloc(size);
+    jb->size = size;
+    jb->position = 0;
+    return jb->buffer != NULL;
+}
+
+static int jb_grow(json_buffer* jb, int needed) {
+    int size = jb->size;
+    char* buffer;
+    while (size - jb->position < needed) {
+        size *= 2;
+        if (size <= 0) {
+            return 0;
+        }
+    }
+    buffer = (char*)realloc(jb->buffer, size);
+    if (!buffer) {
+        return 0;
+    }
+    jb->buffer = buffer;
+    jb->size = size;
+    return 1;
+}
+
+static int jb_write(json_buffer* jb, const char* data, int length) {
+    if (jb->size - jb->position < length && !jb_grow(jb, length)) {
+        return 0;
+    }
+    memcpy(jb->buffer + jb->position, data, length);
+    jb->position += length;
+    return 1;
+}
+
+#define JB_WRITE_STR(jb, s) jb_write((jb), (s), (int)strlen(s))
+
+static int jb_write_char(json_buffer* jb, char c) {
+    return jb_write(jb, &c, 1);
+}
+
+/* Reserve `length` bytes, returning their position or -1. */
+static int jb_reserve(json_buffer* jb, int length) {
+    int position = jb->position;
+    if (jb->size - jb->position < length && !jb_grow(jb, length)) {
+        return -1;
+    }
+    jb->position += length;
+    return position;
+}
+
+typedef struct {
+    json_result_t result;
+    const char* message;
+    int position;
+} json_error;
+
+static int fail(json_error* error, json_result_t result,
+                const char* message, int position) {
+    error->result = result;
+    error->message = message;
+    error->position = position;
+    return 0;
+}
+
+static const char hex_digits[] = "0123456789abcdef";
+
+/*
+ * BSON -> JSON
+ */
+
+/* Write UTF-8 `data` as a JSON string literal, escaping like
+ * json.encoder.encode_basestring_ascii. */
+static int write_json_string(json_buffer* jb, const unsigned char* data,
+                             int length, json_error* error, int offset) {
+    int i = 0;
+    if (!jb_write_char(jb, '"')) {
+        return fail(error, JSON_NO_MEMORY, NULL, 0);
+    }
+    while (i < length) {
+        unsigned char c = data[i];
+        unsigned long code_point;
+        int extra, j;
+        char escape[16];
+
+        if (c >= 0x20 && c < 0x7F && c != '"' && c != '\\') {
+            /* write the run of plain characters in one go */
+            int start = i;
+            while (i < length && data[i] >= 0x20 && data[i] < 0x7F &&
+                   data[i] != '"' && data[i] != '\\') {
+                i++;
+            }
+            if (!jb_write(jb, (const char*)data + start, i - start)) {
+                return fail(error, JSON_NO_MEMORY, NULL, 0);
+            }
+            continue;
+        }
+
+        switch (c) {
+        case '"': strcpy(escape, "\\\""); break;
+        case '\\': strcpy(escape, "\\\\"); break;
+        case '\n': strcpy(escape, "\\n"); break;
+        case '\r': strcpy(escape, "\\r"); break;
+        case '\t': strcpy(escape, "\\t"); break;
+        case '\b': strcpy(escape, "\\b"); break;
+        case '\f': strcpy(escape, "\\f"); break;
+        default:
+            escape[0] = 0;
+        }
+        if (escape[0]) {
+            if (!JB_WRITE_STR(jb, escape)) {
+                return fail(error, JSON_NO_MEMORY, NULL, 0);
+            }
+            i++;
+            continue;
+        }
+
+        /* decode a UTF-8 sequence */
+        if (c < 0x80) {
+            code_point = c;
+            extra = 0;
+        } else if ((c & 0xE0) == 0xC0) {
+            code_point = c & 0x1F;
+            extra = 1;
+        } else if ((c & 0xF0) == 0xE0) {
+            code_point = c & 0x0F;
+            extra = 2;
+        } else if ((c & 0xF8) == 0xF0) {
+            code_point = c & 0x07;
+            extra = 3;
+        } else {
+            return fail(error, JSON_INVALID_BSON, "invalid UTF-8", offset + i);
+        }
+        if (i + extra >= length + (extra ? 0 : 1)) {
+            return fail(error, JSON_INVALID_BSON, "invalid UTF-8", offset + i);
+        }
+        for (j = 1; j <= extra; j++) {
+            if ((data[i + j] & 0xC0) != 0x80) {
+                return fail(error, JSON_INVALID_BSON, "invalid UTF-8",
+                            offset + i);
+            }
+            code_point = (code_point << 6) | (data[i + j] & 0x3F);
+        }
+        if (code_point > 0x10FFFF ||
+            (code_point >= 0xD800 && code_point <= 0xDFFF) ||
+            (extra == 1 && code_point < 0x80) ||
+            (extra == 2 && code_point < 0x800) ||
+            (extra == 3 && code_point < 0x10000)) {
+            return fail(error, JSON_INVALID_BSON, "invalid UTF-8", offset + i);
+        }
+        i += extra + 1;
+
+        if (code_point > 0xFFFF) {
+            unsigned long high, low;
+            code_point -= 0x10000;
+            high = 0xD800 | (code_point >> 10);
+            low = 0xDC00 | (code_point & 0x3FF);
+            sprintf(escape, "\\u%04lx\\u%04lx", high, low);
+            if (!jb_write(jb, escape, 12)) {
+                return fail(error, JSON_NO_MEMORY, NULL, 0);
+            }
+        } else {
+            sprintf(escape, "\\u%04lx", code_point);
+            if (!jb_write(jb, escape, 6)) {
+                return fail(error, JSON_NO_MEMORY, NULL, 0);
+            }
+        }
+    }
+    if (!jb_write_char(jb, '"')) {
+        return fail(error, JSON_NO_MEMORY, NULL, 0);
+    }
+    return 1;
+}
+
+/* Format `d` the way Python's repr() does. */
+static void format_double(double d, char* out) {
+    char buffer[40];
+    char digits[20];
+    int precision, exponent, n_digits = 0, i;
+    char* p;
+
+    if (d != d) {
+        strcpy(out, "NaN");
+        return;
+    }
+    if (d == HUGE_VAL) {
+        strcpy(out, "Infinity");
+        return;
+    }
+    if (d == -HUGE_VAL) {
+        strcpy(out, "-Infinity");
+        return;
+    }
+    if (d == 0) {
+        strcpy(out, (1 / d < 0) ? "-0.0" : "0.0");
+        return;
+    }
+
+    /* shortest precision that round trips */
+    for (precision = 1; precision <= 17; precision++) {
+        sprintf(buffer, "%.*e", precision - 1, d);
+        if (strtod(buffer, NULL) == d) {
+            break;
+        }
+    }
+
+    /* split into digits and exponent */
+    p = buffer;
+    if (*p == '-') {
+        *out++ = '-';
+        p++;
+    }
+    for (; *p != 'e'; p++) {
+        if (*p != '.') {
+            digits[n_digits++] = *p;
+        }
+    }
+    exponent = atoi(p + 1);
+    while (n_digits > 1 && digits[n_digits - 1] == '0') {
+        n_digits--;
+    }
+
+    if (exponent < -4 || exponent >= 16) {
+        *out++ = digits[0];
+        if (n_digits > 1) {
+            *out++ = '.';
+            memcpy(out, digits + 1, n_digits - 1);
+            out += n_digits - 1;
+        }
+        sprintf(out, "e%c%02d", exponent < 0 ? '-' : '+',
+                exponent < 0 ? -exponent : exponent);
+    } else if (exponent < 0) {
+        *out++ = '0';
+        *out++ = '.';
+        for (i = -1; i > exponent; i--) {
+            *out++ = '0';
+        }
+        memcpy(out, digits, n_digits);
+        out[n_digits] = 0;
+    } else {
+        for (i = 0; i <= exponent; i++) {
+            *out++ = i < n_digits ? digits[i] : '0';
+        }
+        *out++ = '.';
+        if (n_digits > exponent + 1) {
+            memcpy(out, digits + exponent + 1, n_digits - exponent - 1);
+            out += n_digits - exponent - 1;
+        } else {
+            *out++ = '0';
+        }
+        *out = 0;
+    }
+}
+
+static int write_base64(json_buffer* jb, const unsigned char* data,
+                        int length) {
+    static const char alphabet[] =
+        "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/";
+    int i;
+    char quad[4];
+    for (i = 0; i + 2 < length; i += 3) {
+        quad[0] = alphabet[data[i] >> 2];
+        quad[1] = alphabet[((data[i] & 0x03) << 4) | (data[i + 1] >> 4)];
+        quad[2] = alphabet[((data[i + 1] & 0x0F) << 2) | (data[i + 2] >> 6)];
+        quad[3] = alphabet[data[i + 2] & 0x3F];
+        if (!jb_write(jb, quad, 4)) {
+            return 0;
+        }
+    }
+    if (length - i == 1) {
+        quad[0] = alphabet[data[i] >> 2];
+        quad[1] = alphabet[(data[i] & 0x03) << 4];
+        quad[2] = quad[3] = '=';
+        return jb_write(jb, quad, 4);
+    } else if (length - i == 2) {
+        quad[0] = alphabet[data[i] >> 2];
+        quad[1] = alphabet[((data[i] & 0x03) << 4) | (data[i + 1] >> 4)];
+        quad[2] = alphabet[(data[i + 1] & 0x0F) << 2];
+        quad[3] = '=';
+        return jb_write(jb, quad, 4);
+    }
+    return 1;
+}
+
+static int write_hex(json_buffer* jb, const unsigned char* data, int length) {
+    int i;
+    for (i = 0; i < length; i++) {
+        char pair[2];
+        pair[0] = hex_digits[data[i] >> 4];
+        pair[1] = hex_digits[data[i] & 0x0F];
+        if (!jb_write(jb, pair, 2)) {
+            return 0;
+        }
+    }
+    return 1;
+}
+
+typedef struct {
+    const unsigned char* data;
+    int length;
+    json_buffer* out;
+    json_error* error;
+} bson_reader;
+
+/* Length of the C string at `position`, -1 if it isn't terminated. */
+static int c_string_length(bson_reader* r, int position, int end) {
+    const unsigned char* nul = memchr(r->data + position, 0, end - position);
+    if (!nul) {
+        return -1;
+    }
+    return (int)(nul - (r->data + position));
+}
+
+#define NEED(n) if (end - position < (n)) { \
+        return fail(r->error, JSON_INVALID_BSON, "truncated element", \
+                    position); \
+    }
+#define WRITE(s) if (!JB_WRITE_STR(r->out, (s))) { \
+        return fail(r->error, JSON_NO_MEMORY, NULL, 0); \
+    }
+
+static int json_document(bson_reader* r, int* position_ptr, int end,
+                         int is_array, int depth);
+
+/* BSON string (int32 length + C string) at *position_ptr. */
+static int json_string(bson_reader* r, int* position_ptr, int end) {
+    int position = *position_ptr;
+    int length;
+    NEED(4);
+    memcpy(&length, r->data + position, 4);
+    position += 4;
+    if (length < 1 || end - position < length ||
+        r->data[position + length - 1] != 0) {
+        return fail(r->error, JSON_INVALID_BSON, "bad string length",
+                    position - 4);
+    }
+    if (!write_json_string(r->out, r->data + position, length - 1,
+                           r->error, position)) {
+        return 0;
+    }
+    *position_ptr = position + length;
+    return 1;
+}
+
+static int json_value(bson_reader* r, unsigned char type, int* position_ptr,
+                      int end, int depth) {
+    int position = *position_ptr;
+    char number[64];
+
+    switch (type) {
+    case 0x01:
+        {
+            double d;
+            NEED(8);
+            memcpy(&d, r->data + position, 8);
+            format_double(d, number);
+            WRITE(number);
+            position += 8;
+            break;
+        }
+    case 0x02:
+    case 0x0E:
+        if (!json_string(r, &position, end)) {
+            return 0;
+        }
+        break;
+    case 0x03:
+    case 0x04:
+        if (!json_document(r, &position, end, type == 0x04, depth + 1)) {
+            return 0;
+        }
+        break;
+    case 0x05:
+        {
+            int length;
+            unsigned char subtype;
+            const unsigned char* start;
+            NEED(5);
+            memcpy(&length, r->data + position, 4);
+            subtype = r->data[position + 4];
+            if (length < 0 || end - position - 5 < length) {
+                return fail(r->error, JSON_INVALID_BSON, "bad binary length",
+                            position);
+            }
+            start = r->data + position + 5;
+            position += 5 + length;
+            if (subtype == 2) {
+                /* the old binary subtype repeats the length */
+                if (length < 4) {
+                    return fail(r->error, JSON_INVALID_BSON,
+                                "bad binary length", position);
+                }
+                start += 4;
+                length -= 4;
+            }
+            WRITE("{\"$binary\": \"");
+            if (!write_base64(r->out, start, length)) {
+                return fail(r->error, JSON_NO_MEMORY, NULL, 0);
+            }
+            sprintf(number, "\", \"$type\": \"%02x\"}", subtype);
+            WRITE(number);
+            break;
+        }
+    case 0x06:
+        WRITE("{\"$undefined\": true}");
+        break;
+    case 0x07:
+        NEED(12);
+        WRITE("{\"$oid\": \"");
+        if (!write_hex(r->out, r->data + position, 12)) {
+            return fail(r->error, JSON_NO_MEMORY, NULL, 0);
+        }
+        WRITE("\"}");
+        position += 12;
+        break;
+    case 0x08:
+        NEED(1);
+        WRITE(r->data[position] ? "true" : "false");
+        position += 1;
+        break;
+    case 0x09:
+        {
+            long long millis;
+            NEED(8);
+            memcpy(&millis, r->data + position, 8);
+            sprintf(number, "{\"$date\": \"%lld\"}", millis);
+            WRITE(number);
+            position += 8;
+            break;
+        }
+    case 0x0A:
+        WRITE("null");
+        break;
+    case 0x0B:
+        {
+            int pattern_length = c_string_length(r, position, end);
+            int options_length;
+            const unsigned char* options;
+            char flags[4];
+            int n_flags = 0;
+            if (pattern_length < 0) {
+                return fail(r->error, JSON_INVALID_BSON, "bad regex",
+                            position);
+            }
+            WRITE("{\"$regex\": ");
+            if (!write_json_string(r->out, r->data + position,
+                                   pattern_length, r->error, position)) {
+                return 0;
+            }
+            position += pattern_length + 1;
+            options_length = c_string_length(r, position, end);
+            if (options_length < 0) {
+                return fail(r->error, JSON_INVALID_BSON, "bad regex",
+                            position);
+            }
+            /* same flags, in the same order, as json_util.default */
+            options = r->data + position;
+            if (memchr(options, 'i', options_length)) {
+                flags[n_flags++] = 'i';
+            }
+            if (memchr(options, 'u', options_length)) {
+                flags[n_flags++] = 'u';
+            }
+            if (memchr(options, 'm', options_length)) {
+                flags[n_flags++] = 'm';
+            }
+            flags[n_flags] = 0;
+            sprintf(number, ", \"$options\": \"%s\"}", flags);
+            WRITE(number);
+            position += options_length + 1;
+            break;
+        }
+    case 0x0C:
+        WRITE("{\"$ref\": ");
+        if (!json_string(r, &position, end)) {
+            return 0;
+        }
+        NEED(12);
+        WRITE(", \"$id\": {\"$oid\": \"");
+        if (!write_hex(r->out, r->data + position, 12)) {
+            return fail(r->error, JSON_NO_MEMORY, NULL, 0);
+        }
+        WRITE("\"}}");
+        position += 12;
+        break;
+    case 0x0D:
+        WRITE("{\"$code\": ");
+        if (!json_string(r, &position, end)) {
+            return 0;
+        }
+        WRITE("}");
+        break;
+    case 0x0F:
+        {
+            int length;
+            int code_end;
+            NEED(4);
+            memcpy(&length, r->data + position, 4);
+            if (length < 14 || end - position < length) {
+                return fail(r->error, JSON_INVALID_BSON,
+                            "bad code with scope length", position);
+            }
+            code_end = position + length;
+            position += 4;
+            WRITE("{\"$code\": ");
+            if (!json_string(r, &position, code_end)) {
+                return 0;
+            }
+            WRITE(", \"$scope\": ");
+            if (!json_document(r, &position, code_end, 0, depth + 1)) {
+                return 0;
+            }
+            if (position != code_end) {
+                return fail(r->error, JSON_INVALID_BSON,
+                            "bad code with scope length", position);
+            }
+            WRITE("}");
+            break;
+        }
+    case 0x10:
+        {
+            int i;
+            NEED(4);
+            memcpy(&i, r->data + position, 4);
+            sprintf(number, "%d", i);
+            WRITE(number);
+            position += 4;
+            break;
+        }
+    case 0x11:
+        {
+            unsigned int inc, time;
+            NEED(8);
+            memcpy(&inc, r->data + position, 4);
+            memcpy(&time, r->data + position + 4, 4);
+            sprintf(number, "{\"$timestamp\": {\"t\": %u, \"i\": %u}}",
+                    time, inc);
+            WRITE(number);
+            position += 8;
+            break;
+        }
+    case 0x12:
+        {
+            long long ll;
+            NEED(8);
+            memcpy(&ll, r->data + position, 8);
+            sprintf(number, "%lld", ll);
+            WRITE(number);
+            position += 8;
+            break;
+        }
+    case 0xFF:
+        WRITE("{\"$minKey\": true}");
+        break;
+    case 0x7F:
+        WRITE("{\"$maxKey\": true}");
+        break;
+    default:
+        return fail(r->error, JSON_INVALID_BSON, "unknown element type",
+                    position);
+    }
+    *position_ptr = position;
+    return 1;
+}
+
+static int json_document(bson_reader* r, int* position_ptr, int end,
+                         int is_array, int depth) {
+    int position = *position_ptr;
+    int length;
+    int document_end;
+    int first = 1;
+
+    if (depth > MAX_DEPTH) {
+        return fail(r->error, JSON_INVALID_BSON, "nested too deeply",
+                    position);
+    }
+    NEED(5);
+    memcpy(&length, r->data + position, 4);
+    if (length < 5 || end - position < length ||
+        r->data[position + length - 1] != 0) {
+        return fail(r->error, JSON_INVALID_BSON, "bad document length",
+                    position);
+    }
+    document_end = position + length - 1;
+    position += 4;
+
+    WRITE(is_array ? "[" : "{");
+    while (position < document_end) {
+        unsigned char type = r->data[position];
+        int name_length = c_string_length(r, position + 1, document_end);
+        if (name_length < 0) {
+            return fail(r->error, JSON_INVALID_BSON, "bad element name",
+                        position);
+        }
+        if (!first) {
+            WRITE(", ");
+        }
+        first = 0;
+        if (!is_array) {
+            if (!write_json_string(r->out, r->data + position + 1,
+                                   name_length, r->error, position + 1)) {
+                return 0;
+            }
+            WRITE(": ");
+        }
+        position += name_length + 2;
+        if (!json_value(r, type, &position, document_end, depth)) {
+            return 0;
+        }
+    }
+    if (position != document_end) {
+        return fail(r->error, JSON_INVALID_BSON, "bad document length",
+                    position);
+    }
+    WRITE(is_array ? "]" : "}");
+    *position_ptr = document_end + 1;
+    return 1;
+}
+
+#undef NEED
+#undef WRITE
+
+json_result_t bson_to_json(const char* bson, int length,
+                           char** out, int* out_length,
+                           const char** message, int* position) {
+    json_buffer jb;
+    json_error error;
+    bson_reader reader;
+    int end = 0;
+
+    /* JSON is usually a bit bigger than the BSON */
+    if (!jb_init(&jb, length * 2 + 16)) {
+        return JSON_NO_MEMORY;
+    }
+    reader.data = (const unsigned char*)bson;
+    reader.length = length;
+    reader.out = &jb;
+    reader.error = &error;
+
+    if (!json_document(&reader, &end, length, 0, 0)) {
+        free(jb.buffer);
+        *message = error.message;
+        *position = error.position;
+        return error.result;
+    }
+    if (end != length) {
+        free(jb.buffer);
+        *message = "bad document length";
+        *position = end;
+        return JSON_INVALID_BSON;
+    }
+    *out = jb.buffer;
+    *out_length = jb.position;
+    return JSON_OK;
+}
+
+/*
+ * JSON -> BSON
+ */
+
+typedef struct {
+    const char* start;
+    const char* p;
+    const char* end;
+    json_buffer* out;
+    json_buffer key; /* scratch space for decoded strings */
+    json_error* error;
+} json_parser;
+
+#define OFFSET(parser) ((int)((parser)->p - (parser)->start))
+#define SYNTAX(parser, what) fail((parser)->error, JSON_INVALID_JSON, \
+                                  (what), OFFSET(parser))
+#define NO_MEMORY(parser) fail((parser)->error, JSON_NO_MEMORY, NULL, 0)
+
+static void skip_whitespace(json_parser* parser) {
+    while (parser->p < parser->end &&
+           (*parser->p == ' ' || *parser->p == '\t' ||
+            *parser->p == '\n' || *parser->p == '\r')) {
+        parser->p++;
+    }
+}
+
+static int expect(json_parser* parser, char c) {
+    skip_whitespace(parser);
+    if (parser->p >= parser->end || *parser->p != c) {
+        /* no shared buffers here - we run without the GIL */
+        switch (c) {
+        case ':': return SYNTAX(parser, "expected ':'");
+        case ',': return SYNTAX(parser, "expected ','");
+        case '"': return SYNTAX(parser, "expected '\"'");
+        case '{': return SYNTAX(parser, "expected '{'");
+        case '}': return SYNTAX(parser, "expected ',' or '}'");
+        case ']': return SYNTAX(parser, "expected ',' or ']'");
+        default: return SYNTAX(parser, "unexpected character");
+        }
+    }
+    parser->p++;
+    return 1;
+}
+
+static int peek(json_parser* parser) {
+    skip_whitespace(parser);
+    if (parser->p >= parser->end) {
+        return -1;
+    }
+    return (unsigned char)*parser->p;
+}
+
+static int hex_value(char c) {
+    if (c >= '0' && c <= '9') {
+        return c - '0';
+    }
+    if (c >= 'a' && c <= 'f') {
+        return c - 'a' + 10;
+    }
+    if (c >= 'A' && c <= 'F') {
+        return c - 'A' + 10;
+    }
+    return -1;
+}
+
+static int read_hex4(json_parser* parser, unsigned long* value) {
+    int i;
+    *value = 0;
+    if (parser->end - parser->p < 4) {
+        return SYNTAX(parser, "bad \\u escape");
+    }
+    for (i = 0; i < 4; i++) {
+        int digit = hex_value(parser->p[i]);
+        if (digit < 0) {
+            return SYNTAX(parser, "bad \\u escape");
+        }
+        *value = (*value << 4) | digit;
+    }
+    parser->p += 4;
+    return 1;
+}
+
+static int write_utf8(json_buffer* jb, unsigned long code_point) {
+    char bytes[4];
+    int n;
+    if (code_point < 0x80) {
+        bytes[0] = (char)code_point;
+        n = 1;
+    } else if (code_point < 0x800) {
+        bytes[0] = (char)(0xC0 | (code_point >> 6));
+        bytes[1] = (char)(0x80 | (code_point & 0x3F));
+        n = 2;
+    } else if (code_point < 0x10000) {
+        bytes[0] = (char)(0xE0 | (code_point >> 12));
+        bytes[1] = (char)(0x80 | ((code_point >> 6) & 0x3F));
+        bytes[2] = (char)(0x80 | (code_point & 0x3F));
+        n = 3;
+    } else {
+        bytes[0] = (char)(0xF0 | (code_point >> 18));
+        bytes[1] = (char)(0x80 | ((code_point >> 12) & 0x3F));
+        bytes[2] = (char)(0x80 | ((code_point >> 6) & 0x3F));
+        bytes[3] = (char)(0x80 | (code_point & 0x3F));
+        n = 4;
+    }
+    return jb_write(jb, bytes, n);
+}
+
+/* Decode the JSON string at the parser's position into parser->key
+ * (NUL terminated; key.position is the length without the NUL). Sets
+ * *has_null if it contains "\u0000". */
+static int read_string(json_parser* parser, int* has_null) {
+    json_buffer* key = &parser->key;
+    key->position = 0;
+    *has_null = 0;
+    if (!expect(parser, '"')) {
+        return 0;
+    }
+    while (1) {
+        const char* run = parser->p;
+        char c;
+        while (parser->p < parser->end && *parser->p != '"' &&
+               *parser->p != '\\' && (unsigned char)*parser->p >= 0x20) {
+            parser->p++;
+        }
+        if (!jb_write(key, run, (int)(parser->p - run))) {
+            return NO_MEMORY(parser);
+        }
+        if (parser->p >= parser->end) {
+            return SYNTAX(parser, "unterminated string");
+        }
+        c = *parser->p++;
+        if (c == '"') {
+            break;
+        }
+        if (c != '\\') {
+            parser->p--;
+            return SYNTAX(parser, "invalid control character in string");
+        }
+        if (parser->p >= parser->end) {
+            return SYNTAX(parser, "unterminated string");
+        }
+        c = *parser->p++;
+        switch (c) {
+        case '"': case '\\': case '/':
+            break;
+        case 'b': c = '\b'; break;
+        case 'f': c = '\f'; break;
+        case 'n': c = '\n'; break;
+        case 'r': c = '\r'; break;
+        case 't': c = '\t'; break;
+        case 'u':
+            {
+                unsigned long code_point, low;
+                if (!read_hex4(parser, &code_point)) {
+                    return 0;
+                }
+                if (code_point >= 0xD800 && code_point <= 0xDBFF) {
+                    if (parser->end - parser->p < 6 ||
+                        parser->p[0] != '\\' || parser->p[1] != 'u') {
+                        return SYNTAX(parser, "unpaired surrogate");
+                    }
+                    parser->p += 2;
+                    if (!read_hex4(parser, &low)) {
+                        return 0;
+                    }
+                    if (low < 0xDC00 || low > 0xDFFF) {
+                        return SYNTAX(parser, "unpaired surrogate");
+                    }
+                    code_point = 0x10000 + ((code_point - 0xD800) << 10) +
+                        (low - 0xDC00);
+                } else if (code_point >= 0xDC00 && code_point <= 0xDFFF) {
+                    return SYNTAX(parser, "unpaired surrogate");
+                }
+                if (code_point == 0) {
+                    *has_null = 1;
+                }
+                if (!write_utf8(key, code_point)) {
+                    return NO_MEMORY(parser);
+                }
+                continue;
+            }
+        default:
+            parser->p--;
+            return SYNTAX(parser, "invalid escape");
+        }
+        if (!jb_write_char(key, c)) {
+            return NO_MEMORY(parser);
+        }
+    }
+    if (!jb_write_char(key, 0)) {
+        return NO_MEMORY(parser);
+    }
+    key->position--;
+    return 1;
+}
+
+/* Write the decoded string in parser->key as a BSON string. */
+static int write_bson_string(json_parser* parser) {
+    int length = parser->key.position + 1;
+    if (!jb_write(parser->out, (const char*)&length, 4) ||
+        !jb_write(parser->out, parser->key.buffer, length)) {
+        return NO_MEMORY(parser);
+    }
+    return 1;
+}
+
+/* Read a string value into parser->key, for the special forms. */
+static int read_string_value(json_parser* parser) {
+    int has_null;
+    if (!expect(parser, ':') || !read_string(parser, &has_null)) {
+        return 0;
+    }
+    return 1;
+}
+
+/* Read the next key of a special form, which must be `name`. */
+static int expect_key(json_parser* parser, const char* name) {
+    int has_null;
+    if (!expect(parser, ',') || !read_string(parser, &has_null)) {
+        return 0;
+    }
+    if (strcmp(parser->key.buffer, name)) {
+        return fail(parser->error, JSON_INVALID_JSON,
+                    "unexpected key in extended JSON", OFFSET(parser));
+    }
+    return 1;
+}
+
+/* Parse a JSON number, writing it as an int32, int64 or double. Returns the
+ * BSON type written, or 0 on failure. */
+static int parse_number(json_parser* parser) {
+    const char* start = parser->p;
+    const char* p = parser->p;
+    int is_float = 0;
+    char small[64];
+    char* copy = small;
+    int length;
+
+    if (p < parser->end && *p == '-') {
+        p++;
+    }
+    if (parser->end - p >= 8 && !strncmp(p, "Infinity", 8)) {
+        double d = (*start == '-') ? -HUGE_VAL : HUGE_VAL;
+        parser->p = p + 8;
+        return jb_write(parser->out, (const char*)&d, 8) ? 0x01 :
+            NO_MEMORY(parser);
+    }
+    if (p >= parser->end || *p < '0' || *p > '9') {
+        return SYNTAX(parser, "invalid number");
+    }
+    if (*p == '0') {
+        p++;
+    } else {
+        while (p < parser->end && *p >= '0' && *p <= '9') {
+            p++;
+        }
+    }
+    if (p < parser->end && *p == '.') {
+        is_float = 1;
+        p++;
+        if (p >= parser->end || *p < '0' || *p > '9') {
+            parser->p = p;
+            return SYNTAX(parser, "invalid number");
+        }
+        while (p < parser->end && *p >= '0' && *p <= '9') {
+            p++;
+        }
+    }
+    if (p < parser->end && (*p == 'e' || *p == 'E')) {
+        is_float = 1;
+        p++;
+        if (p < parser->end && (*p == '+' || *p == '-')) {
+            p++;
+        }
+        if (p >= parser->end || *p < '0' || *p > '9') {
+            parser->p = p;
+            return SYNTAX(parser, "invalid number");
+        }
+        while (p < parser->end && *p >= '0' && *p <= '9') {
+            p++;
+        }
+    }
+    parser->p = p;
+
+    length = (int)(p - start);
+    if (length >= (int)sizeof(small)) {
+        copy = (char*)malloc(length + 1);
+        if (!copy) {
+            return NO_MEMORY(parser);
+        }
+    }
+    memcpy(copy, start, length);
+    copy[length] = 0;
+
+    if (is_float) {
+        double d = strtod(copy, NULL);
+        if (copy != small) {
+            free(copy);
+        }
+        return jb_write(parser->out, (const char*)&d, 8) ? 0x01 :
+            NO_MEMORY(parser);
+    } else {
+        /* accumulate negatively so that LLONG_MIN fits */
+        long long value = 0;
+        const long long min = -9223372036854775807LL - 1;
+        int negative = (*copy == '-');
+        const char* digit = copy + negative;
+        int overflow = 0;
+        for (; *digit; digit++) {
+            int d = *digit - '0';
+            if (value < (min + d) / 10) {
+                overflow = 1;
+                break;
+            }
+            value = value * 10 - d;
+        }
+        if (copy != small) {
+            free(copy);
+        }
+        if (!overflow && !negative) {
+            if (value == min) {
+                overflow = 1;
+            } else {
+                value = -value;
+            }
+        }
+        if (overflow) {
+            return fail(parser->error, JSON_OVERFLOW,
+                        "MongoDB can only handle up to 8-byte ints",
+                        (int)(start - parser->start));
+        }
+        if (value >= -2147483647LL - 1 && value <= 2147483647LL) {
+            int i = (int)value;
+            return jb_write(parser->out, (const char*)&i, 4) ? 0x10 :
+                NO_MEMORY(parser);
+        }
+        return jb_write(parser->out, (const char*)&value, 8) ? 0x12 :
+            NO_MEMORY(parser);
+    }
+}
+
+/* Parse a JSON integer (or string of one) into `value`, for $date and
+ * $timestamp. */
+static int read_integer(json_parser* parser, long long* value) {
+    int c = peek(parser);
+    int quoted = (c == '"');
+    int type;
+    int start = parser->out->position;
+
+    if (quoted) {
+        parser->p++;
+    }
+    type = parse_number(parser);
+    if (!type) {
+        return 0;
+    }
+    if (type == 0x10) {
+        int i;
+        memcpy(&i, parser->out->buffer + start, 4);
+        *value = i;
+    } else if (type == 0x12) {
+        memcpy(value, parser->out->buffer + start, 8);
+    } else {
+        double d;
+        memcpy(&d, parser->out->buffer + start, 8);
+        if (d != d || d >= 9223372036854775808.0 ||
+            d < -9223372036854775808.0) {
+            return fail(parser->error, JSON_OVERFLOW,
+                        "date value out of range", OFFSET(parser));
+        }
+        *value = (long long)d;
+    }
+    parser->out->position = start;
+    if (quoted && !expect(parser, '"')) {
+        return 0;
+    }
+    return 1;
+}
+
+static int parse_value(json_parser* parser, int type_byte, int depth);
+
+/* Parse the members of an object after its first key (already decoded in
+ * parser->key), writing a BSON document. */
+static int parse_members(json_parser* parser, int depth) {
+    int length_location = jb_reserve(parser->out, 4);
+    int length;
+    int has_null = 0;
+    if (length_location < 0) {
+        return NO_MEMORY(parser);
+    }
+    while (1) {
+        int type_byte = jb_reserve(parser->out, 1);
+        if (type_byte < 0) {
+            return NO_MEMORY(parser);
+        }
+        if (has_null || memchr(parser->key.buffer, 0, parser->key.position)) {
+            return fail(parser->error, JSON_INVALID_KEY,
+                        "key names must not contain the NULL byte",
+                        OFFSET(parser));
+        }
+        if (!jb_write(parser->out, parser->key.buffer,
+                      parser->key.position + 1)) {
+            return NO_MEMORY(parser);
+        }
+        if (!expect(parser, ':') || !parse_value(parser, type_byte, depth)) {
+            return 0;
+        }
+        if (peek(parser) == ',') {
+            parser->p++;
+            if (!read_string(parser, &has_null)) {
+                return 0;
+            }
+            continue;
+        }
+        if (!expect(parser, '}')) {
+            return 0;
+        }
+        break;
+    }
+    if (!jb_write_char(parser->out, 0)) {
+        return NO_MEMORY(parser);
+    }
+    length = parser->out->position - length_location;
+    memcpy(parser->out->buffer + length_location, &length, 4);
+    return 1;
+}
+
+/* Parse a special (extended JSON) object whose first key, `name`, has just
+ * been read. Returns the BSON type written, -1 if `name` isn't special, or
+ * 0 on failure. */
+static int parse_special(json_parser* parser, int depth) {
+    const char* name = parser->key.buffer;
+
+    if (!strcmp(name, "$oid")) {
+        unsigned char oid[12];
+        int i;
+        if (!read_string_value(parser)) {
+            return 0;
+        }
+        if (parser->key.position != 24) {
+            return SYNTAX(parser, "bad $oid");
+        }
+        for (i = 0; i < 12; i++) {
+            int high = hex_value(parser->key.buffer[2 * i]);
+            int low = hex_value(parser->key.buffer[2 * i + 1]);
+            if (high < 0 || low < 0) {
+                return SYNTAX(parser, "bad $oid");
+            }
+            oid[i] = (unsigned char)((high << 4) | low);
+        }
+        if (!jb_write(parser->out, (const char*)oid, 12)) {
+            return NO_MEMORY(parser);
+        }
+        return expect(parser, '}') ? 0x07 : 0;
+    }
+    if (!strcmp(name, "$date")) {
+        long long millis;
+        if (!expect(parser, ':') || !read_integer(parser, &millis)) {
+            return 0;
+        }
+        if (!jb_write(parser->out, (const char*)&millis, 8)) {
+            return NO_MEMORY(parser);
+        }
+        return expect(parser, '}') ? 0x09 : 0;
+    }
+    if (!strcmp(name, "$regex")) {
+        int has_null;
+        if (!read_string_value(parser)) {
+            return 0;
+        }
+        if (memchr(parser->key.buffer, 0, parser->key.position)) {
+            return fail(parser->error, JSON_INVALID_KEY,
+                        "regex patterns must not contain the NULL byte",
+                        OFFSET(parser));
+        }
+        if (!jb_write(parser->out, parser->key.buffer,
+                      parser->key.position + 1)) {
+            return NO_MEMORY(parser);
+        }
+        if (!expect_key(parser, "$options") || !expect(parser, ':') ||
+            !read_string(parser, &has_null)) {
+            return 0;
+        }
+        if (has_null) {
+            return SYNTAX(parser, "bad $options");
+        }
+        if (!jb_write(parser->out, parser->key.buffer,
+                      parser->key.position + 1)) {
+            return NO_MEMORY(parser);
+        }
+        return expect(parser, '}') ? 0x0B : 0;
+    }
+    if (!strcmp(name, "$binary")) {
+        static const char alphabet[] =
+            "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/";
+        int length_location, start, i, n_bits = 0, padding = 0, length;
+        unsigned int bits = 0;
+        int subtype = 0;
+        int has_null;
+        const char* text;
+
+        if (!read_string_value(parser)) {
+            return 0;
+        }
+        /* length, subtype and (for subtype 2) the length again are filled
+         * in once we've decoded the data */
+        length_location = jb_reserve(parser->out, 9);
+        if (length_location < 0) {
+            return NO_MEMORY(parser);
+        }
+        start = parser->out->position;
+        text = parser->key.buffer;
+        /* padded to a multiple of 4, with at most two '='s and only at the
+         * end - the same as Python's base64.b64decode(..., validate=True) */
+        if (parser->key.position % 4) {
+            return SYNTAX(parser, "bad $binary");
+        }
+        for (i = 0; i < parser->key.position; i++) {
+            const char* found;
+            if (text[i] == '=') {
+                if (++padding > 2) {
+                    return SYNTAX(parser, "bad $binary");
+                }
+                continue;
+            }
+            found = text[i] && !padding ? strchr(alphabet, text[i]) : NULL;
+            if (!found) {
+                return SYNTAX(parser, "bad $binary");
+            }
+            bits = (bits << 6) | (unsigned int)(found - alphabet);
+            n_bits += 6;
+            if (n_bits >= 8) {
+                n_bits -= 8;
+                if (!jb_write_char(parser->out,
+                                   (char)((bits >> n_bits) & 0xFF))) {
+                    return NO_MEMORY(parser);
+                }
+                /* only keep the bits we haven't written yet */
+                bits &= (1u << n_bits) - 1;
+            }
+        }
+        length = parser->out->position - start;
+
+        if (!expect_key(parser, "$type") || !expect(parser, ':') ||
+            !read_string(parser, &has_null)) {
+            return 0;
+        }
+        if (parser->key.position < 1 || parser->key.position > 2) {
+            return SYNTAX(parser, "bad $type");
+        }
+        for (i = 0; i < parser->key.position; i++) {
+            int digit = hex_value(parser->key.buffer[i]);
+            if (digit < 0) {
+                return SYNTAX(parser, "bad $type");
+            }
+            subtype = (subtype << 4) | digit;
+        }
+
+        if (subtype == 2) {
+            int outer = length + 4;
+            memcpy(parser->out->buffer + length_location, &outer, 4);
+            parser->out->buffer[length_location + 4] = 2;
+            memcpy(parser->out->buffer + length_location + 5, &length, 4);
+        } else {
+            /* no second length, shift the data back over it */
+            memcpy(parser->out->buffer + length_location, &length, 4);
+            parser->out->buffer[length_location + 4] = (char)subtype;
+            memmove(parser->out->buffer + length_location + 5,
+                    parser->out->buffer + start, length);
+            parser->out->position -= 4;
+        }
+        return expect(parser, '}') ? 0x05 : 0;
+    }
+    if (!strcmp(name, "$code")) {
+        int length_location = jb_reserve(parser->out, 4);
+        int length;
+        if (length_location < 0) {
+            return NO_MEMORY(parser);
+        }
+        if (!read_string_value(parser) || !write_bson_string(parser)) {
+            return 0;
+        }
+        if (peek(parser) == '}') {
+            /* plain code: drop the length we reserved */
+            parser->p++;
+            memmove(parser->out->buffer + length_location,
+                    parser->out->buffer + length_location + 4,
+                    parser->out->position - length_location - 4);
+            parser->out->position -= 4;
+            return 0x0D;
+        }
+        if (!expect_key(parser, "$scope") || !expect(parser, ':')) {
+            return 0;
+        }
+        if (peek(parser) != '{') {
+            return SYNTAX(parser, "$scope must be an object");
+        }
+        if (!parse_value(parser, -1, depth)) {
+            return 0;
+        }
+        length = parser->out->position - length_location;
+        memcpy(parser->out->buffer + length_location, &length, 4);
+        return expect(parser, '}') ? 0x0F : 0;
+    }
+    if (!strcmp(name, "$timestamp")) {
+        long long t = -1, i = -1;
+        int k, has_null;
+        unsigned int parts[2];
+        if (!expect(parser, ':') || !expect(parser, '{')) {
+            return 0;
+        }
+        for (k = 0; k < 2; k++) {
+            long long* target;
+            if ((k && !expect(parser, ',')) ||
+                !read_string(parser, &has_null)) {
+                return 0;
+            }
+            if (!strcmp(parser->key.buffer, "t")) {
+                target = &t;
+            } else if (!strcmp(parser->key.buffer, "i")) {
+                target = &i;
+            } else {
+                return SYNTAX(parser, "bad $timestamp");
+            }
+            if (!expect(parser, ':') || !read_integer(parser, target)) {
+                return 0;
+            }
+        }
+        if (t < 0 || t > 0xFFFFFFFFLL || i < 0 || i > 0xFFFFFFFFLL) {
+            return SYNTAX(parser, "bad $timestamp");
+        }
+        parts[0] = (unsigned int)i;
+        parts[1] = (unsigned int)t;
+        if (!jb_write(parser->out, (const char*)parts, 8)) {
+            return NO_MEMORY(parser);
+        }
+        return expect(parser, '}') && expect(parser, '}') ? 0x11 : 0;
+    }
+    if (!strcmp(name, "$undefined") || !strcmp(name, "$minKey") ||
+        !strcmp(name, "$maxKey")) {
+        int type = name[1] == 'u' ? 0x06 : (name[2] == 'i' ? 0xFF : 0x7F);
+        int start = parser->out->position;
+        /* the value itself doesn't matter (true or 1) */
+        if (!expect(parser, ':') || !parse_value(parser, -1, depth)) {
+            return 0;
+        }
+        parser->out->position = start;
+        return expect(parser, '}') ? type : 0;
+    }
+    return -1;
+}
+
+/* Parse any JSON value. `type_byte` is where to store the BSON type of the
+ * value written, or -1 for a top level document (which must be an
+ * object). */
+static int parse_value(json_parser* parser, int type_byte, int depth) {
+    int c = peek(parser);
+    int type;
+
+    if (depth > MAX_DEPTH) {
+        return SYNTAX(parser, "nested too deeply");
+    }
+
+    if (type_byte < 0 && c != '{' && depth == 0) {
+        return SYNTAX(parser, "expected an object");
+    }
+
+    switch (c) {
+    case '{':
+        {
+            int has_null;
+            parser->p++;
+            if (peek(parser) == '}') {
+                static const char empty[] = "\x05\x00\x00\x00\x00";
+                parser->p++;
+                if (!jb_write(parser->out, empty, 5)) {
+                    return NO_MEMORY(parser);
+                }
+                type = 0x03;
+                break;
+            }
+            if (!read_string(parser, &has_null)) {
+                return 0;
+            }
+            type = -1;
+            if (type_byte >= 0 && !has_null && parser->key.buffer[0] == '$') {
+                type = parse_special(parser, depth + 1);
+                if (!type) {
+                    return 0;
+                }
+            }
+            if (type < 0) {
+                if (!parse_members(parser, depth + 1)) {
+                    return 0;
+                }
+                type = 0x03;
+            }
+            break;
+        }
+    case '[':
+        {
+            int length_location = jb_reserve(parser->out, 4);
+            int index = 0;
+            int length;
+            if (length_location < 0) {
+                return NO_MEMORY(parser);
+            }
+            parser->p++;
+            if (peek(parser) == ']') {
+                parser->p++;
+            } else {
+                while (1) {
+                    char name[16];
+                    int element_type = jb_reserve(parser->out, 1);
+                    if (element_type < 0) {
+                        return NO_MEMORY(parser);
+                    }
+                    sprintf(name, "%d", index++);
+                    if (!jb_write(parser->out, name, (int)strlen(name) + 1)) {
+                        return NO_MEMORY(parser);
+                    }
+                    if (!parse_value(parser, element_type, depth + 1)) {
+                        return 0;
+                    }
+                    if (peek(parser) == ',') {
+                        parser->p++;
+                        continue;
+                    }
+                    if (!expect(parser, ']')) {
+                        return 0;
+                    }
+                    break;
+                }
+            }
+            if (!jb_write_char(parser->out, 0)) {
+                return NO_MEMORY(parser);
+            }
+            length = parser->out->position - length_location;
+            memcpy(parser->out->buffer + length_location, &length, 4);
+            type = 0x04;
+            break;
+        }
+    case '"':
+        {
+            int has_null;
+            if (!read_string(parser, &has_null) || !write_bson_string(parser)) {
+                return 0;
+            }
+            type = 0x02;
+            break;
+        }
+    case 't':
+    case 'f':
+        {
+            int is_true = (c == 't');
+            const char* word = is_true ? "true" : "false";
+            int length = is_true ? 4 : 5;
+            if (parser->end - parser->p < length ||
+                strncmp(parser->p, word, length)) {
+                return SYNTAX(parser, "invalid literal");
+            }
+            parser->p += length;
+            if (!jb_write_char(parser->out, (char)is_true)) {
+                return NO_MEMORY(parser);
+            }
+            type = 0x08;
+            break;
+        }
+    case 'n':
+        if (parser->end - parser->p < 4 || strncmp(parser->p, "null", 4)) {
+            return SYNTAX(parser, "invalid literal");
+        }
+        parser->p += 4;
+        type = 0x0A;
+        break;
+    case 'N':
+        {
+            double d;
+            if (parser->end - parser->p < 3 || strncmp(parser->p, "NaN", 3)) {
+                return SYNTAX(parser, "invalid literal");
+            }
+            parser->p += 3;
+            /* the same (positive, quiet) NaN Python uses */
+            memcpy(&d, "\x00\x00\x00\x00\x00\x00\xf8\x7f", 8);
+            if (!jb_write(parser->out, (const char*)&d, 8)) {
+                return NO_MEMORY(parser);
+            }
+            type = 0x01;
+            break;
+        }
+    case -1:
+        return SYNTAX(parser, "unexpected end of input");
+    default:
+        if (c == '-' || c == 'I' || (c >= '0' && c <= '9')) {
+            type = parse_number(parser);
+            if (!type) {
+                return 0;
+            }
+            break;
+        }
+        return SYNTAX(parser, "unexpected character");
+    }
+
+    if (type_byte >= 0) {
+        parser->out->buffer[type_byte] = (char)type;
+    }
+    return 1;
+}
+
+json_result_t json_to_bson(const char* json, int length,
+                           char** out, int* out_length,
+                           const char** message, int* position) {
+    json_buffer jb;
+    json_error error;
+    json_parser parser;
+
+    if (!jb_init(&jb, length + 16)) {
+        return JSON_NO_MEMORY;
+    }
+    if (!jb_init(&parser.key, 64)) {
+        free(jb.buffer);
+        return JSON_NO_MEMORY;
+    }
+    parser.start = json;
+    parser.p = json;
+    parser.end = json + length;
+    parser.out = &jb;
+    parser.error = &error;
+
+    if (!parse_value(&parser, -1, 0) ||
+        (peek(&parser) != -1 && !SYNTAX(&parser, "extra data"))) {
+        free(jb.buffer);
+        free(parser.key.buffer);
+        *message = error.message;
+        *position = error.position;
+        return error.result;
+    }
+    free(parser.key.buffer);
+    *out = jb.buffer;
+    *out_length = jb.position;
+    return JSON_OK;
+}
@@ -0,0 +1,45 @@
+/*
+ * Copyright 2009 10gen, Inc.
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ * http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+#ifndef JSON_HELPERS_H
+#define JSON_HELPERS_H
+
+/* Transcoding between BSON and (Mongo Extended) JSON text.
+ *
+ * Neither function touches any Python objects, so callers can release the
+ * GIL around them. On success *out points to a malloc()ed buffer of
+ * *out_length bytes which the caller must free(). On failure *message is
+ * set to a static description of the problem and *position to the offset
+ * in the input where it was found. */
+
+typedef enum {
+    JSON_OK,
+    JSON_NO_MEMORY,
+    JSON_INVALID_BSON,
+    JSON_INVALID_JSON,
+    JSON_INVALID_KEY,
+    JSON_OVERFLOW
+} json_result_t;
+
+json_result_t bson_to_json(const char* bson, int length,
+                           char** out, int* out_length,
+                           const char** message, int* position);
+
+json_result_t json_to_bson(const char* json, int length,
+                           char** out, int* out_length,
+                           const char** message, int* position);
+
+#endif
@@ -34,16 +34,32 @@ Currently this does not handle special encoding and decoding for
 :class:`~pymongo.binary.Binary` and :class:`~pymongo.code.Code`
 instances.
 
+There are also :func:`dumps_bson` and :func:`loads_to_bson`, which go
+straight between BSON bytes and JSON text without building any Python
+objects for the document. Both are implemented in C when the extension is
+available.
+
 .. versionchanged:: 1.2
    Added support for encoding/decoding datetimes and regular expressions.
 """
 
+import base64
+import binascii
 import datetime
 import calendar
+import json
 import re
+import struct
 
 from .objectid import ObjectId
 from .dbref import DBRef
+from .errors import InvalidBSON, InvalidDocument
+
+try:
+    import _cbson
+    _use_c = True
+except ImportError:
+    _use_c = False
 
 # TODO support Binary and Code
 # Binary and Code are tricky because they subclass str so json thinks it can
@@ -94,3 +110,349 @@ def default(obj):
         return {"$regex": obj.pattern,
                 "$options": flags}
     raise TypeError("%r is not JSON serializable" % type(obj))
+
+
+_encode_string = json.encoder.encode_basestring_ascii
+_float_repr = json.encoder.JSONEncoder(allow_nan=True).iterencode
+
+_unpack_int = struct.Struct("<i").unpack_from
+_unpack_uint = struct.Struct("<I").unpack_from
+_unpack_long = struct.Struct("<q").unpack_from
+_unpack_double = struct.Struct("<d").unpack_from
+
+
+def _c_string(data, position):
+    """Decode the C string at `position`, returning it and the position
+    after it.
+    """
+    end = data.index(b"\x00", position)
+    return (data[position:end].decode("utf-8"), end + 1)
+
+
+def _json_string(data, position):
+    """JSON for the BSON string (int32 length + C string) at `position`.
+    """
+    length = _unpack_int(data, position)[0]
+    start = position + 4
+    if length < 1 or data[start + length - 1] != 0:
+        raise InvalidBSON("bad string length")
+    value = data[start:start + length - 1].decode("utf-8")
+    return (_encode_string(value), start + length)
+
+
+def _json_document(data, position, is_array=False):
+    """JSON for the embedded document / array starting at `position`.
+
+    Returns the JSON and the position after the document.
+    """
+    length = _unpack_int(data, position)[0]
+    end = position + length - 1
+    if length < 5 or data[end] != 0:
+        raise InvalidBSON("bad document length")
+    position += 4
+    parts = []
+    while position < end:
+        element_type = data[position]
+        (name, position) = _c_string(data, position + 1)
+        (value, position) = _json_value(element_type, data, position)
+        if is_array:
+            parts.append(value)
+        else:
+            parts.append(_encode_string(name) + ": " + value)
+    if position != end:
+        raise InvalidBSON("bad document length")
+    if is_array:
+        return ("[" + ", ".join(parts) + "]", end + 1)
+    return ("{" + ", ".join(parts) + "}", end + 1)
+
+
+def _json_value(element_type, data, position):
+    """JSON for a value of BSON type `element_type` at `position`.
+
+    Uses the same representations as :func:`default` where there is one,
+    and *Strict* mode Mongo Extended JSON otherwise.
+    """
+    if element_type == 0x01:
+        value = _unpack_double(data, position)[0]
+        return ("".join(_float_repr(value)), position + 8)
+    if element_type in (0x02, 0x0E):
+        return _json_string(data, position)
+    if element_type == 0x03:
+        return _json_document(data, position)
+    if element_type == 0x04:
+        return _json_document(data, position, True)
+    if element_type == 0x05:
+        length = _unpack_int(data, position)[0]
+        subtype = data[position + 4]
+        start = position + 5
+        if subtype == 2:
+            start += 4
+        value = base64.b64encode(data[start:position + 5 + length])
+        return ('{"$binary": "%s", "$type": "%02x"}' %
+                (value.decode("ascii"), subtype), position + 5 + length)
+    if element_type in (0x06, 0xFF, 0x7F):
+        key = {0x06: "$undefined", 0xFF: "$minKey", 0x7F: "$maxKey"}
+        return ('{"%s": true}' % key[element_type], position)
+    if element_type == 0x07:
+        oid = binascii.hexlify(data[position:position + 12]).decode("ascii")
+        return ('{"$oid": "%s"}' % oid, position + 12)
+    if element_type == 0x08:
+        return (data[position] and "true" or "false", position + 1)
+    if element_type == 0x09:
+        millis = _unpack_long(data, position)[0]
+        return ('{"$date": "%d"}' % millis, position + 8)
+    if element_type == 0x0A:
+        return ("null", position)
+    if element_type == 0x0B:
+        (pattern, position) = _c_string(data, position)
+        (options, position) = _c_string(data, position)
+        # same flags, in the same order, as default()
+        options = "".join([flag for flag in "ium" if flag in options])
+        return ('{"$regex": %s, "$options": "%s"}' %
+                (_encode_string(pattern), options), position)
+    if element_type == 0x0C:
+        (collection, position) = _json_string(data, position)
+        oid = binascii.hexlify(data[position:position + 12]).decode("ascii")
+        return ('{"$ref": %s, "$id": {"$oid": "%s"}}' % (collection, oid),
+                position + 12)
+    if element_type == 0x0D:
+        (code, position) = _json_string(data, position)
+        return ('{"$code": %s}' % code, position)
+    if element_type == 0x0F:
+        (code, scope_position) = _json_string(data, position + 4)
+        (scope, _) = _json_document(data, scope_position)
+        return ('{"$code": %s, "$scope": %s}' % (code, scope),
+                position + _unpack_int(data, position)[0])
+    if element_type == 0x10:
+        return (str(_unpack_int(data, position)[0]), position + 4)
+    if element_type == 0x11:
+        inc = _unpack_uint(data, position)[0]
+        time = _unpack_uint(data, position + 4)[0]
+        return ('{"$timestamp": {"t": %d, "i": %d}}' % (time, inc),
+                position + 8)
+    if element_type == 0x12:
+        return (str(_unpack_long(data, position)[0]), position + 8)
+    raise InvalidBSON("unknown element type 0x%02x" % element_type)
+
+
+def _bson_to_json(data):
+    try:
+        (result, end) = _json_document(data, 0)
+    except (IndexError, ValueError, struct.error) as e:
+        raise InvalidBSON(str(e))
+    if end != len(data):
+        raise InvalidBSON("bad document length")
+    return result
+if _use_c:
+    _bson_to_json = _cbson._dumps_bson
+
+
+def dumps_bson(data):
+    """Convert a BSON document straight to a JSON string.
+
+    The result is the same as ``json.dumps(document,
+    default=json_util.default)`` for the decoded document, but the BSON is
+    transcoded directly, without building a document or any of the objects
+    in it. Types that :func:`default` doesn't handle use Mongo Extended
+    JSON's *Strict* mode (e.g. ``{"$binary": ..., "$type": ...}``).
+
+    Raises :class:`~pymongo.errors.InvalidBSON` if `data` isn't a valid
+    BSON document.
+
+    :Parameters:
+      - `data`: the BSON document (``bytes``)
+
+    .. versionadded:: 1.3+
+    .. versionchanged:: 1.3+
+       Uses the C extension when it is available.
+    """
+    result = _bson_to_json(data)
+    if isinstance(result, bytes):
+        result = result.decode("ascii")
+    return result
+
+
+class _JSONObject(list):
+    """The (key, value) pairs of a JSON object, in order.
+    """
+
+
+_pack_int = struct.Struct("<i").pack
+_pack_long = struct.Struct("<q").pack
+_pack_double = struct.Struct("<d").pack
+_pack_timestamp = struct.Struct("<II").pack
+
+_EMPTY_TYPES = {"$undefined": 0x06, "$minKey": 0xFF, "$maxKey": 0x7F}
+_SPECIAL = frozenset(["$oid", "$date", "$regex", "$binary", "$code",
+                      "$timestamp"]) | frozenset(_EMPTY_TYPES)
+
+_JSON_NUMBER = re.compile(r"-?(0|[1-9][0-9]*)(\.[0-9]+)?([eE][-+]?[0-9]+)?$")
+
+
+def _bson_c_string(value):
+    if "\x00" in value:
+        raise InvalidDocument("key names / regex patterns must not contain "
+                              "the NULL byte")
+    return value.encode("utf-8") + b"\x00"
+
+
+def _bson_integer(value, what):
+    """An integer for `$date` / `$timestamp`, given as a number or as a
+    string containing one.
+    """
+    if isinstance(value, str):
+        if not _JSON_NUMBER.match(value):
+            raise ValueError("bad %s" % what)
+        value = json.loads(value)
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError("bad %s" % what)
+    if isinstance(value, float):
+        if value != value or not -2 ** 63 <= value < 2 ** 63:
+            raise OverflowError("%s value out of range" % what)
+        value = int(value)
+    return value
+
+
+def _bson_special(pairs):
+    """BSON for an extended JSON object, as (type, data).
+    """
+    keys = [key for (key, _) in pairs]
+    values = [value for (_, value) in pairs]
+    name = keys[0]
+    if name == "$oid":
+        value = values[0]
+        if (keys != ["$oid"] or not isinstance(value, str) or
+            len(value) != 24):
+            raise ValueError("bad $oid")
+        try:
+            return (0x07, binascii.unhexlify(value.encode("ascii")))
+        except (UnicodeError, binascii.Error):
+            raise ValueError("bad $oid")
+    if name == "$date":
+        if keys != ["$date"]:
+            raise ValueError("bad $date")
+        millis = _bson_integer(values[0], "$date")
+        if not -2 ** 63 <= millis < 2 ** 63:
+            raise OverflowError("$date value out of range")
+        return (0x09, _pack_long(millis))
+    if name == "$regex":
+        if (keys != ["$regex", "$options"] or
+            not isinstance(values[0], str) or
+            not isinstance(values[1], str) or "\x00" in values[1]):
+            raise ValueError("bad $regex")
+        return (0x0B, _bson_c_string(values[0]) +
+                values[1].encode("utf-8") + b"\x00")
+    if name == "$binary":
+        if (keys != ["$binary", "$type"] or not isinstance(values[0], str) or
+            not isinstance(values[1], str) or
+            not re.match("[0-9a-fA-F]{1,2}$", values[1])):
+            raise ValueError("bad $binary")
+        try:
+            data = base64.b64decode(values[0].encode("ascii"), validate=True)
+        except (UnicodeError, binascii.Error):
+            raise ValueError("bad $binary")
+        subtype = int(values[1], 16)
+        if subtype == 2:
+            data = _pack_int(len(data)) + data
+        return (0x05, _pack_int(len(data)) + bytes([subtype]) + data)
+    if name == "$code":
+        if not isinstance(values[0], str):
+            raise ValueError("bad $code")
+        code = _bson_string(values[0])
+        if keys == ["$code"]:
+            return (0x0D, code)
+        if (keys != ["$code", "$scope"] or
+            not isinstance(values[1], _JSONObject)):
+            raise ValueError("bad $code")
+        code += _bson_document(values[1])
+        return (0x0F, _pack_int(len(code) + 4) + code)
+    if name == "$timestamp":
+        value = values[0]
+        if (keys != ["$timestamp"] or not isinstance(value, _JSONObject) or
+            sorted([key for (key, _) in value]) != ["i", "t"]):
+            raise ValueError("bad $timestamp")
+        value = dict(value)
+        time = _bson_integer(value["t"], "$timestamp")
+        inc = _bson_integer(value["i"], "$timestamp")
+        if not (0 <= time < 2 ** 32 and 0 <= inc < 2 ** 32):
+            raise ValueError("bad $timestamp")
+        return (0x11, _pack_timestamp(inc, time))
+    if name in _EMPTY_TYPES:
+        if len(keys) != 1:
+            raise ValueError("bad %s" % name)
+        return (_EMPTY_TYPES[name], b"")
+
+
+def _bson_string(value):
+    data = value.encode("utf-8") + b"\x00"
+    return _pack_int(len(data)) + data
+
+
+def _bson_document(pairs):
+    elements = [bytes([element_type]) + _bson_c_string(key) + data
+                for (key, (element_type, data)) in
+                [(key, _bson_value(value)) for (key, value) in pairs]]
+    data = b"".join(elements)
+    return _pack_int(len(data) + 5) + data + b"\x00"
+
+
+def _bson_value(value):
+    """BSON for a value returned by :func:`json.loads`, as (type, data).
+    """
+    if isinstance(value, _JSONObject):
+        if value and value[0][0] in _SPECIAL:
+            return _bson_special(value)
+        return (0x03, _bson_document(value))
+    if isinstance(value, list):
+        return (0x04, _bson_document([(str(i), v)
+                                      for (i, v) in enumerate(value)]))
+    if isinstance(value, str):
+        return (0x02, _bson_string(value))
+    if value is True:
+        return (0x08, b"\x01")
+    if value is False:
+        return (0x08, b"\x00")
+    if value is None:
+        return (0x0A, b"")
+    if isinstance(value, int):
+        if not -2 ** 63 <= value < 2 ** 63:
+            raise OverflowError("MongoDB can only handle up to 8-byte ints")
+        if -2 ** 31 <= value < 2 ** 31:
+            return (0x10, _pack_int(value))
+        return (0x12, _pack_long(value))
+    return (0x01, _pack_double(value))
+
+
+def _json_to_bson(text):
+    document = json.loads(text, object_pairs_hook=_JSONObject)
+    if not isinstance(document, _JSONObject):
+        raise ValueError("expected an object")
+    # the top level is always a plain document
+    return _bson_document(document)
+if _use_c:
+    def _json_to_bson(text):
+        return _cbson._loads_to_bson(text.encode("utf-8"))
+
+
+def loads_to_bson(text):
+    """Convert a JSON string straight to a BSON document.
+
+    The inverse of :func:`dumps_bson`: the *Strict* mode Mongo Extended
+    JSON forms it (and :func:`default`) produces are turned back into the
+    matching BSON types, and the key order of each object is kept. Integers
+    become 32 or 64-bit ints depending on their size, other numbers become
+    doubles.
+
+    Raises :class:`ValueError` if `text` isn't valid JSON (or an extended
+    JSON form is malformed), :class:`~pymongo.errors.InvalidDocument` if a
+    key contains a NULL byte and :class:`OverflowError` for integers that
+    don't fit in 8 bytes.
+
+    :Parameters:
+      - `text`: a JSON object (``str``)
+
+    .. versionadded:: 1.3+
+    """
+    if not isinstance(text, str):
+        raise TypeError("loads_to_bson expects a str, not %r" % type(text))
+    return _json_to_bson(text)
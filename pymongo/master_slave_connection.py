@@ -17,17 +17,38 @@
 Performs all writes to Master instance and distributes reads among all
 instances."""
 
-import random
+import time
+import weakref
 
 from .database import Database
 from .connection import Connection
+from .cursor_manager import CursorRegistry
+from .errors import ConnectionFailure, OperationTimeout
+from .monitor import TopologyMonitor
+from .retry import RetryPolicy
+from .routing import RoutingPolicy
+
+
+def _slave_listener(connection_ref):
+    """A :class:`~pymongo.monitor.TopologyMonitor` listener that ejects
+    slaves that don't answer, without keeping the connection alive.
+    """
+    def listener(monitor):
+        connection = connection_ref()
+        if connection is None:
+            return
+        policy = connection.routing_policy
+        for (index, status) in enumerate(monitor.nodes):
+            if not status.reachable:
+                policy._eject(index)
+    return listener
 
 
 class MasterSlaveConnection(object):
     """A master-slave connection to Mongo.
     """
 
-    def __init__(self, master, slaves=[]):
+    def __init__(self, master, slaves=[], routing_policy=RoutingPolicy):
         """Create a new Master-Slave connection.
 
         The resultant connection should be interacted with using the same
@@ -43,6 +64,12 @@ class MasterSlaveConnection(object):
           - `master`: `Connection` instance for the writable Master
           - `slaves` (optional): list of `Connection` instances for the
             read-only slaves
+          - `routing_policy` (optional): subclass of
+            :class:`~pymongo.routing.RoutingPolicy` used to choose the slave
+            for each read
+
+        .. versionchanged:: 1.3+
+           Added the `routing_policy` parameter.
         """
         if not isinstance(master, Connection):
             raise TypeError("master must be a Connection instance")
@@ -57,6 +84,12 @@ class MasterSlaveConnection(object):
         self.__in_request = False
         self.__master = master
         self.__slaves = slaves
+        self.__databases = {}
+        self.__cursor_registry = CursorRegistry()
+        self.__routing_policy = None
+        self.set_routing_policy(routing_policy)
+        self.__monitor = None
+        self.__retry_policy = None
 
     def master(self):
         return self.__master
@@ -74,6 +107,126 @@ class MasterSlaveConnection(object):
         return True
     slave_okay = property(slave_okay)
 
+    def __get_document_class(self):
+        return self.__master.document_class
+
+    def __set_document_class(self, klass):
+        self.__master.document_class = klass
+        for slave in self.__slaves:
+            slave.document_class = klass
+
+    document_class = property(__get_document_class, __set_document_class,
+                              doc="""Default class to use for documents
+                              returned on this connection.
+
+                              Setting it sets it on the master and every
+                              slave.
+
+                              .. versionadded:: 1.3+
+                              """)
+
+    def __get_retry_policy(self):
+        return self.__retry_policy
+
+    def __set_retry_policy(self, policy):
+        if policy is not None and not isinstance(policy, RetryPolicy):
+            raise TypeError("retry_policy must be an instance of "
+                            "RetryPolicy or None")
+        self.__retry_policy = policy
+
+    retry_policy = property(__get_retry_policy, __set_retry_policy,
+                            doc="""The :class:`~pymongo.retry.RetryPolicy`
+                            used to retry reads, or None.
+
+                            A retried read is routed again, so it will
+                            usually go to a different slave. See
+                            :attr:`pymongo.connection.Connection.retry_policy`.
+
+                            .. versionadded:: 1.3+
+                            """)
+
+    def cursor_registry(self):
+        """The :class:`~pymongo.cursor_manager.CursorRegistry` tracking the
+        cursors opened through this connection, on the master or any slave.
+
+        .. versionadded:: 1.3+
+        """
+        return self.__cursor_registry
+    cursor_registry = property(cursor_registry)
+
+    def routing_policy(self):
+        """The :class:`~pymongo.routing.RoutingPolicy` choosing which slave
+        each read goes to.
+
+        .. versionadded:: 1.3+
+        """
+        return self.__routing_policy
+    routing_policy = property(routing_policy)
+
+    def set_routing_policy(self, policy_class):
+        """Set the routing policy for this connection.
+
+        Raises TypeError if `policy_class` is not a subclass of
+        :class:`~pymongo.routing.RoutingPolicy`.
+
+        :Parameters:
+          - `policy_class`: class to use to choose the slave for each read
+
+        .. versionadded:: 1.3+
+        """
+        if not issubclass(policy_class, RoutingPolicy):
+            raise TypeError("policy_class must be a subclass of "
+                            "RoutingPolicy")
+
+        self.__routing_policy = policy_class(self)
+
+    def start_monitor(self, interval=5.0, connect_timeout=2.0):
+        """Watch the master and every slave from background threads.
+
+        Starts the master's monitor (see
+        :meth:`~pymongo.connection.Connection.start_monitor`) and a second
+        monitor that checks every slave with ``ismaster``. Slaves that don't
+        answer are ejected by the :attr:`routing_policy` before a read has
+        to fail on them.
+
+        Returns the slaves' :class:`~pymongo.monitor.TopologyMonitor`.
+
+        :Parameters:
+          - `interval` (optional): seconds between checks
+          - `connect_timeout` (optional): timeout, in seconds, for each
+            check of a node
+
+        .. versionadded:: 1.3+
+        """
+        self.stop_monitor()
+        self.__master.start_monitor(interval, connect_timeout)
+        self.__monitor = TopologyMonitor([slave._address
+                                          for slave in self.__slaves],
+                                         self.__master._probe, interval,
+                                         connect_timeout,
+                                         _slave_listener(weakref.ref(self)))
+        self.__monitor.start()
+        return self.__monitor
+
+    def stop_monitor(self):
+        """Stop the monitors started by :meth:`start_monitor`.
+
+        .. versionadded:: 1.3+
+        """
+        self.__master.stop_monitor()
+        if self.__monitor is not None:
+            self.__monitor.stop()
+            self.__monitor = None
+
+    def monitor(self):
+        """The slaves' :class:`~pymongo.monitor.TopologyMonitor`, started by
+        :meth:`start_monitor`, or None.
+
+        .. versionadded:: 1.3+
+        """
+        return self.__monitor
+    monitor = property(monitor)
+
     def set_cursor_manager(self, manager_class):
         """Set the cursor manager for this connection.
 
@@ -87,7 +240,8 @@ class MasterSlaveConnection(object):
     # _connection_to_use is a hack that we need to include to make sure
     # that killcursor operations can be sent to the same instance on which
     # the cursor actually resides...
-    def _send_message(self, message, safe=False, _connection_to_use=None):
+    def _send_message(self, message, safe=False, _connection_to_use=None,
+                      _deadline=None):
         """Say something to Mongo.
 
         Sends a message on the Master connection. This is used for inserts,
@@ -102,17 +256,20 @@ class MasterSlaveConnection(object):
               - `data`: data to send
             )
           - `safe`: perform a getLastError after sending the message
+          - `_deadline` (optional): :func:`time.monotonic` by which to
+            finish
         """
         if _connection_to_use is None or _connection_to_use == -1:
-            return self.__master._send_message(message, safe)
-        return self.__slaves[_connection_to_use]._send_message(message, safe)
+            return self.__master._send_message(message, safe, _deadline)
+        return self.__slaves[_connection_to_use]._send_message(message, safe,
+                                                               _deadline)
 
     # _connection_to_use is a hack that we need to include to make sure
     # that getmore operations can be sent to the same instance on which
     # the cursor actually resides...
     def _send_message_with_response(self, message,
                                     _sock=None, _connection_to_use=None,
-                                    _must_use_master=False):
+                                    _must_use_master=False, _deadline=None):
         """Receive a message from Mongo.
 
         Sends the given message and returns a (connection_id, response) pair.
@@ -122,29 +279,61 @@ class MasterSlaveConnection(object):
               - `operation`: opcode of the message to send
               - `data`: data to send
           )
+          - `_deadline` (optional): :func:`time.monotonic` by which the
+            response has to be received
         """
         if _connection_to_use is not None:
             if _connection_to_use == -1:
-                return (-1, self.__master._send_message_with_response(message,
-                                                                      _sock))
+                return (-1, self.__master._send_message_with_response(
+                    message, _sock, _deadline=_deadline))
             else:
+                self.__routing_policy._begin(_connection_to_use)
                 return (_connection_to_use,
-                        self.__slaves[_connection_to_use]
-                        ._send_message_with_response(message, _sock))
-
-        # for now just load-balance randomly among slaves only...
-        connection_id = random.randrange(0, len(self.__slaves))
+                        self.__send_to_slave(_connection_to_use, message,
+                                             _sock, _deadline))
 
         # _must_use_master is set for commands, which must be sent to the
         # master instance. any queries in a request must be sent to the
         # master since that is where writes go.
-        if _must_use_master or self.__in_request or connection_id == -1:
-            return (-1, self.__master._send_message_with_response(message,
-                                                                  _sock))
+        if _must_use_master or self.__in_request:
+            return (-1, self.__master._send_message_with_response(
+                message, _sock, _deadline=_deadline))
+
+        # the routing policy picks a slave, or the master if there are
+        # no usable slaves.
+        connection_id = self.__routing_policy._select()
+        if connection_id == -1:
+            return (-1, self.__master._send_message_with_response(
+                message, _sock, _deadline=_deadline))
 
         return (connection_id,
-                self.__slaves[connection_id]._send_message_with_response(message,
-                                                                         _sock))
+                self.__send_to_slave(connection_id, message, _sock,
+                                     _deadline))
+
+    def __send_to_slave(self, connection_id, message, _sock, _deadline=None):
+        """Send a message to a slave, reporting the outcome to the routing
+        policy. The policy must already be counting it as outstanding.
+
+        Missing a deadline isn't held against the slave - the operation may
+        just be slow.
+        """
+        policy = self.__routing_policy
+        start = time.monotonic()
+        try:
+            response = (self.__slaves[connection_id]
+                        ._send_message_with_response(message, _sock,
+                                                     _deadline=_deadline))
+        except OperationTimeout:
+            policy._finished(connection_id, None)
+            raise
+        except ConnectionFailure:
+            policy._failed(connection_id)
+            raise
+        except:
+            policy._finished(connection_id, None)
+            raise
+        policy._finished(connection_id, time.monotonic() - start)
+        return response
 
     def start_request(self):
         """Start a "request".
@@ -154,6 +343,7 @@ class MasterSlaveConnection(object):
         using the Master connection.
         """
         self.__in_request = True
+        self.__master.start_request()
 
     def end_request(self):
         """End the current "request".
@@ -181,8 +371,18 @@ class MasterSlaveConnection(object):
 
         :Parameters:
           - `name`: the name of the database to get
+
+        .. versionchanged:: 1.3+
+           The same :class:`~pymongo.database.Database` instance is
+           returned for every lookup of `name`. Names starting with an
+           underscore raise :class:`AttributeError` rather than being
+           looked up (use ``connection[name]`` for those).
         """
-        return Database(self, name)
+        if name.startswith("_"):
+            raise AttributeError("MasterSlaveConnection has no attribute "
+                                 "%r. To access the %s database, use "
+                                 "connection[%r]." % (name, name, name))
+        return self.__getitem__(name)
 
     def __getitem__(self, name):
         """Get a database by name.
@@ -192,7 +392,10 @@ class MasterSlaveConnection(object):
         :Parameters:
           - `name`: the name of the database to get
         """
-        return self.__getattr__(name)
+        try:
+            return self.__databases[name]
+        except KeyError:
+            return self.__databases.setdefault(name, Database(self, name))
 
     def close_cursor(self, cursor_id, connection_id):
         """Close a single database cursor.
@@ -239,3 +442,13 @@ class MasterSlaveConnection(object):
         return self.__master._purge_index(database_name,
                                           collection_name,
                                           index_name)
+
+    def _authenticate(self, name, username, digest):
+        # reads go to the slaves, so they need the credentials too
+        results = [connection._authenticate(name, username, digest)
+                   for connection in [self.__master] + self.__slaves]
+        return False not in results
+
+    def _logout(self, name):
+        for connection in [self.__master] + self.__slaves:
+            connection._logout(name)
@@ -26,8 +26,10 @@ import threading
 import struct
 import random
 import sys
+import zlib
 
 from . import bson
+from .errors import ConnectionFailure
 
 try:
     import _cbson
@@ -35,6 +37,44 @@ try:
 except ImportError:
     _use_c = False
 
+# compressor name -> (id, compress, decompress), ids as used by the
+# server's own OP_COMPRESSED support. zlib is always available.
+_COMPRESSORS = {"zlib": (2, zlib.compress, zlib.decompress)}
+try:
+    import snappy
+    _COMPRESSORS["snappy"] = (1, snappy.compress, snappy.decompress)
+except ImportError:
+    pass
+try:
+    import zstandard
+except ImportError:
+    pass
+else:
+    # zstandard's (de)compressor objects can't be used by several threads at
+    # once, so each thread gets its own
+    _zstd = threading.local()
+
+    def _zstd_compress(data):
+        try:
+            compressor = _zstd.compressor
+        except AttributeError:
+            compressor = _zstd.compressor = zstandard.ZstdCompressor()
+        return compressor.compress(data)
+
+    def _zstd_decompress(data):
+        try:
+            decompressor = _zstd.decompressor
+        except AttributeError:
+            decompressor = _zstd.decompressor = zstandard.ZstdDecompressor()
+        return decompressor.decompress(data)
+
+    _COMPRESSORS["zstd"] = (3, _zstd_compress, _zstd_decompress)
+_DECOMPRESSORS = dict([(compressor_id, decompress) for
+                       (compressor_id, _, decompress)
+                       in _COMPRESSORS.values()])
+
+OP_COMPRESSED = 2012
+
 
 __ZERO = b"\x00\x00\x00\x00"
 
@@ -145,3 +185,51 @@ def kill_cursors(cursor_ids):
     for cursor_id in cursor_ids:
         data += struct.pack("<q", cursor_id)
     return __pack_message(2007, data)
+
+
+def compress(data, compressor):
+    """Wrap each of the messages in `data` in an **OP_COMPRESSED**
+    message, compressed with `compressor` (one of the keys of
+    `_COMPRESSORS`).
+
+    `data` is the data of a message as returned by the other functions in
+    this module, which may be several messages sent together (e.g. an
+    insert followed by a lastError). Request ids are kept.
+
+    .. versionadded:: 1.3+
+    """
+    (compressor_id, compress_data, _) = _COMPRESSORS[compressor]
+    messages = []
+    position = 0
+    while position < len(data):
+        (length, request_id, response_to, operation) = \
+            struct.unpack("<iiii", data[position:position + 16])
+        body = data[position + 16:position + length]
+        compressed = (struct.pack("<iiB", operation, len(body), compressor_id)
+                      + compress_data(body))
+        messages.append(struct.pack("<iiii", 16 + len(compressed), request_id,
+                                    response_to, OP_COMPRESSED) + compressed)
+        position += length
+    return b"".join(messages)
+
+
+def decompress(data):
+    """Unwrap the body of an **OP_COMPRESSED** message (everything after
+    the header).
+
+    Returns an ``(operation, body)`` pair: the opcode and body of the
+    original message. Raises ConnectionFailure if the message can't be
+    decompressed.
+
+    .. versionadded:: 1.3+
+    """
+    (operation, size, compressor_id) = struct.unpack("<iiB", data[:9])
+    try:
+        body = _DECOMPRESSORS[compressor_id](data[9:])
+    except KeyError:
+        raise ConnectionFailure("unsupported compressor id %d" % compressor_id)
+    except Exception as e:
+        raise ConnectionFailure("could not decompress message: %s" % e)
+    if len(body) != size:
+        raise ConnectionFailure("decompressed message has the wrong size")
+    return (operation, body)
@@ -0,0 +1,214 @@
+# Copyright 2009 10gen, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Background monitoring of the nodes a connection uses.
+
+A :class:`TopologyMonitor` runs ``ismaster`` against a set of nodes from a
+background thread and caches what it finds, so that a connection can
+switch to a new master as soon as it needs one instead of searching for it
+while a request waits.
+
+Monitors are normally started with
+:meth:`~pymongo.connection.Connection.start_monitor` or
+:meth:`~pymongo.master_slave_connection.MasterSlaveConnection.start_monitor`.
+
+.. versionadded:: 1.3+
+"""
+
+import threading
+import time
+import weakref
+
+
+class NodeStatus(object):
+    """What a :class:`TopologyMonitor` last saw of one node.
+
+    The attributes are kept up to date by the monitor and should be treated
+    as read-only:
+
+      - `address`: ``(host, port)`` of the node
+      - `reachable`: did the node answer the last check?
+      - `is_master`: is the node a master?
+      - `remote`: ``(host, port)`` the node says is the master, if it
+        isn't one itself and knows
+      - `latency`: how long the last check took, in seconds
+      - `error`: the exception from the last check, if it failed
+      - `checked`: when the node was last checked (a :func:`time.time`
+        value), None if it hasn't been yet
+
+    .. versionadded:: 1.3+
+    """
+
+    def __init__(self, address):
+        self.address = address
+        self.reachable = False
+        self.is_master = False
+        self.remote = None
+        self.latency = None
+        self.error = None
+        self.checked = None
+
+    def __repr__(self):
+        return ("NodeStatus(%r, reachable=%r, is_master=%r)" %
+                (self.address, self.reachable, self.is_master))
+
+
+def _parse_address(address, default_port):
+    strings = address.split(":", 1)
+    if len(strings) == 1:
+        return (strings[0], default_port)
+    return (strings[0], int(strings[1]))
+
+
+def _monitor(monitor_ref, wakeup):
+    """Body of a :class:`TopologyMonitor`'s thread.
+
+    Only holds a weak reference to the monitor between checks so that the
+    monitor (and its connection) can still be garbage collected.
+    """
+    while True:
+        monitor = monitor_ref()
+        if monitor is None or monitor._stopped:
+            return
+        wakeup.clear()
+        monitor.check()
+        interval = monitor.interval
+        del monitor
+        wakeup.wait(interval)
+
+
+class TopologyMonitor(object):
+    """Periodically checks a set of nodes with ``ismaster``.
+
+    :Parameters:
+      - `nodes`: list of ``(host, port)`` pairs to check
+      - `probe`: callable taking an address and a timeout and returning the
+        node's response to ``ismaster``, or raising an exception if it
+        couldn't be reached
+      - `interval` (optional): seconds between checks
+      - `connect_timeout` (optional): timeout passed to `probe`
+      - `listener` (optional): callable that is passed the monitor after
+        every check
+
+    .. versionadded:: 1.3+
+    """
+
+    def __init__(self, nodes, probe, interval=5.0, connect_timeout=2.0,
+                 listener=None):
+        self.__nodes = [NodeStatus(address) for address in nodes]
+        self.__probe = probe
+        self.__interval = interval
+        self.__connect_timeout = connect_timeout
+        self.__listener = listener
+        self.__lock = threading.Lock()
+        self.__wakeup = threading.Event()
+        self.__thread = None
+        self.__checks = 0
+        self._stopped = False
+
+    def interval(self):
+        """Seconds between checks.
+        """
+        return self.__interval
+    interval = property(interval)
+
+    def nodes(self):
+        """A :class:`NodeStatus` for each node, in the order they were
+        given.
+        """
+        return list(self.__nodes)
+    nodes = property(nodes)
+
+    def checks(self):
+        """Number of completed rounds of checks.
+        """
+        return self.__checks
+    checks = property(checks)
+
+    def master(self):
+        """``(host, port)`` of the master, or None if no node said it was
+        one at the last check.
+        """
+        for status in self.__nodes:
+            if status.reachable and status.is_master:
+                return status.address
+        return None
+    master = property(master)
+
+    def check(self):
+        """Check every node now.
+
+        Called from the monitor's thread, but can also be called directly.
+        Only one check runs at a time.
+        """
+        self.__lock.acquire()
+        try:
+            for status in self.__nodes:
+                start = time.time()
+                try:
+                    result = self.__probe(status.address,
+                                          self.__connect_timeout)
+                except Exception as e:
+                    status.reachable = False
+                    status.is_master = False
+                    status.remote = None
+                    status.error = e
+                else:
+                    status.reachable = True
+                    status.is_master = bool(result.get("ismaster"))
+                    status.remote = None
+                    if "remote" in result:
+                        status.remote = _parse_address(result["remote"],
+                                                       status.address[1])
+                    status.error = None
+                status.latency = time.time() - start
+                status.checked = time.time()
+            self.__checks += 1
+        finally:
+            self.__lock.release()
+
+        if self.__listener is not None:
+            self.__listener(self)
+
+    def start(self):
+        """Start checking the nodes in a background thread.
+
+        The first check happens right away.
+        """
+        self._stopped = False
+        if self.__thread is not None and self.__thread.is_alive():
+            return
+        self.__thread = threading.Thread(target=_monitor,
+                                         args=(weakref.ref(self),
+                                               self.__wakeup))
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def stop(self):
+        """Stop the background thread.
+
+        Doesn't wait for a check that is in progress to finish.
+        """
+        self._stopped = True
+        self.__wakeup.set()
+        self.__thread = None
+
+    def wake(self):
+        """Ask the background thread to check the nodes again now, e.g.
+        after a request failed.
+        """
+        self.__wakeup.set()
+
+    def __del__(self):
+        self.stop()
@@ -44,6 +44,8 @@ class ObjectId(object):
     """A Mongo ObjectId.
     """
 
+    __slots__ = ("__id",)
+
     _inc = 0
     _inc_lock = threading.Lock()
 
@@ -76,24 +78,67 @@ class ObjectId(object):
     def __generate(self):
         """Generate a new value for this ObjectId.
         """
-        oid = b""
+        if _use_c:
+            self.__id = _cbson._generate_id(ObjectId._machine_bytes)
+            return
 
-        # 4 bytes current time
-        oid += struct.pack(">i", int(time.time()))
+        ObjectId._inc_lock.acquire()
+        inc = ObjectId._inc
+        ObjectId._inc = (inc + 1) % 0xFFFFFF
+        ObjectId._inc_lock.release()
 
-        # 3 bytes machine
-        oid += ObjectId._machine_bytes
+        # 4 bytes current time, 3 bytes machine, 2 bytes pid, 3 bytes inc
+        self.__id = (struct.pack(">i", int(time.time())) +
+                     ObjectId._machine_bytes +
+                     struct.pack(">H", os.getpid() % 0xFFFF) +
+                     struct.pack(">I", inc)[1:4])
 
-        # 2 bytes pid
-        oid += struct.pack(">H", os.getpid() % 0xFFFF)
+    def generate_many(cls, n):
+        """Generate a list of `n` new (unique) ObjectIds.
 
-        # 3 bytes inc
-        ObjectId._inc_lock.acquire()
-        oid += struct.pack(">i", ObjectId._inc)[1:4]
-        ObjectId._inc = (ObjectId._inc + 1) % 0xFFFFFF
-        ObjectId._inc_lock.release()
+        Much faster than calling ``ObjectId()`` `n` times: a whole range of
+        the counter is reserved at once and the ids share their time,
+        machine and process bytes.
+
+        :Parameters:
+          - `n`: the number of ObjectIds to generate
 
-        self.__id = oid
+        .. versionadded:: 1.3+
+        """
+        if not isinstance(n, int):
+            raise TypeError("n must be an instance of int")
+        if n < 0:
+            raise ValueError("n must be non-negative")
+
+        if _use_c:
+            binaries = _cbson._generate_ids(ObjectId._machine_bytes, n)
+        else:
+            ObjectId._inc_lock.acquire()
+            inc = ObjectId._inc
+            ObjectId._inc = (inc + n) % 0xFFFFFF
+            ObjectId._inc_lock.release()
+
+            prefix = (struct.pack(">i", int(time.time())) +
+                      ObjectId._machine_bytes +
+                      struct.pack(">H", os.getpid() % 0xFFFF))
+            pack = struct.Struct(">I").pack
+            binaries = [prefix + pack((inc + i) % 0xFFFFFF)[1:4]
+                        for i in range(n)]
+
+        from_binary = cls._from_binary
+        return [from_binary(binary) for binary in binaries]
+    generate_many = classmethod(generate_many)
+
+    def _from_binary(cls, binary):
+        """Create an ObjectId from a 12 byte binary value without any
+        validation.
+
+        Used by the decoder, which already knows `binary` is valid.
+        """
+        oid = cls.__new__(cls)
+        oid.__id = binary
+        return oid
+    _from_binary = classmethod(_from_binary)
 
     def __validate(self, oid):
         """Validate and use the given id for this ObjectId.
@@ -162,14 +207,47 @@ class ObjectId(object):
     def __repr__(self):
         return "ObjectId('%s')" % (hexlify(self.__id).decode())
 
+    def __getstate__(self):
+        return self.__id
+
+    def __setstate__(self, state):
+        # ObjectIds pickled before __slots__ was used store their
+        # instance dict
+        if isinstance(state, dict):
+            state = state["_ObjectId__id"]
+        self.__id = state
+
+    def __eq__(self, other):
+        if isinstance(other, ObjectId):
+            return self.__id == other.__id
+        return NotImplemented
+
     def __ne__(self, other):
         if isinstance(other, ObjectId):
             return self.__id != other.__id
         return NotImplemented
 
-    def __eq__(self, other):
-        return not self.__ne__(other)
-    
+    # ObjectIds order by their binary value, which starts with the
+    # generation time.
+    def __lt__(self, other):
+        if isinstance(other, ObjectId):
+            return self.__id < other.__id
+        return NotImplemented
+
+    def __le__(self, other):
+        if isinstance(other, ObjectId):
+            return self.__id <= other.__id
+        return NotImplemented
+
+    def __gt__(self, other):
+        if isinstance(other, ObjectId):
+            return self.__id > other.__id
+        return NotImplemented
+
+    def __ge__(self, other):
+        if isinstance(other, ObjectId):
+            return self.__id >= other.__id
+        return NotImplemented
 
     def __hash__(self):
         """Get a hash value for this :class:`ObjectId`.
@@ -179,3 +257,9 @@ class ObjectId(object):
         return hash(self.__id)
 
 
+# Imported last: the C extension needs the ObjectId class when it loads.
+try:
+    import _cbson
+    _use_c = True
+except ImportError:
+    _use_c = False
@@ -0,0 +1,207 @@
+# Copyright 2009 10gen, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Read a server's oplog in batches, with checkpointing.
+
+Useful for replicating changes elsewhere (caches, search indexes, ...)
+without rescanning collections: apply each batch of operations then let the
+reader record how far it got, so that a restarted process carries on from
+there.
+"""
+
+import time
+
+from .son import SON
+from .timestamp import Timestamp
+
+_IDLE = object()
+
+
+class CollectionCheckpoint(object):
+    """Stores an :class:`OplogReader`'s position in a collection.
+
+    The position is kept in the document with `_id` `name`, so one
+    collection can hold the checkpoints of several readers.
+
+    Any object with the same :meth:`load` and :meth:`save` methods can be
+    used as a checkpoint instead.
+
+    :Parameters:
+      - `collection`: :class:`~pymongo.collection.Collection` to store the
+        checkpoint in
+      - `name`: name of this checkpoint
+
+    .. versionadded:: 1.3+
+    """
+
+    def __init__(self, collection, name):
+        self.__collection = collection
+        self.__name = name
+
+    def load(self):
+        """Get the stored :class:`~pymongo.timestamp.Timestamp`, or None if
+        nothing has been saved yet.
+        """
+        document = self.__collection.find_one({"_id": self.__name})
+        if document is None:
+            return None
+        return document.get("ts")
+
+    def save(self, timestamp):
+        """Store `timestamp`.
+        """
+        self.__collection.save(SON([("_id", self.__name), ("ts", timestamp)]),
+                               safe=True)
+
+
+class OplogReader(object):
+    """Tails a server's oplog, yielding operations in batches.
+
+    Iterating over the reader yields lists of operations (oplog entries).
+    A batch is handed over once `batch_size` operations have arrived, once
+    `max_batch_delay` seconds have passed since the first operation of the
+    batch arrived, or once there are no more operations for now, so batches
+    can be applied in bulk with bounded lag.
+
+    When the consumer asks for the next batch the previous one is considered
+    applied, and at most every `checkpoint_interval` seconds the position of
+    the last applied operation is saved to `checkpoint`. A new reader with
+    the same `checkpoint` starts right after that position. :meth:`save`
+    stores the current position straight away, e.g. before shutting down.
+
+    :Parameters:
+      - `connection`: :class:`~pymongo.connection.Connection` to the server
+        whose oplog should be read
+      - `checkpoint` (optional): where to load the starting position from
+        and save progress to - e.g. a :class:`CollectionCheckpoint`
+      - `start` (optional): :class:`~pymongo.timestamp.Timestamp` to start
+        after, overriding `checkpoint`. If neither gives a position reading
+        starts after the newest operation currently in the oplog.
+      - `spec` (optional): only return operations matching this spec (e.g.
+        ``{"ns": "db.collection"}``)
+      - `batch_size` (optional): most operations per batch
+      - `max_batch_delay` (optional): most seconds to hold on to an
+        operation before handing over a partial batch
+      - `checkpoint_interval` (optional): least seconds between saves to
+        `checkpoint`
+      - `oplog` (optional): name of the oplog collection in the ``local``
+        database. Defaults to ``oplog.rs`` if it exists (replica sets),
+        ``oplog.$main`` otherwise (master / slave).
+      - `**kwargs` (optional): other options for
+        :meth:`~pymongo.collection.Collection.tail`
+
+    .. versionadded:: 1.3+
+    """
+
+    def __init__(self, connection, checkpoint=None, start=None, spec=None,
+                 batch_size=100, max_batch_delay=0.5, checkpoint_interval=5.0,
+                 oplog=None, **kwargs):
+        if not isinstance(batch_size, int) or batch_size < 1:
+            raise ValueError("batch_size must be a positive int")
+        if start is not None and not isinstance(start, Timestamp):
+            raise TypeError("start must be an instance of Timestamp")
+
+        local = connection["local"]
+        if oplog is None:
+            if "oplog.rs" in local.collection_names():
+                oplog = "oplog.rs"
+            else:
+                oplog = "oplog.$main"
+
+        self.__oplog = local[oplog]
+        self.__checkpoint = checkpoint
+        self.__spec = spec or {}
+        self.__batch_size = batch_size
+        self.__max_batch_delay = max_batch_delay
+        self.__checkpoint_interval = checkpoint_interval
+        self.__kwargs = kwargs
+
+        if start is None and checkpoint is not None:
+            start = checkpoint.load()
+        if start is None:
+            start = self.__newest()
+        self.__position = start
+        self.__saved = start
+        self.__last_save = time.time()
+
+    def __newest(self):
+        """Timestamp of the newest operation in the oplog, or None.
+        """
+        newest = self.__oplog.find(fields=["ts"]).sort("$natural", -1)
+        for operation in newest.limit(1):
+            return operation["ts"]
+        return None
+
+    def oplog(self):
+        """The oplog :class:`~pymongo.collection.Collection` being read.
+        """
+        return self.__oplog
+    oplog = property(oplog)
+
+    def position(self):
+        """:class:`~pymongo.timestamp.Timestamp` of the last operation that
+        has been applied (i.e. was in a batch before the current one), or
+        None if nothing has been applied and there was no start position.
+        """
+        return self.__position
+    position = property(position)
+
+    def save(self):
+        """Save :attr:`position` to the checkpoint now.
+        """
+        if self.__checkpoint is not None and self.__position is not None:
+            self.__checkpoint.save(self.__position)
+            self.__saved = self.__position
+        self.__last_save = time.time()
+
+    def __applied(self, batch):
+        """`batch` has been applied, advance and maybe save a checkpoint.
+        """
+        self.__position = batch[-1]["ts"]
+        if (self.__checkpoint is not None and
+            time.time() - self.__last_save >= self.__checkpoint_interval):
+            self.save()
+
+    def __iter__(self):
+        spec = SON(self.__spec)
+        if self.__position is not None:
+            spec["ts"] = {"$gt": self.__position}
+
+        tail = self.__oplog._tail(_IDLE, spec, resume_field="ts",
+                                  oplog_replay=True, **self.__kwargs)
+        batch = []
+        started = None
+        try:
+            for operation in tail:
+                if operation is not _IDLE:
+                    if not batch:
+                        started = time.time()
+                    batch.append(operation)
+                    if (len(batch) < self.__batch_size and
+                        time.time() - started < self.__max_batch_delay):
+                        continue
+                elif not batch:
+                    # nothing new, but a good time to save progress
+                    if (self.__saved != self.__position and
+                        self.__checkpoint is not None and
+                        time.time() - self.__last_save >=
+                        self.__checkpoint_interval):
+                        self.save()
+                    continue
+
+                yield batch
+                self.__applied(batch)
+                batch = []
+        finally:
+            tail.close()
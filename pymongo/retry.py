@@ -0,0 +1,154 @@
+# Copyright 2009 10gen, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Retrying reads that fail because of a connection problem.
+
+Install a :class:`RetryPolicy` on a connection (see
+:attr:`~pymongo.connection.Connection.retry_policy`) and queries and read
+only commands that fail with :class:`~pymongo.errors.AutoReconnect` are
+retried, so a failover doesn't reach the application. Writes, and fetching
+more results for a cursor that is already open (which lives on the old
+server), are never retried.
+
+.. versionadded:: 1.3+
+"""
+
+import threading
+import time
+
+from .errors import AutoReconnect
+
+# commands that only read, and so can safely be sent again
+_READ_COMMANDS = frozenset(["buildinfo", "collstats", "count", "datasize",
+                            "dbhash", "dbstats", "distinct", "geonear",
+                            "group", "ismaster", "listdatabases", "ping",
+                            "serverstatus"])
+
+
+def _is_read_command(spec):
+    """Is `spec` a command that only reads?
+    """
+    for name in spec:
+        return name.lower() in _READ_COMMANDS
+    return False
+
+
+class RetryPolicy(object):
+    """Retries an operation that fails with
+    :class:`~pymongo.errors.AutoReconnect`.
+
+    Each retry waits twice as long as the one before it, starting at
+    `backoff` seconds and never more than `max_backoff` seconds. The
+    operation is given up on after `max_attempts` attempts, or once
+    `deadline` seconds have passed since the first one, whichever comes
+    first - the last :class:`~pymongo.errors.AutoReconnect` is raised.
+
+    :Parameters:
+      - `max_attempts` (optional): most attempts to make, including the
+        first
+      - `backoff` (optional): seconds to wait before the first retry
+      - `max_backoff` (optional): longest wait between retries
+      - `deadline` (optional): seconds after which to stop retrying, None
+        for no limit
+
+    .. versionadded:: 1.3+
+    """
+
+    def __init__(self, max_attempts=3, backoff=0.05, max_backoff=1.0,
+                 deadline=None):
+        if not isinstance(max_attempts, int) or max_attempts < 1:
+            raise ValueError("max_attempts must be a positive int")
+        self.__max_attempts = max_attempts
+        self.__backoff = backoff
+        self.__max_backoff = max_backoff
+        self.__deadline = deadline
+
+        self.__lock = threading.Lock()
+        self.__calls = 0
+        self.__retries = 0
+        self.__recovered = 0
+        self.__failures = 0
+
+    def max_attempts(self):
+        """Most attempts made for an operation, including the first.
+        """
+        return self.__max_attempts
+    max_attempts = property(max_attempts)
+
+    def deadline(self):
+        """Seconds after which to stop retrying, or None.
+        """
+        return self.__deadline
+    deadline = property(deadline)
+
+    def stats(self):
+        """Counters describing what this policy has done.
+
+        A dictionary with the number of operations run (``"calls"``), the
+        number of ``"retries"`` made, the number of operations that
+        succeeded after at least one retry (``"recovered"``) and the number
+        that still failed (``"failures"``).
+        """
+        self.__lock.acquire()
+        try:
+            return {"calls": self.__calls,
+                    "retries": self.__retries,
+                    "recovered": self.__recovered,
+                    "failures": self.__failures}
+        finally:
+            self.__lock.release()
+    stats = property(stats)
+
+    def __count(self, retries=0, recovered=0, failures=0, calls=0):
+        self.__lock.acquire()
+        try:
+            self.__calls += calls
+            self.__retries += retries
+            self.__recovered += recovered
+            self.__failures += failures
+        finally:
+            self.__lock.release()
+
+    def run(self, operation):
+        """Call `operation`, retrying it if it raises
+        :class:`~pymongo.errors.AutoReconnect`.
+
+        Returns whatever `operation` returns.
+
+        :Parameters:
+          - `operation`: callable taking no arguments
+        """
+        self.__count(calls=1)
+        start = time.monotonic()
+        delay = self.__backoff
+        attempt = 1
+        while True:
+            try:
+                result = operation()
+            except AutoReconnect:
+                give_up = attempt >= self.__max_attempts
+                if (not give_up and self.__deadline is not None and
+                    time.monotonic() + delay - start > self.__deadline):
+                    give_up = True
+                if give_up:
+                    self.__count(failures=1)
+                    raise
+                self.__count(retries=1)
+                time.sleep(delay)
+                delay = min(delay * 2, self.__max_backoff)
+                attempt += 1
+            else:
+                if attempt > 1:
+                    self.__count(recovered=1)
+                return result
@@ -0,0 +1,467 @@
+# Copyright 2009 10gen, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Policies that choose which slave a
+:class:`~pymongo.master_slave_connection.MasterSlaveConnection` reads from.
+
+New policies should be defined as subclasses of RoutingPolicy and can be
+installed on a connection by calling
+`pymongo.master_slave_connection.MasterSlaveConnection.set_routing_policy`.
+
+Every policy temporarily ejects slaves that fail, and checks on them in a
+background thread to put them back into rotation once they answer again.
+While every slave is ejected (or otherwise unusable) reads go to the
+master.
+
+.. versionadded:: 1.3+
+"""
+
+import itertools
+import random
+import threading
+import time
+import weakref
+
+
+class SlaveState(object):
+    """What a :class:`RoutingPolicy` knows about one slave.
+
+    The attributes are kept up to date by the policy and should be treated
+    as read-only:
+
+      - `index`: position of the slave in
+        :attr:`~pymongo.master_slave_connection.MasterSlaveConnection.slaves`
+      - `connection`: the slave's :class:`~pymongo.connection.Connection`
+      - `outstanding`: number of requests currently in flight
+      - `requests`: number of requests that have completed
+      - `errors`: number of requests that have failed
+      - `latency`: moving average of the response time in seconds, None
+        until the first response
+      - `lag`: how far behind the master the slave was at the last check,
+        in seconds, None if it hasn't been measured
+      - `ejected`: is the slave out of rotation?
+      - `ejections`: number of times the slave has been ejected
+
+    .. versionadded:: 1.3+
+    """
+
+    def __init__(self, index, connection):
+        self.index = index
+        self.connection = connection
+        self.outstanding = 0
+        self.requests = 0
+        self.errors = 0
+        self.latency = None
+        self.lag = None
+        self.ejected = False
+        self.ejections = 0
+
+        # consecutive failures, and when to check on an ejected slave
+        self._failures = 0
+        self._eject_time = 0
+        self._retry_at = None
+
+    def __repr__(self):
+        return ("SlaveState(%r, outstanding=%d, latency=%r, lag=%r, "
+                "ejected=%r)" % (self.connection, self.outstanding,
+                                 self.latency, self.lag, self.ejected))
+
+
+def _check_when_due(policy_ref):
+    """Body of a :class:`RoutingPolicy`'s checking thread.
+
+    Only holds a weak reference to the policy between checks so that the
+    policy (and its connection) can still be garbage collected. Exits once
+    there is nothing left to check, the policy starts a new thread when
+    there is.
+    """
+    while True:
+        policy = policy_ref()
+        if policy is None:
+            return
+        delay = policy._check_delay()
+        if delay is None:
+            return
+        if delay <= 0:
+            policy._check()
+        del policy
+        if delay > 0:
+            time.sleep(delay)
+
+
+class RoutingPolicy(object):
+    """The default routing policy.
+
+    Spreads reads randomly over the slaves that are in rotation.
+
+    A slave is ejected after :attr:`eject_errors` consecutive failed
+    requests. It is checked on with an ``ismaster`` command after
+    :attr:`eject_time` seconds, and put back into rotation if that
+    succeeds - otherwise the wait before the next check doubles, up to
+    :attr:`max_eject_time`.
+
+    Subclasses choose between the slaves in rotation by overriding
+    :meth:`choose`, and can take slaves out of rotation by overriding
+    :meth:`usable`. To use different limits, subclass and override the
+    class attributes before passing the class to
+    :meth:`~pymongo.master_slave_connection.MasterSlaveConnection.set_routing_policy`.
+
+    .. versionadded:: 1.3+
+    """
+
+    eject_errors = 1
+    """Eject a slave after this many consecutive failures."""
+
+    eject_time = 1.0
+    """Seconds before an ejected slave is first checked on."""
+
+    max_eject_time = 30.0
+    """Longest wait, in seconds, between checks on an ejected slave."""
+
+    latency_weight = 0.3
+    """Weight of the newest response time in :attr:`SlaveState.latency`."""
+
+    def __init__(self, connection):
+        """Instantiate the policy.
+
+        :Parameters:
+          - `connection`: a
+            :class:`~pymongo.master_slave_connection.MasterSlaveConnection`
+        """
+        self.__connection = connection
+        self.__lock = threading.Lock()
+        self.__states = [SlaveState(index, slave)
+                         for (index, slave) in enumerate(connection.slaves)]
+        self.__thread = None
+
+    def connection(self):
+        """The connection this policy routes reads for.
+        """
+        return self.__connection
+    connection = property(connection)
+
+    def states(self):
+        """A :class:`SlaveState` for each slave, in the same order as the
+        connection's slaves.
+        """
+        return list(self.__states)
+    states = property(states)
+
+    def usable(self, state):
+        """Can reads be sent to this slave?
+
+        Called with the policy's lock held.
+
+        :Parameters:
+          - `state`: the slave's :class:`SlaveState`
+        """
+        return not state.ejected
+
+    def choose(self, states):
+        """Choose the slave to read from.
+
+        Returns one of `states`. Called with the policy's lock held.
+
+        :Parameters:
+          - `states`: non-empty list of the :class:`SlaveState` of every
+            usable slave
+        """
+        return random.choice(states)
+
+    def _select(self):
+        """Pick the slave for a new read and count it as outstanding.
+
+        Returns the slave's index, or -1 to read from the master.
+        """
+        self.__lock.acquire()
+        try:
+            usable = [state for state in self.__states if self.usable(state)]
+            if not usable:
+                return -1
+            state = self.choose(usable)
+            state.outstanding += 1
+            return state.index
+        finally:
+            self.__lock.release()
+
+    def _begin(self, index):
+        """Count a read (e.g. a getmore) sent to a specific slave.
+        """
+        self.__lock.acquire()
+        try:
+            self.__states[index].outstanding += 1
+        finally:
+            self.__lock.release()
+
+    def _finished(self, index, seconds):
+        """Record a read that completed in `seconds` (None if it didn't
+        complete, but not because of the slave).
+        """
+        self.__lock.acquire()
+        try:
+            state = self.__states[index]
+            state.outstanding -= 1
+            if seconds is None:
+                return
+            state.requests += 1
+            state._failures = 0
+            if state.latency is None:
+                state.latency = seconds
+            else:
+                weight = self.latency_weight
+                state.latency = weight * seconds + (1 - weight) * state.latency
+        finally:
+            self.__lock.release()
+
+    def _failed(self, index):
+        """Record a read that failed, ejecting the slave if it keeps
+        failing.
+        """
+        self.__lock.acquire()
+        try:
+            state = self.__states[index]
+            state.outstanding -= 1
+            state.errors += 1
+            state._failures += 1
+            if state._failures < self.eject_errors:
+                return
+        finally:
+            self.__lock.release()
+        self._eject(index)
+
+    def _eject(self, index):
+        """Take a slave out of rotation until it answers a check.
+        """
+        self.__lock.acquire()
+        try:
+            state = self.__states[index]
+            if state.ejected:
+                return
+            state.ejected = True
+            state.ejections += 1
+            state._eject_time = self.eject_time
+            state._retry_at = time.monotonic() + state._eject_time
+        finally:
+            self.__lock.release()
+        self._wake()
+
+    def _wake(self):
+        """Make sure the checking thread is running.
+        """
+        self.__lock.acquire()
+        try:
+            if self.__thread is None:
+                self.__thread = threading.Thread(target=_check_when_due,
+                                                 args=(weakref.ref(self),))
+                self.__thread.daemon = True
+                self.__thread.start()
+        finally:
+            self.__lock.release()
+
+    def _next_check(self):
+        """When the checking thread next has something to do, or None if
+        it doesn't. Called with the policy's lock held.
+        """
+        due = [state._retry_at for state in self.__states if state.ejected]
+        if due:
+            return min(due)
+        return None
+
+    def _check_delay(self):
+        """Seconds until the next check is due.
+
+        Returns None, and forgets about the calling thread, if there is
+        nothing to check.
+        """
+        self.__lock.acquire()
+        try:
+            due = self._next_check()
+            if due is None:
+                self.__thread = None
+                return None
+            return due - time.monotonic()
+        finally:
+            self.__lock.release()
+
+    def _check(self):
+        """Check on the ejected slaves that are due.
+        """
+        now = time.monotonic()
+        self.__lock.acquire()
+        try:
+            due = [state for state in self.__states
+                   if state.ejected and state._retry_at <= now]
+        finally:
+            self.__lock.release()
+
+        for state in due:
+            try:
+                self._ping(state.connection)
+                alive = True
+            except Exception:
+                alive = False
+
+            self.__lock.acquire()
+            try:
+                if alive:
+                    state.ejected = False
+                    state._failures = 0
+                    state._retry_at = None
+                else:
+                    state._eject_time = min(state._eject_time * 2,
+                                            self.max_eject_time)
+                    state._retry_at = time.monotonic() + state._eject_time
+            finally:
+                self.__lock.release()
+
+    def _ping(self, slave):
+        """Raise an exception unless `slave` is answering.
+        """
+        slave["admin"].command({"ismaster": 1})
+
+
+class RoundRobinPolicy(RoutingPolicy):
+    """Send reads to each slave in rotation in turn.
+
+    .. versionadded:: 1.3+
+    """
+
+    def __init__(self, connection):
+        super(RoundRobinPolicy, self).__init__(connection)
+        self.__counter = itertools.count()
+
+    def choose(self, states):
+        return states[next(self.__counter) % len(states)]
+
+
+class LeastOutstandingPolicy(RoutingPolicy):
+    """Send each read to the slave with the fewest requests in flight.
+
+    Ties are broken randomly.
+
+    .. versionadded:: 1.3+
+    """
+
+    def choose(self, states):
+        fewest = min([state.outstanding for state in states])
+        return random.choice([state for state in states
+                              if state.outstanding == fewest])
+
+
+class LatencyPolicy(RoutingPolicy):
+    """Send each read to the slave that has been answering fastest.
+
+    Uses an exponentially weighted moving average of each slave's response
+    times (see :attr:`~RoutingPolicy.latency_weight`), so a slave that slows
+    down stops getting reads until it recovers. Slaves that haven't
+    answered yet are tried first.
+
+    .. versionadded:: 1.3+
+    """
+
+    def choose(self, states):
+        untried = [state for state in states if state.latency is None]
+        if untried:
+            return random.choice(untried)
+        return min(states, key=lambda state: state.latency)
+
+
+class LagBoundedPolicy(RoutingPolicy):
+    """Only read from slaves that are no more than :attr:`max_lag` seconds
+    behind the master.
+
+    Each slave's lag is measured every :attr:`lag_interval` seconds by the
+    checking thread, by comparing the newest entry in the master's oplog
+    with how far the slave has synced. A slave is usable until its lag has
+    been measured. While the master's oplog is empty every slave's lag is
+    0.
+
+    The lag is read from the ``local.sources`` collection of each slave,
+    so this only supports master / slave replication (not replica sets).
+
+    This only filters the slaves, and can be combined with any other
+    policy by inheriting from both, e.g.::
+
+      class FastFreshPolicy(LagBoundedPolicy, LatencyPolicy):
+          max_lag = 2.0
+
+    .. versionadded:: 1.3+
+    """
+
+    max_lag = 10.0
+    """Largest acceptable lag, in seconds."""
+
+    lag_interval = 5.0
+    """Seconds between measurements of the slaves' lag."""
+
+    oplog = "oplog.$main"
+    """Name of the oplog collection in the master's ``local`` database."""
+
+    def __init__(self, connection):
+        super(LagBoundedPolicy, self).__init__(connection)
+        self.__measured = None
+        self._wake()
+
+    def usable(self, state):
+        if not super(LagBoundedPolicy, self).usable(state):
+            return False
+        return state.lag is None or state.lag <= self.max_lag
+
+    def _next_check(self):
+        if self.__measured is None:
+            due = time.monotonic()
+        else:
+            due = self.__measured + self.lag_interval
+        ejected = super(LagBoundedPolicy, self)._next_check()
+        if ejected is not None:
+            return min(due, ejected)
+        return due
+
+    def _check(self):
+        super(LagBoundedPolicy, self)._check()
+        if (self.__measured is not None and
+            self.__measured + self.lag_interval > time.monotonic()):
+            return
+        self.__measured = time.monotonic()
+
+        try:
+            newest = self._newest(self.connection.master)
+        except Exception:
+            return
+        for state in self.states:
+            if newest is None:
+                # nothing has been written for the slaves to fall behind on
+                state.lag = 0
+                continue
+            try:
+                state.lag = max(newest - self._synced(state.connection), 0)
+            except Exception:
+                state.lag = None
+
+    def _newest(self, master):
+        """Time of the newest operation in `master`'s oplog, or None if it
+        is empty.
+        """
+        entries = list(master["local"][self.oplog].find()
+                       .sort("$natural", -1).limit(1))
+        if not entries:
+            return None
+        return entries[0]["ts"].time
+
+    def _synced(self, slave):
+        """Time of the oldest operation `slave` has applied from each of
+        its sources.
+        """
+        return min([source["syncedTo"].time
+                    for source in slave["local"]["sources"].find()])
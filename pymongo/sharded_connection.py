@@ -0,0 +1,670 @@
+# Copyright 2009 10gen, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Client-side sharding across several independent MongoDB instances.
+
+A :class:`ShardedConnection` spreads the documents of each collection over
+a list of connections (the shards) by a shard key. Writes and queries that
+include the shard key go to a single shard. Queries that don't are sent to
+every shard in parallel, and the results are merged: in order if the
+cursor is sorted, with :meth:`~ShardedCursor.skip` and
+:meth:`~ShardedCursor.limit` applied to the merged results.
+
+.. versionadded:: 1.3+
+"""
+
+import datetime
+import heapq
+import itertools
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from . import bson
+from . import helpers
+from .connection import Connection
+from .master_slave_connection import MasterSlaveConnection
+from .errors import InvalidOperation
+from .objectid import ObjectId
+from .son import SON
+
+
+def _lookup(document, key):
+    """The value of a (possibly dotted) `key` in `document`, or None.
+    """
+    for part in key.split("."):
+        if not isinstance(document, dict):
+            return None
+        document = document.get(part)
+    return document
+
+
+def _rank(value):
+    """Roughly where the server puts values of this type when sorting.
+    """
+    if value is None:
+        return 0
+    if isinstance(value, bool):
+        return 7
+    if isinstance(value, (int, float)):
+        return 1
+    if isinstance(value, str):
+        return 2
+    if isinstance(value, dict):
+        return 3
+    if isinstance(value, list):
+        return 4
+    if isinstance(value, bytes):
+        return 5
+    if isinstance(value, ObjectId):
+        return 6
+    if isinstance(value, datetime.datetime):
+        return 8
+    return 9
+
+
+def _compare(a, b):
+    (rank_a, rank_b) = (_rank(a), _rank(b))
+    if rank_a != rank_b:
+        return rank_a < rank_b and -1 or 1
+    try:
+        if a < b:
+            return -1
+        if b < a:
+            return 1
+    except TypeError:
+        pass
+    return 0
+
+
+class _SortKey(object):
+    """Orders documents the way a cursor sorted by `ordering` (a list of
+    ``(key, direction)`` pairs) returns them.
+    """
+
+    __slots__ = ["values", "directions"]
+
+    def __init__(self, document, ordering):
+        self.values = [_lookup(document, key) for (key, _) in ordering]
+        self.directions = [direction for (_, direction) in ordering]
+
+    def __lt__(self, other):
+        for (a, b, direction) in zip(self.values, other.values,
+                                     self.directions):
+            result = _compare(a, b)
+            if result:
+                return (result < 0) == (direction > 0)
+        return False
+
+
+class ShardedConnection(object):
+    """A connection to a set of independent MongoDB instances, each holding
+    a part of every collection.
+    """
+
+    def __init__(self, shards, shard_key, max_workers=None):
+        """Create a new sharded connection.
+
+        Documents are placed by `shard_key`. If it is the name of a field,
+        the shard is chosen by hashing the field's value: every document
+        needs the field, and queries and updates are only sent to a single
+        shard if their spec matches the field exactly. Otherwise
+        `shard_key` must be a callable that takes a document, or a query
+        spec, and returns the index of its shard in `shards` - or None if
+        it can't tell, in which case every shard is used.
+
+        Raises TypeError if `shards` is not a list of at least one
+        `Connection` (or `MasterSlaveConnection`) instance.
+
+        :Parameters:
+          - `shards`: list of `Connection` instances, one per shard
+          - `shard_key`: field name or callable choosing the shard for a
+            document
+          - `max_workers` (optional): number of threads used to query the
+            shards in parallel, defaults to one per shard
+        """
+        if not isinstance(shards, list) or len(shards) == 0:
+            raise TypeError("shards must be a list of length >= 1")
+        for shard in shards:
+            if not isinstance(shard, (Connection, MasterSlaveConnection)):
+                raise TypeError("shard %r is not an instance of Connection" %
+                                shard)
+        if isinstance(shard_key, str):
+            self.__shard_function = self.__hashed
+        elif callable(shard_key):
+            self.__shard_function = shard_key
+        else:
+            raise TypeError("shard_key must be a field name or callable")
+
+        self.__shards = shards
+        self.__shard_key = shard_key
+        self.__max_workers = max_workers or len(shards)
+        self.__executor = None
+        self.__executor_lock = threading.Lock()
+        self.__databases = {}
+
+    def shards(self):
+        """The connections to the shards, in order.
+        """
+        return list(self.__shards)
+    shards = property(shards)
+
+    def shard_key(self):
+        """The field name or callable used to place documents.
+        """
+        return self.__shard_key
+    shard_key = property(shard_key)
+
+    def __hashed(self, document):
+        """Shard for `document` when the shard key is a field name.
+        """
+        if self.__shard_key not in document:
+            return None
+        value = document[self.__shard_key]
+        if isinstance(value, dict) and [k for k in value if k[:1] == "$"]:
+            return None
+        data = bson.BSON.from_dict({"k": helpers._canonical(value)})
+        return zlib.crc32(data) % len(self.__shards)
+
+    def _shard_for(self, document):
+        """Index of the shard `document` (or a query spec) belongs to, or
+        None if every shard could hold it.
+        """
+        return self.__shard_function(document)
+
+    def _map(self, function, indexes=None):
+        """Call `function` with the index of each shard in `indexes`
+        (default all of them), in parallel.
+
+        Returns the results in the same order. If any call raises an
+        exception, it is raised once every call has finished.
+        """
+        if indexes is None:
+            indexes = range(len(self.__shards))
+        indexes = list(indexes)
+        if len(indexes) == 1:
+            return [function(indexes[0])]
+        with self.__executor_lock:
+            if self.__executor is None:
+                self.__executor = ThreadPoolExecutor(self.__max_workers)
+            futures = [self.__executor.submit(function, index)
+                       for index in indexes]
+        return [future.result() for future in futures]
+
+    def close(self):
+        """Stop the threads used to query the shards in parallel.
+
+        Waits for queries that are running to finish. The connections to
+        the shards are left alone. If the :class:`ShardedConnection` is
+        used again new threads are started.
+        """
+        with self.__executor_lock:
+            executor = self.__executor
+            self.__executor = None
+        if executor is not None:
+            executor.shutdown()
+
+    def __repr__(self):
+        return "ShardedConnection(%r, %r)" % (self.__shards, self.__shard_key)
+
+    def __getattr__(self, name):
+        """Get a database by name.
+
+        Names starting with an underscore raise :class:`AttributeError`
+        (use ``connection[name]`` for those).
+
+        :Parameters:
+          - `name`: the name of the database to get
+        """
+        if name.startswith("_"):
+            raise AttributeError("ShardedConnection has no attribute %r. To "
+                                 "access the %s database, use "
+                                 "connection[%r]." % (name, name, name))
+        return self.__getitem__(name)
+
+    def __getitem__(self, name):
+        """Get a database by name.
+
+        :Parameters:
+          - `name`: the name of the database to get
+        """
+        try:
+            return self.__databases[name]
+        except KeyError:
+            return self.__databases.setdefault(name,
+                                               ShardedDatabase(self, name))
+
+    def database_names(self):
+        """Get a list of the names of the databases on any shard.
+        """
+        names = set()
+        for shard_names in self._map(lambda index:
+                                     self.__shards[index].database_names()):
+            names.update(shard_names)
+        return sorted(names)
+
+    def drop_database(self, name_or_database):
+        """Drop a database from every shard.
+
+        :Parameters:
+          - `name_or_database`: the name of a database to drop or the object
+            itself
+        """
+        name = name_or_database
+        if isinstance(name, ShardedDatabase):
+            name = name.name
+        self._map(lambda index: self.__shards[index].drop_database(name))
+
+    def start_request(self):
+        """Start a "request" on every shard.
+
+        Only operations that go to a single shard run on this thread, and
+        so in the request - operations sent to every shard run on the
+        worker threads. See
+        :meth:`~pymongo.connection.Connection.start_request`.
+        """
+        for shard in self.__shards:
+            shard.start_request()
+
+    def end_request(self):
+        """End the current "request" on every shard.
+
+        See :meth:`~pymongo.connection.Connection.end_request`.
+        """
+        for shard in self.__shards:
+            shard.end_request()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        raise TypeError("'ShardedConnection' object is not iterable")
+
+
+class ShardedDatabase(object):
+    """A database spread over the shards of a :class:`ShardedConnection`.
+    """
+
+    def __init__(self, connection, name):
+        self.__connection = connection
+        self.__name = name
+        self.__collections = {}
+
+    def connection(self):
+        """The :class:`ShardedConnection` this database belongs to.
+        """
+        return self.__connection
+    connection = property(connection)
+
+    def name(self):
+        """The name of this database.
+        """
+        return self.__name
+    name = property(name)
+
+    def shards(self):
+        """The :class:`~pymongo.database.Database` on each shard.
+        """
+        return [shard[self.__name] for shard in self.__connection.shards]
+    shards = property(shards)
+
+    def __repr__(self):
+        return "ShardedDatabase(%r, %r)" % (self.__connection, self.__name)
+
+    def __getattr__(self, name):
+        """Get a collection of this database by name.
+
+        Names starting with an underscore raise :class:`AttributeError`
+        (use ``database[name]`` for those).
+
+        :Parameters:
+          - `name`: the name of the collection to get
+        """
+        if name.startswith("_"):
+            raise AttributeError("ShardedDatabase has no attribute %r. To "
+                                 "access the %s collection, use "
+                                 "database[%r]." % (name, name, name))
+        return self.__getitem__(name)
+
+    def __getitem__(self, name):
+        """Get a collection of this database by name.
+
+        :Parameters:
+          - `name`: the name of the collection to get
+        """
+        try:
+            return self.__collections[name]
+        except KeyError:
+            return self.__collections.setdefault(
+                name, ShardedCollection(self, name))
+
+    def collection_names(self):
+        """Get a list of the names of the collections on any shard.
+        """
+        shards = self.shards
+        names = set()
+        for shard_names in self.__connection._map(
+            lambda index: shards[index].collection_names()):
+            names.update(shard_names)
+        return sorted(names)
+
+    def drop_collection(self, name_or_collection):
+        """Drop a collection from every shard.
+
+        :Parameters:
+          - `name_or_collection`: the name of a collection to drop or the
+            collection object itself
+        """
+        name = name_or_collection
+        if isinstance(name, ShardedCollection):
+            name = name.name
+        shards = self.shards
+        self.__connection._map(
+            lambda index: shards[index].drop_collection(name))
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        raise TypeError("'ShardedDatabase' object is not iterable")
+
+
+class ShardedCollection(object):
+    """A collection spread over the shards of a :class:`ShardedConnection`.
+
+    Supports the same operations as a
+    :class:`~pymongo.collection.Collection` for inserting, updating,
+    removing, finding and counting documents.
+    """
+
+    def __init__(self, database, name):
+        self.__database = database
+        self.__name = name
+        self.__shards = [shard[name] for shard in database.shards]
+
+    def database(self):
+        """The :class:`ShardedDatabase` this collection belongs to.
+        """
+        return self.__database
+    database = property(database)
+
+    def name(self):
+        """The name of this collection.
+        """
+        return self.__name
+    name = property(name)
+
+    def full_name(self):
+        """The full name of this collection: database name and collection
+        name, separated by a dot.
+        """
+        return "%s.%s" % (self.__database.name, self.__name)
+    full_name = property(full_name)
+
+    def shards(self):
+        """The :class:`~pymongo.collection.Collection` on each shard.
+        """
+        return list(self.__shards)
+    shards = property(shards)
+
+    def __repr__(self):
+        return "ShardedCollection(%r, %r)" % (self.__database, self.__name)
+
+    def __map(self, function, indexes=None):
+        return self.__database.connection._map(function, indexes)
+
+    def __shard_for(self, document):
+        index = self.__database.connection._shard_for(document)
+        if index is None:
+            raise InvalidOperation("no shard key in %r" % (document,))
+        return index
+
+    def __indexes_for(self, spec):
+        """Indexes of the shards that a query for `spec` has to go to.
+        """
+        index = self.__database.connection._shard_for(spec)
+        if index is None:
+            return list(range(len(self.__shards)))
+        return [index]
+
+    def save(self, to_save, manipulate=True, safe=False, deadline=None):
+        """Save a document on its shard.
+
+        Raises InvalidOperation if the document has no shard key. See
+        :meth:`~pymongo.collection.Collection.save`.
+        """
+        if not isinstance(to_save, dict):
+            raise TypeError("cannot save object of type %s" % type(to_save))
+        return self.__shards[self.__shard_for(to_save)].save(
+            to_save, manipulate, safe, deadline=deadline)
+
+    def insert(self, doc_or_docs,
+               manipulate=True, safe=False, check_keys=True, deadline=None):
+        """Insert a document(s), each on its shard.
+
+        Documents for different shards are inserted in parallel. If
+        `manipulate` is set documents without an ``_id`` are given one
+        before they are placed, so ``"_id"`` works as a shard key. Raises
+        InvalidOperation, without inserting anything, if a document has no
+        shard key. See :meth:`~pymongo.collection.Collection.insert`.
+        """
+        docs = doc_or_docs
+        if isinstance(docs, dict):
+            docs = [docs]
+        docs = list(docs)
+
+        batches = {}
+        for doc in docs:
+            if manipulate and "_id" not in doc:
+                doc["_id"] = ObjectId()
+            batches.setdefault(self.__shard_for(doc), []).append(doc)
+
+        self.__map(lambda index: self.__shards[index].insert(
+            batches[index], manipulate, safe, check_keys, deadline=deadline),
+                   sorted(batches))
+
+        ids = [doc.get("_id", None) for doc in docs]
+        return len(ids) == 1 and ids[0] or ids
+
+    def update(self, spec, document, upsert=False, manipulate=False,
+               safe=False, multi=False, deadline=None):
+        """Update a document(s).
+
+        Goes to a single shard if `spec` includes the shard key, otherwise
+        to every shard in parallel - which is only allowed for `multi`
+        updates that don't `upsert`, since a single document update could
+        change a document on each shard. Raises InvalidOperation in that
+        case. See :meth:`~pymongo.collection.Collection.update`.
+        """
+        if not isinstance(spec, dict):
+            raise TypeError("spec must be an instance of dict")
+        indexes = self.__indexes_for(spec)
+        if len(indexes) > 1 and (upsert or not multi):
+            raise InvalidOperation("an update without the shard key must be "
+                                   "multi and can't upsert")
+        self.__map(lambda index: self.__shards[index].update(
+            spec, document, upsert, manipulate, safe, multi,
+            deadline=deadline), indexes)
+
+    def remove(self, spec_or_object_id=None, safe=False, deadline=None):
+        """Remove a document(s), from every shard unless the spec includes
+        the shard key. See :meth:`~pymongo.collection.Collection.remove`.
+        """
+        spec = spec_or_object_id
+        if spec is None:
+            spec = {}
+        if isinstance(spec, ObjectId):
+            spec = {"_id": spec}
+        if not isinstance(spec, dict):
+            raise TypeError("spec must be an instance of dict, not %s" %
+                            type(spec))
+        self.__map(lambda index: self.__shards[index].remove(
+            spec, safe, deadline=deadline), self.__indexes_for(spec))
+
+    def find_one(self, spec_or_object_id=None, fields=None, **kwargs):
+        """Get a single document, from every shard unless the spec includes
+        the shard key. See :meth:`~pymongo.collection.Collection.find_one`.
+        """
+        spec = spec_or_object_id
+        if spec is None:
+            spec = SON()
+        if isinstance(spec, ObjectId):
+            spec = SON({"_id": spec})
+
+        for result in self.find(spec, fields, limit=-1, **kwargs):
+            return result
+        return None
+
+    def find(self, spec=None, fields=None, skip=0, limit=0, **kwargs):
+        """Query the shards.
+
+        Returns a :class:`ShardedCursor`. Takes the same arguments as
+        :meth:`~pymongo.collection.Collection.find`.
+        """
+        if spec is None:
+            spec = SON()
+        if not isinstance(spec, dict):
+            raise TypeError("spec must be an instance of dict")
+        return ShardedCursor(self, self.__indexes_for(spec), spec, fields,
+                             skip, limit, kwargs)
+
+    def count(self):
+        """Get the number of documents in this collection, on all shards.
+        """
+        return self.find().count()
+
+
+class ShardedCursor(object):
+    """A cursor over the results of a query on one or more shards.
+
+    Every shard is queried in parallel when iteration starts, each getting
+    its first batch of results. After that more results are fetched from a
+    shard as they are needed. If the cursor is sorted the results are merge
+    sorted, otherwise they come shard by shard.
+
+    Should not be created directly - see
+    :meth:`ShardedCollection.find`.
+    """
+
+    def __init__(self, collection, indexes, spec, fields, skip, limit, kwargs):
+        self.__collection = collection
+        self.__indexes = indexes
+        self.__spec = spec
+        self.__fields = fields
+        self.__skip = skip
+        self.__limit = limit
+        self.__kwargs = kwargs
+        self.__ordering = None
+        self.__results = None
+
+    def collection(self):
+        """The :class:`ShardedCollection` this cursor is iterating.
+        """
+        return self.__collection
+    collection = property(collection)
+
+    def __check_okay_to_chain(self):
+        if self.__results is not None:
+            raise InvalidOperation("cannot set options after executing query")
+
+    def limit(self, limit):
+        """Limit the number of results returned, across all shards.
+
+        See :meth:`~pymongo.cursor.Cursor.limit`.
+        """
+        if not isinstance(limit, int):
+            raise TypeError("limit must be an int")
+        self.__check_okay_to_chain()
+        self.__limit = limit
+        return self
+
+    def skip(self, skip):
+        """Skip the first `skip` results, across all shards.
+
+        See :meth:`~pymongo.cursor.Cursor.skip`.
+        """
+        if not isinstance(skip, int):
+            raise TypeError("skip must be an int")
+        self.__check_okay_to_chain()
+        self.__skip = skip
+        return self
+
+    def sort(self, key_or_list, direction=None):
+        """Sort the results, across all shards.
+
+        See :meth:`~pymongo.cursor.Cursor.sort`.
+        """
+        self.__check_okay_to_chain()
+        self.__ordering = helpers._index_list(key_or_list, direction)
+        return self
+
+    def count(self, with_limit_and_skip=False):
+        """Get the total size of the results set on all shards.
+
+        See :meth:`~pymongo.cursor.Cursor.count`.
+        """
+        shards = self.__collection.shards
+        spec = self.__spec
+        total = sum(self.__collection.database.connection._map(
+            lambda index: shards[index].find(spec).count(), self.__indexes))
+        if with_limit_and_skip:
+            total = max(total - self.__skip, 0)
+            if self.__limit:
+                total = min(total, abs(self.__limit))
+        return total
+
+    def rewind(self):
+        """Rewind this cursor to its unevaluated state.
+        """
+        self.__results = None
+        return self
+
+    def __open(self, index):
+        """Query one shard and fetch the first batch of results.
+        """
+        limit = 0
+        if self.__limit:
+            # every shard could have all of the results we return
+            limit = self.__skip + abs(self.__limit)
+            if self.__limit < 0:
+                limit = -limit
+        cursor = self.__collection.shards[index].find(
+            self.__spec, self.__fields, limit=limit, **self.__kwargs)
+        if self.__ordering:
+            cursor.sort(self.__ordering)
+        cursor._refresh()
+        return cursor
+
+    def __execute(self):
+        connection = self.__collection.database.connection
+        cursors = connection._map(self.__open, self.__indexes)
+        if self.__ordering:
+            ordering = self.__ordering
+            results = heapq.merge(*cursors,
+                                  key=lambda doc: _SortKey(doc, ordering))
+        else:
+            results = itertools.chain(*cursors)
+
+        stop = None
+        if self.__limit:
+            stop = self.__skip + abs(self.__limit)
+        return itertools.islice(results, self.__skip, stop)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.__results is None:
+            self.__results = self.__execute()
+        return next(self.__results)
@@ -57,8 +57,9 @@ class SON(OrderedDict):
 
     .. [#dt] datetime.datetime instances will be rounded to the nearest
        millisecond when saved
-    .. [#dt2] all datetime.datetime instances are treated as *naive*. clients
-       should always use UTC.
+    .. [#dt2] timezone aware datetime.datetime instances are converted to
+       UTC when saved. naive instances are assumed to already be in UTC, and
+       all datetimes are *naive* (and in UTC) when retrieved.
     """
 
     def __init__(self, data=None, **kwargs):
@@ -119,8 +120,8 @@ class SON(OrderedDict):
     def values(self):
         return [v for _, v in self.items()]
 
-#    def items(self):
-#        return list(self.items())
+    def items(self):
+        return [(k, self[k]) for k in self.__keys]
 
     def clear(self):
         for key in list(self.keys()):
@@ -63,6 +63,38 @@ class SONManipulator(object):
             return SON(son)
         return son
 
+    def transform_incoming_many(self, sons, collection):
+        """Manipulate a list of incoming SON objects.
+
+        Returns a list of the transformed objects. The default calls
+        :meth:`transform_incoming` for each object - override this to handle
+        a whole batch at once.
+
+        :Parameters:
+          - `sons`: list of SON objects to be inserted into the database
+          - `collection`: the collection the objects are being inserted into
+
+        .. versionadded:: 1.3+
+        """
+        transform = self.transform_incoming
+        return [transform(son, collection) for son in sons]
+
+    def transform_outgoing_many(self, sons, collection):
+        """Manipulate a list of outgoing SON objects.
+
+        Returns a list of the transformed objects. The default calls
+        :meth:`transform_outgoing` for each object - override this to handle
+        a whole batch (e.g. a batch of query results) at once.
+
+        :Parameters:
+          - `sons`: list of SON objects being retrieved from the database
+          - `collection`: the collection these objects were stored in
+
+        .. versionadded:: 1.3+
+        """
+        transform = self.transform_outgoing
+        return [transform(son, collection) for son in sons]
+
 
 class ObjectIdInjector(SONManipulator):
     """A son manipulator that adds the _id field if it is missing.
@@ -75,6 +107,14 @@ class ObjectIdInjector(SONManipulator):
             son["_id"] = ObjectId()
         return son
 
+    def transform_incoming_many(self, sons, collection):
+        """Add an _id field to each object that is missing one.
+        """
+        missing = [son for son in sons if not "_id" in son]
+        for (son, oid) in zip(missing, ObjectId.generate_many(len(missing))):
+            son["_id"] = oid
+        return sons
+
 
 # This is now handled during BSON encoding (for performance reasons),
 # but I'm keeping this here as a reference for those implementing new
@@ -159,22 +199,42 @@ class AutoReference(SONManipulator):
     def transform_outgoing(self, son, collection):
         """Replace DBRefs with embedded documents.
         """
+        return self.transform_outgoing_many([son], collection)[0]
 
-        def transform_value(value):
+    def transform_outgoing_many(self, sons, collection):
+        """Replace DBRefs with embedded documents.
+
+        All of the references in the batch are collected first and then
+        resolved together with
+        :meth:`~pymongo.database.Database.dereference_many`, so there is one
+        query per referenced collection rather than one per reference.
+        """
+        slots = []
+        refs = []
+
+        def transform_value(value, container, key):
             if isinstance(value, DBRef):
-                return self.__database.dereference(value)
+                slots.append((container, key))
+                refs.append(value)
             elif isinstance(value, list):
-                return [transform_value(v) for v in value]
+                value = list(value)
+                for (index, item) in enumerate(value):
+                    value[index] = transform_value(item, value, index)
             elif isinstance(value, dict):
-                return transform_dict(SON(value))
+                value = transform_dict(SON(value))
             return value
 
         def transform_dict(object):
             for (key, value) in list(object.items()):
-                object[key] = transform_value(value)
+                object[key] = transform_value(value, object, key)
             return object
 
-        return transform_dict(SON(son))
+        sons = [transform_dict(SON(son)) for son in sons]
+        if refs:
+            documents = self.__database.dereference_many(refs)
+            for ((container, key), document) in zip(slots, documents):
+                container[key] = document
+        return sons
 
 # TODO make a generic translator for custom types. Take encode, decode,
 # should_encode and should_decode functions and just encode and decode where
@@ -180,3 +180,44 @@ struct tm * const tmp;
 
 #endif
 #endif
+
+/*
+ * Based on the algorithms described in "chrono-Compatible Low-Level Date
+ * Algorithms" by Howard Hinnant, which are in the public domain. Eras are
+ * 400 year cycles, so the arithmetic only has to deal with non-negative
+ * values inside an era.
+ */
+long long days_from_civil(int year, int month, int day) {
+    long long era;
+    unsigned year_of_era,
+        day_of_year,
+        day_of_era;
+
+    year -= month <= 2;
+    era = (year >= 0 ? year : year - 399) / 400;
+    year_of_era = (unsigned)(year - era * 400);
+    day_of_year = (153 * (month + (month > 2 ? -3 : 9)) + 2) / 5 + day - 1;
+    day_of_era = year_of_era * 365 + year_of_era / 4 - year_of_era / 100 +
+        day_of_year;
+    return era * 146097 + (long long)day_of_era - 719468;
+}
+
+void civil_from_days(long long days, int* year, int* month, int* day) {
+    long long era;
+    unsigned day_of_era,
+        year_of_era,
+        day_of_year,
+        month_part;
+
+    days += 719468;
+    era = (days >= 0 ? days : days - 146096) / 146097;
+    day_of_era = (unsigned)(days - era * 146097);
+    year_of_era = (day_of_era - day_of_era / 1460 + day_of_era / 36524 -
+                   day_of_era / 146096) / 365;
+    day_of_year = day_of_era - (365 * year_of_era + year_of_era / 4 -
+                                year_of_era / 100);
+    month_part = (5 * day_of_year + 2) / 153;
+    *day = (int)(day_of_year - (153 * month_part + 2) / 5 + 1);
+    *month = (int)(month_part < 10 ? month_part + 3 : month_part - 9);
+    *year = (int)(year_of_era + era * 400) + (*month <= 2);
+}
@@ -41,4 +41,12 @@ time_t mkgmtime(const struct tm* tmp);
 #define LOCALTIME(timeinfo, seconds) localtime_r((seconds), (timeinfo)), 0
 #endif
 
+/*
+ * Pure integer conversions between proleptic Gregorian dates and days
+ * since the epoch. Unlike timegm / gmtime these work for any year and
+ * don't depend on the size of time_t.
+ */
+long long days_from_civil(int year, int month, int day);
+void civil_from_days(long long days, int* year, int* month, int* day);
+
 #endif
@@ -0,0 +1,123 @@
+# Copyright 2009 10gen, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tools for representing MongoDB internal timestamps.
+
+These are mostly useful for reading the oplog, where each operation's *ts*
+field is a timestamp.
+"""
+
+import calendar
+import datetime
+
+_MAX_UINT32 = 0xFFFFFFFF
+
+
+class Timestamp(object):
+    """MongoDB internal timestamp, a `time` and an `inc`.
+
+    `time` is the number of seconds since the epoch (UTC) and `inc` is an
+    ordinal distinguishing timestamps within the same second. Timestamps
+    order chronologically.
+
+    Raises TypeError if `time` is not an instance of (int, long,
+    :class:`~datetime.datetime`) or `inc` is not an instance of (int,
+    long). Raises ValueError if either is out of range for an unsigned 32
+    bit integer.
+
+    :Parameters:
+      - `time`: seconds since the epoch, or a :class:`~datetime.datetime`
+        (naive datetimes are assumed to be UTC)
+      - `inc`: the ordinal
+
+    .. versionadded:: 1.3+
+    """
+
+    __slots__ = ("__time", "__inc")
+
+    def __init__(self, time, inc):
+        if isinstance(time, datetime.datetime):
+            offset = time.utcoffset()
+            if offset is not None:
+                time = time - offset
+            time = calendar.timegm(time.timetuple())
+        if not isinstance(time, int):
+            raise TypeError("time must be an instance of int or datetime")
+        if not isinstance(inc, int):
+            raise TypeError("inc must be an instance of int")
+        if not 0 <= time <= _MAX_UINT32:
+            raise ValueError("time must be in range 0 - %d" % _MAX_UINT32)
+        if not 0 <= inc <= _MAX_UINT32:
+            raise ValueError("inc must be in range 0 - %d" % _MAX_UINT32)
+        self.__time = time
+        self.__inc = inc
+
+    def __getstate__(self):
+        return (self.__time, self.__inc)
+
+    def __setstate__(self, state):
+        (self.__time, self.__inc) = state
+
+    def time(self):
+        """Seconds since the epoch (UTC).
+        """
+        return self.__time
+    time = property(time)
+
+    def inc(self):
+        """The ordinal of this timestamp within its second.
+        """
+        return self.__inc
+    inc = property(inc)
+
+    def as_datetime(self):
+        """The :attr:`time` as a naive :class:`~datetime.datetime` in UTC.
+        """
+        return datetime.datetime.utcfromtimestamp(self.__time)
+
+    def __repr__(self):
+        return "Timestamp(%d, %d)" % (self.__time, self.__inc)
+
+    def __eq__(self, other):
+        if isinstance(other, Timestamp):
+            return (self.__time, self.__inc) == (other.__time, other.__inc)
+        return NotImplemented
+
+    def __ne__(self, other):
+        if isinstance(other, Timestamp):
+            return (self.__time, self.__inc) != (other.__time, other.__inc)
+        return NotImplemented
+
+    def __lt__(self, other):
+        if isinstance(other, Timestamp):
+            return (self.__time, self.__inc) < (other.__time, other.__inc)
+        return NotImplemented
+
+    def __le__(self, other):
+        if isinstance(other, Timestamp):
+            return (self.__time, self.__inc) <= (other.__time, other.__inc)
+        return NotImplemented
+
+    def __gt__(self, other):
+        if isinstance(other, Timestamp):
+            return (self.__time, self.__inc) > (other.__time, other.__inc)
+        return NotImplemented
+
+    def __ge__(self, other):
+        if isinstance(other, Timestamp):
+            return (self.__time, self.__inc) >= (other.__time, other.__inc)
+        return NotImplemented
+
+    def __hash__(self):
+        return hash((self.__time, self.__inc))
@@ -133,7 +133,8 @@ else:
                            include_dirs=['pymongo'],
                            sources=['pymongo/_cbsonmodule.c',
                                     'pymongo/time_helpers.c',
-                                    'pymongo/encoding_helpers.c'])]
+                                    'pymongo/encoding_helpers.c',
+                                    'pymongo/json_helpers.c'])]
 
 setup(
     name="pymongo",
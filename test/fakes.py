@@ -0,0 +1,77 @@
+# Copyright 2009 10gen, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Connections that answer from canned replies, for tests that don't need
+a server."""
+
+import struct
+import time
+import sys
+sys.path[0:0] = [""]
+
+from pymongo import bson
+from pymongo.connection import Connection
+
+
+def reply(docs, cursor_id=0, starting_from=0, flags=0):
+    """The body of an OP_REPLY returning `docs`.
+    """
+    data = b"".join([bson.BSON.from_dict(doc) for doc in docs])
+    return struct.pack("<iqii", flags, cursor_id, starting_from,
+                       len(docs)) + data
+
+
+def error_reply(error):
+    """The body of an OP_REPLY for a query that failed with `error`.
+    """
+    return reply([{"$err": error}], flags=2)
+
+
+def opcode(message):
+    """The opcode of a ``(request_id, data)`` message.
+    """
+    return struct.unpack("<i", message[1][12:16])[0]
+
+
+class CannedConnection(Connection):
+    """A connection that never touches the network.
+
+    Messages that expect a response are answered by respond(), which
+    subclasses override - by default every query gets ``{"ok": 1}``. Kill
+    cursors messages are recorded in `killed`.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs["_connect"] = False
+        Connection.__init__(self, *args, **kwargs)
+        self.killed = []
+
+    def kill_cursors(self, cursor_ids):
+        self.killed.append(list(cursor_ids))
+
+    def respond(self, message):
+        return reply([{"ok": 1}])
+
+    def _send_message_with_response(self, message, _sock=None, **kwargs):
+        return self.respond(message)
+
+
+def wait_for(condition, timeout=5):
+    """Wait up to `timeout` seconds for `condition()` to be true, and
+    return it.
+    """
+    start = time.monotonic()
+    while not condition() and time.monotonic() - start < timeout:
+        time.sleep(0.01)
+    return condition()
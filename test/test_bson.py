@@ -18,8 +18,11 @@
 
 import unittest
 import datetime
+import mmap
 import re
+import os
 import sys
+import tempfile
 try:
     import uuid
     should_test_uuid = True
@@ -30,13 +33,17 @@ sys.path[0:0] = [""]
 #from nose.plugins.skip import SkipTest
 
 import qcheck
+import pymongo.bson
 from pymongo.binary import Binary
 from pymongo.code import Code
 from pymongo.objectid import ObjectId
 from pymongo.dbref import DBRef
 from pymongo.son import SON
-from pymongo.bson import BSON, is_valid, _to_dicts
-from pymongo.errors import InvalidDocument, InvalidStringData
+from pymongo.timestamp import Timestamp
+from pymongo.bson import BSON, BSONFile, BSONFileWriter, is_valid
+from pymongo.bson import _to_dicts, _split_documents, _get_key
+from pymongo.bson import _KEY_CACHE_SIZE
+from pymongo.errors import InvalidBSON, InvalidDocument, InvalidStringData
 
 
 class TestBSON(unittest.TestCase):
@@ -63,6 +70,38 @@ class TestBSON(unittest.TestCase):
         qcheck.check_unittest(self, qcheck.isnt(is_valid),
                               qcheck.gen_string(qcheck.gen_range(0, 40)))
 
+    def test_split_documents(self):
+        first = BSON.from_dict({"a": [1, 2], "c": Code("x", {"y": 1}),
+                                "s": "string"})
+        second = BSON.from_dict({})
+        self.assert_(is_valid(first))
+
+        self.assertEqual([], _split_documents(b""))
+        self.assertEqual([(0, len(first)), (len(first), len(first) + 5)],
+                         _split_documents(first + second))
+        self.assertEqual([(0, len(first)), (len(first), len(first) + 5)],
+                         _split_documents(first + second, True))
+
+        self.assertRaises(InvalidBSON, _split_documents, first[:-1])
+        self.assertRaises(InvalidBSON, _split_documents, first + b"\x05")
+        self.assertRaises(InvalidBSON, _split_documents,
+                          b"\x05\x00\x00\x00\x01")
+
+        # only validation looks inside the documents
+        bad_type = b"\x07\x00\x00\x00\x63\x00\x00"
+        self.assertEqual([(0, 7)], _split_documents(bad_type))
+        self.assertRaises(InvalidBSON, _split_documents, bad_type, True)
+
+    def test_key_cache(self):
+        for i in range(2 * _KEY_CACHE_SIZE):
+            self.assertEqual("key%d" % i, _get_key(b"key%d" % i))
+            self.assertEqual("common", _get_key(b"common"))
+        # the cache is bounded, and keeps the keys that are still in use
+        self.assert_(_get_key.cache_info().currsize <= _KEY_CACHE_SIZE)
+        hits = _get_key.cache_info().hits
+        self.assert_(_get_key(b"common") is _get_key(b"common"))
+        self.assertEqual(hits + 2, _get_key.cache_info().hits)
+
     def test_basic_to_dict(self):
         self.assertEqual({"test": "hello world"},
                          BSON("\x1B\x00\x00\x00\x0E\x74\x65\x73\x74\x00\x0C"
@@ -75,7 +114,7 @@ class TestBSON(unittest.TestCase):
                                    "\x00\x00"))
 
     def test_data_timestamp(self):
-        self.assertEqual({"test": (4, 20)},
+        self.assertEqual({"test": Timestamp(20, 4)},
                          BSON("\x13\x00\x00\x00\x11\x74\x65\x73\x74\x00\x04"
                               "\x00\x00\x00\x14\x00\x00\x00\x00").to_dict())
 
@@ -239,14 +278,159 @@ class TestBSON(unittest.TestCase):
         self.assertRaises(InvalidDocument, BSON.from_dict, {"a": re.compile("ab\x00c")})
         self.assertRaises(InvalidDocument, BSON.from_dict, {"a": re.compile("ab\x00c")})
 
-# TODO this test doesn't pass w/ C extension
-#
-# timegm doesn't handle years < 1900 (negative), at least on OS X
-# we probably need to use our own version of timegm
+    def test_custom_class(self):
+        doc = SON([("z", 1), ("a", {"y": 2, "x": [{"w": 3}]}),
+                   ("ref", DBRef("coll", 5))])
+        bson = BSON.from_dict(doc)
+
+        self.assert_(isinstance(bson.to_dict(), dict))
+        self.failIf(isinstance(bson.to_dict(), SON))
+
+        as_son = bson.to_dict(SON)
+        self.assert_(isinstance(as_son, SON))
+        self.assertEqual(["z", "a", "ref"], list(as_son.keys()))
+        self.assert_(isinstance(as_son["a"], SON))
+        self.assert_(isinstance(as_son["a"]["x"][0], SON))
+        self.assertEqual(DBRef("coll", 5), as_son["ref"])
+
+        class Model(object):
+            __slots__ = ["items"]
+
+            def __init__(self, items):
+                self.items = items
+
+        as_model = bson.to_dict(Model)
+        self.assert_(isinstance(as_model, Model))
+        self.assertEqual("z", as_model.items[0][0])
+        self.assert_(isinstance(as_model.items[1][1], Model))
+        self.assertEqual(DBRef("coll", 5), as_model.items[2][1])
+
+        self.assertEqual([doc, doc], _to_dicts(bson + bson, SON))
+
+    def test_shared_keys(self):
+        bson = BSON.from_dict({"hello": "world", "sub": {"hello": 1}})
+        (first, second) = _to_dicts(bson + bson)
+
+        self.assertEqual(first, second)
+        key = [k for k in first if k == "hello"][0]
+        self.assert_(key is [k for k in second if k == "hello"][0])
+        self.assert_(key is [k for k in second["sub"] if k == "hello"][0])
+
+    def test_bson_file(self):
+        (fd, filename) = tempfile.mkstemp(suffix=".bson")
+        os.close(fd)
+        try:
+            docs = [{"x": i, "s": "hello" * i} for i in range(10)]
+
+            writer = BSONFileWriter(filename)
+            writer.write(docs[0])
+            writer.write_many(docs[1:5])
+            writer.close()
+            writer = BSONFileWriter(filename, append=True)
+            writer.write_many(docs[5:])
+            writer.close()
+
+            bson_file = BSONFile(filename)
+            self.assertEqual(docs, list(bson_file))
+            self.assertRaises(TypeError, len, bson_file)
+            offsets = list(bson_file.offsets())
+            self.assertEqual(10, len(offsets))
+            self.assertEqual(docs[3], bson_file.read(offsets[3]))
+            self.assertRaises(InvalidBSON, bson_file.read, offsets[3] + 1)
+            bson_file.close()
+
+            bson_file = BSONFile(filename, as_class=SON, index=True)
+            self.assertEqual(10, len(bson_file))
+            self.assertEqual(docs[7], bson_file[7])
+            self.assert_(isinstance(bson_file[-1], SON))
+            bson_file.close()
+
+            BSONFileWriter(filename).close()
+            bson_file = BSONFile(filename, index=True)
+            self.assertEqual([], list(bson_file))
+            self.assertEqual(0, len(bson_file))
+            bson_file.close()
+        finally:
+            os.remove(filename)
+
+    def test_bson_file_closed_on_error(self):
+        (fd, filename) = tempfile.mkstemp(suffix=".bson")
+        os.close(fd)
+        opened = []
+
+        def recording_open(*args):
+            opened.append(open(*args))
+            return opened[-1]
+
+        class FailingMmap(mmap.mmap):
+            def __new__(cls, *args, **kwargs):
+                raise OSError("mmap failed")
+        try:
+            writer = BSONFileWriter(filename)
+            writer.write({"x": 1})
+            writer.close()
+            pymongo.bson.open = recording_open
+            real_mmap = pymongo.bson.mmap.mmap
+            pymongo.bson.mmap.mmap = FailingMmap
+            try:
+                self.assertRaises(OSError, BSONFile, filename)
+            finally:
+                pymongo.bson.mmap.mmap = real_mmap
+            self.assert_(opened[-1].closed)
+
+            # a truncated document fails the index and closes the file
+            f = open(filename, "ab")
+            f.write(b"\x10\x00\x00\x00")
+            f.close()
+            self.assertRaises(InvalidBSON, BSONFile, filename, index=True)
+            self.assert_(opened[-1].closed)
+        finally:
+            del pymongo.bson.open
+            os.remove(filename)
+
+    def test_date_before_epoch(self):
+        doc = {"date": datetime.datetime(1600, 5, 5)}
+        self.assertEqual(doc, BSON.from_dict(doc).to_dict())
+
+    def test_date_precision(self):
+        doc = {"date": datetime.datetime(2009, 12, 9, 15, 24, 37, 999999)}
+        self.assertEqual(datetime.datetime(2009, 12, 9, 15, 24, 37, 999000),
+                         BSON.from_dict(doc).to_dict()["date"])
+
+        doc = {"date": datetime.datetime(1, 1, 1)}
+        self.assertEqual(doc, BSON.from_dict(doc).to_dict())
+        doc = {"date": datetime.datetime(9999, 12, 31, 23, 59, 59, 999000)}
+        self.assertEqual(doc, BSON.from_dict(doc).to_dict())
 
-#     def test_date_before_epoch(self):
-#         doc = {"date": datetime.datetime(1600, 5, 5)}
-#         self.assertEqual(doc, BSON.from_dict(doc).to_dict())
+    def test_aware_datetime(self):
+        class FixedOffset(datetime.tzinfo):
+            def __init__(self, minutes):
+                self.__offset = datetime.timedelta(minutes=minutes)
+
+            def utcoffset(self, dt):
+                return self.__offset
+
+            def dst(self, dt):
+                return datetime.timedelta(0)
+
+        utc = datetime.datetime(2010, 1, 1, 17, 30)
+        aware = datetime.datetime(2010, 1, 1, 12, 0, tzinfo=FixedOffset(-330))
+        self.assertEqual(utc, BSON.from_dict({"d": aware}).to_dict()["d"])
+        self.assertEqual(BSON.from_dict({"d": utc}),
+                         BSON.from_dict({"d": aware}))
+
+    def test_raw_dates(self):
+        epoch = datetime.datetime(1970, 1, 1)
+        doc = {"a": epoch + datetime.timedelta(milliseconds=1234567890123),
+               "b": [epoch - datetime.timedelta(milliseconds=1)],
+               "c": {"d": epoch}}
+        bson = BSON.from_dict(doc)
+
+        self.assertEqual(doc, bson.to_dict())
+        raw = bson.to_dict(raw_dates=True)
+        self.assertEqual({"a": 1234567890123, "b": [-1], "c": {"d": 0}}, raw)
+        self.assertEqual([raw, raw], _to_dicts(bson + bson, dict, True))
+        self.assertEqual(raw["a"], bson.to_dict(SON, True)["a"])
 
 
 if __name__ == "__main__":
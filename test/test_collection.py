@@ -16,7 +16,9 @@
 import warnings
 import unittest
 import re
+import io
 import itertools
+import json
 import time
 import sys
 sys.path[0:0] = [""]
@@ -30,9 +32,12 @@ from pymongo.objectid import ObjectId
 from pymongo.code import Code
 from pymongo.binary import Binary
 from pymongo.collection import Collection
-from pymongo.errors import InvalidName, OperationFailure, InvalidDocument
+from pymongo.errors import (InvalidName, OperationFailure, InvalidDocument,
+                            AutoReconnect, CursorNotFound)
 from pymongo import ASCENDING, DESCENDING
 from pymongo.son import SON
+from pymongo.bson import _to_dicts
+from fakes import CannedConnection, reply, error_reply, opcode
 
 
 class TestCollection(unittest.TestCase):
@@ -779,6 +784,22 @@ class TestCollection(unittest.TestCase):
 
         self.assertRaises(TypeError, db.test.find_one, 6)
 
+    def test_as_class(self):
+        c = self.db.test
+        c.drop()
+        c.insert({"x": 1})
+
+        self.assert_(isinstance(c.find().next(), dict))
+        self.failIf(isinstance(c.find().next(), SON))
+        self.assert_(isinstance(c.find(as_class=SON).next(), SON))
+
+        self.assert_(isinstance(c.find_one(), dict))
+        self.failIf(isinstance(c.find_one(), SON))
+        self.assert_(isinstance(c.find_one(as_class=SON), SON))
+
+        self.assertEqual(1, c.find_one(as_class=SON)["x"])
+        self.assertEqual(1, c.find(as_class=SON).next()["x"])
+
     def test_insert_adds_id(self):
         doc = {"hello": "world"}
         self.db.test.insert(doc)
@@ -881,6 +902,125 @@ class TestCollection(unittest.TestCase):
         self.assertEqual(1, result.find_one({"_id": "dog"})["value"])
         self.assertEqual(None, result.find_one({"_id": "mouse"}))
 
+    def test_export(self):
+        db = self.db
+        db.drop_collection("test")
+        self.assertRaises(ValueError, db.test.export, {}, io.BytesIO(),
+                          "csv")
+
+        docs = [{"_id": i, "x": "x" * i} for i in range(2500)]
+        db.test.insert(docs)
+
+        out = io.BytesIO()
+        self.assertEqual(2500, db.test.export({}, out, batch_size=1000))
+        self.assertEqual(docs, _to_dicts(out.getvalue()))
+
+        out = io.BytesIO()
+        self.assertEqual(10, db.test.export({"_id": {"$lt": 10}}, out,
+                                            "jsonl", fields=["_id"]))
+        lines = out.getvalue().decode("utf-8").splitlines()
+        self.assertEqual([{"_id": i} for i in range(10)],
+                         [json.loads(line) for line in lines])
+
+    def test_tail(self):
+        db = self.db
+        db.drop_collection("test")
+        db.create_collection("test", {"capped": True, "size": 10000})
+
+        self.assertRaises(TypeError, next, db.test.tail(5))
+
+        db.test.insert({"x": 1})
+        db.test.insert({"x": 2})
+        tail = db.test.tail(min_delay=0.001, max_delay=0.01)
+        self.assertEqual(1, next(tail)["x"])
+        self.assertEqual(2, next(tail)["x"])
+
+        db.test.insert({"x": 3})
+        self.assertEqual(3, next(tail)["x"])
+
+        # only documents after the last one seen are yielded after resuming
+        tail = db.test.tail({"x": {"$gt": 1}}, fields=["x"],
+                            min_delay=0.001, max_delay=0.01)
+        self.assertEqual([2, 3], [next(tail)["x"], next(tail)["x"]])
+        db.connection.cursor_registry.kill_idle(0)
+        db.test.insert({"x": 4})
+        self.assertEqual(4, next(tail)["x"])
+        tail.close()
+
+    def test_tail_async(self):
+        try:
+            import asyncio
+        except ImportError:
+            raise SkipTest()
+
+        db = self.db
+        db.drop_collection("test")
+        db.create_collection("test", {"capped": True, "size": 10000})
+        for i in range(3):
+            db.test.insert({"x": i})
+
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            tail = db.test.tail_async(min_delay=0.001, max_delay=0.01)
+            seen = [loop.run_until_complete(tail.__anext__())["x"]
+                    for _ in range(3)]
+            loop.run_until_complete(tail.aclose())
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
+        self.assertEqual([0, 1, 2], seen)
+
+
+class TailConnection(CannedConnection):
+    """Answers queries from a list of replies (or exceptions to raise),
+    recording the spec of each query."""
+
+    def __init__(self, replies):
+        CannedConnection.__init__(self)
+        self.replies = replies
+        self.specs = []
+
+    def respond(self, message):
+        if opcode(message) == 2004:
+            data = message[1][20:]
+            self.specs.append(_to_dicts(data[data.index(b"\x00") + 9:])[0])
+        response = self.replies.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+class TestTail(unittest.TestCase):
+
+    def tail(self, replies, **kwargs):
+        self.connection = TailConnection(replies)
+        return self.connection.test.test.tail(min_delay=0, max_delay=0,
+                                              **kwargs)
+
+    def test_resume(self):
+        lost = reply([], flags=1)
+        tail = self.tail([reply([{"_id": 1}], 7), lost,
+                          AutoReconnect("reset"), reply([{"_id": 2}], 8)])
+        self.assertEqual(1, next(tail)["_id"])
+        self.assertEqual(2, next(tail)["_id"])
+        self.assertEqual({}, self.connection.specs[0]["query"])
+        self.assertEqual({"_id": {"$gt": 1}},
+                         self.connection.specs[2]["query"])
+        tail.close()
+
+    def test_errors(self):
+        tail = self.tail([error_reply("tailable cursor requested on non "
+                                      "capped collection")])
+        self.assertRaises(OperationFailure, next, tail)
+
+        tail = self.tail([AutoReconnect("reset")] * 3, max_failures=3)
+        self.assertRaises(AutoReconnect, next, tail)
+        lost = reply([], flags=1)
+        tail = self.tail([reply([{"_id": 1}], 7), lost, reply([], 8), lost,
+                          reply([], 9), lost], max_failures=3)
+        self.assertEqual(1, next(tail)["_id"])
+        self.assertRaises(CursorNotFound, next, tail)
 
 if __name__ == "__main__":
     unittest.main()
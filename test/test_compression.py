@@ -0,0 +1,136 @@
+# Copyright 2009 10gen, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test wire compression."""
+
+import os
+import socket
+import struct
+import threading
+import unittest
+import sys
+sys.path[0:0] = [""]
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "tools"))
+
+from pymongo import message
+from pymongo.errors import ConfigurationError, ConnectionFailure
+from pymongo.connection import Connection
+from compression_proxy import CompressionProxy
+from test_deadline import SlowServer
+from fakes import wait_for
+
+
+class TestCompression(unittest.TestCase):
+
+    def test_round_trip(self):
+        docs = [{"x": "a" * 100, "n": n} for n in range(100)]
+        (request_id, data) = message.insert("test.test", docs, True, True)
+        for compressor in message._COMPRESSORS:
+            compressed = message.compress(data, compressor)
+            self.assert_(len(compressed) < len(data))
+
+            # the insert and the lastError are wrapped separately
+            position = 0
+            unwrapped = b""
+            while position < len(compressed):
+                (length, message_id, response_to, operation) = \
+                    struct.unpack("<iiii", compressed[position:position + 16])
+                self.assertEqual(message.OP_COMPRESSED, operation)
+                (operation, body) = message.decompress(
+                    compressed[position + 16:position + length])
+                unwrapped += struct.pack("<iiii", 16 + len(body), message_id,
+                                         response_to, operation) + body
+                position += length
+            self.assertEqual(data, unwrapped)
+            self.assertEqual(request_id, message_id)
+
+    def test_threads(self):
+        data = message.insert("test.test", [{"x": "a" * 1000}], False,
+                              False)[1]
+        errors = []
+
+        def work(compressor):
+            try:
+                for _ in range(200):
+                    compressed = message.compress(data, compressor)
+                    assert message.decompress(compressed[16:])[1] == data[16:]
+            except Exception as e:
+                errors.append(e)
+
+        for compressor in message._COMPRESSORS:
+            threads = [threading.Thread(target=work, args=(compressor,))
+                       for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual([], errors)
+
+    def test_invalid(self):
+        self.assertRaises(ConnectionFailure, message.decompress,
+                          struct.pack("<iiB", 2004, 10, 2) + b"garbage")
+        self.assertRaises(ConnectionFailure, message.decompress,
+                          struct.pack("<iiB", 2004, 10, 99) + b"garbage")
+        data = message.compress(message.query(0, "a.b", 0, 0, {})[1], "zlib")
+        self.assertRaises(ConnectionFailure, message.decompress,
+                          data[16:20] + struct.pack("<i", 1) + data[24:])
+        self.assertRaises(ConfigurationError, Connection,
+                          compression="lzma", _connect=False)
+
+    def test_proxy(self):
+        server = SlowServer()
+        proxy = CompressionProxy(("localhost", server.port))
+        proxy.start()
+        try:
+            connection = Connection("localhost", proxy.port,
+                                    compression="zlib")
+            self.assertEqual("zlib", connection.compression)
+            self.assertEqual(1, connection.test.test.find_one()["ok"])
+            connection.test.test.insert({"x": 1}, safe=True)
+            connection.test.test.insert({"x": 1})
+            self.assertEqual(1, connection.test.test.find_one()["ok"])
+
+            # ismaster, two queries and one lastError were answered
+            self.assertEqual(4, proxy.compressed)
+            self.assertEqual(6, proxy.decompressed)
+
+            # plain connections pass straight through
+            plain = Connection("localhost", proxy.port)
+            self.assertEqual(1, plain.test.test.find_one()["ok"])
+            self.assertEqual(4, proxy.compressed)
+        finally:
+            proxy.close()
+            server.close()
+
+    def test_proxy_bad_message(self):
+        server = SlowServer()
+        proxy = CompressionProxy(("localhost", server.port))
+        proxy.start()
+        try:
+            # an unknown compressor id - the proxy hangs up on both sides
+            body = struct.pack("<iiB", 2004, 10, 99) + b"garbage"
+            sock = socket.create_connection(("localhost", proxy.port))
+            sock.settimeout(5)
+            sock.sendall(struct.pack("<iiii", 16 + len(body), 1, 0,
+                                     message.OP_COMPRESSED) + body)
+            self.assertEqual(b"", sock.recv(16))
+            sock.close()
+            self.assert_(wait_for(lambda: server.accepted == 1))
+        finally:
+            proxy.close()
+            server.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -25,6 +25,7 @@ sys.path[0:0] = [""]
 from pymongo.errors import ConnectionFailure, InvalidName, AutoReconnect
 from pymongo.database import Database
 from pymongo.connection import Connection
+from pymongo.son import SON
 
 
 def get_connection(*args, **kwargs):
@@ -194,6 +195,17 @@ class TestConnection(unittest.TestCase):
         self.assertEqual("bar", coll.name)
         self.assertEqual(db, coll.database)
 
+    def test_handle_cache(self):
+        c = Connection(self.host, self.port)
+
+        self.assert_(c.foo is c.foo)
+        self.assert_(c.foo is c["foo"])
+        self.failIf(c.foo is c.bar)
+        self.assert_(c.foo.bar is c.foo.bar)
+        self.assert_(c.foo.bar is c["foo"]["bar"])
+        self.assert_(c.foo.bar.baz is c.foo["bar.baz"])
+        self.failIf(c.foo.bar is Connection(self.host, self.port).foo.bar)
+
     def test_disconnect(self):
         c = Connection(self.host, self.port)
         coll = c.foo.bar
@@ -208,6 +220,34 @@ class TestConnection(unittest.TestCase):
 
         coll.count()
 
+    def test_document_class(self):
+        c = get_connection()
+        db = c.pymongo_test
+        db.test.insert({"x": 1})
+
+        self.assertEqual(dict, c.document_class)
+        self.assert_(isinstance(db.test.find_one(), dict))
+        self.failIf(isinstance(db.test.find_one(), SON))
+
+        c.document_class = SON
+
+        self.assertEqual(SON, c.document_class)
+        self.assert_(isinstance(db.test.find_one(), SON))
+        self.failIf(isinstance(db.test.find_one(as_class=dict), SON))
+
+        c = Connection(self.host, self.port, document_class=SON)
+        db = c.pymongo_test
+
+        self.assertEqual(SON, c.document_class)
+        self.assert_(isinstance(db.test.find_one(), SON))
+        self.failIf(isinstance(db.test.find_one(as_class=dict), SON))
+
+        c.document_class = dict
+
+        self.assertEqual(dict, c.document_class)
+        self.assert_(isinstance(db.test.find_one(), dict))
+        self.failIf(isinstance(db.test.find_one(), SON))
+
 # TODO come up with a different way to test `network_timeout`. This is just
 # too sketchy.
 #
@@ -568,6 +568,38 @@ class TestCursor(unittest.TestCase):
 
         self.assertRaises(AttributeError, set_coll)
 
+    def test_batch_size(self):
+        db = self.db
+        db.test.remove({})
+        db.test.insert([{"x": i} for i in range(100)])
+
+        self.assertRaises(TypeError, db.test.find().batch_size, None)
+        self.assertRaises(TypeError, db.test.find().batch_size, "hello")
+        self.assertRaises(TypeError, db.test.find().batch_size, 5.5)
+        self.assertRaises(ValueError, db.test.find().batch_size, -1)
+        a = db.test.find()
+        for _ in a:
+            break
+        self.assertRaises(InvalidOperation, a.batch_size, 5)
+
+        def cursor_count(cursor, expected_count):
+            count = 0
+            for _ in cursor:
+                count += 1
+            self.assertEqual(expected_count, count)
+
+        cursor_count(db.test.find().batch_size(0), 100)
+        cursor_count(db.test.find().batch_size(1), 100)
+        cursor_count(db.test.find().batch_size(2), 100)
+        cursor_count(db.test.find().batch_size(5), 100)
+        cursor_count(db.test.find().batch_size(100), 100)
+        cursor_count(db.test.find().batch_size(500), 100)
+
+        cursor_count(db.test.find().batch_size(1).limit(1), 1)
+        cursor_count(db.test.find().batch_size(2).limit(5), 5)
+        cursor_count(db.test.find().batch_size(500).limit(5), 5)
+        cursor_count(db.test.find().batch_size(5).limit(50), 50)
+
     def test_tailable(self):
         db = self.db
         db.drop_collection("test")
@@ -594,6 +626,7 @@ class TestCursor(unittest.TestCase):
             count += 1
             self.assertEqual(3, doc["x"])
         self.assertEqual(1, count)
+        self.assert_(cursor.alive)
 
         self.assertEqual(3, db.test.count())
 
@@ -0,0 +1,227 @@
+# Copyright 2009 10gen, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test the cursor_manager module."""
+
+import gc
+import os
+import unittest
+import sys
+sys.path[0:0] = [""]
+
+from pymongo.errors import AutoReconnect
+from pymongo.cursor_manager import (CursorManager,
+                                    TimedBatchCursorManager,
+                                    CursorRegistry)
+from fakes import CannedConnection, reply, opcode, wait_for
+
+
+class RecordingConnection(CannedConnection):
+    """A connection that records kill cursors messages instead of sending
+    them."""
+
+    def __init__(self):
+        CannedConnection.__init__(self)
+        self.fail = False
+
+    def kill_cursors(self, cursor_ids):
+        if self.fail:
+            raise AutoReconnect("no server")
+        CannedConnection.kill_cursors(self, cursor_ids)
+
+    def respond(self, message):
+        # every query opens cursor 42 with two documents, the first getmore
+        # exhausts it
+        if opcode(message) == 2004:
+            return reply([{"x": 1}, {"x": 2}], 42)
+        return reply([{"x": 3}], starting_from=2)
+
+
+class SmallBatches(TimedBatchCursorManager):
+    max_batch_size = 3
+    max_delay = 0.1
+
+
+class TestCursorManager(unittest.TestCase):
+
+    def setUp(self):
+        self.connection = RecordingConnection()
+
+    def test_default(self):
+        manager = CursorManager(self.connection)
+        self.assertRaises(TypeError, manager.close, "1")
+        manager.close(1)
+        manager.close(2)
+        self.assertEqual([[1], [2]], self.connection.killed)
+
+    def test_set_cursor_manager(self):
+        self.assertRaises(TypeError, self.connection.set_cursor_manager,
+                          object)
+        self.connection.set_cursor_manager(SmallBatches)
+        for i in range(3):
+            self.connection.close_cursor(i + 1)
+        self.assertEqual([[1, 2, 3]], self.connection.killed)
+
+    def test_batch_size(self):
+        manager = SmallBatches(self.connection)
+        self.assertRaises(TypeError, manager.close, 1.5)
+        for i in range(7):
+            manager.close(i + 1)
+        self.assertEqual([[1, 2, 3], [4, 5, 6]], self.connection.killed)
+        self.assertEqual({"closed": 7, "killed": 6, "pending": 1,
+                          "dropped": 0, "messages": 2, "errors": 0},
+                         manager.stats)
+
+        manager.flush()
+        self.assertEqual([7], self.connection.killed[-1])
+        self.assertEqual(0, manager.stats["pending"])
+        manager.flush()
+        self.assertEqual(3, len(self.connection.killed))
+
+    def test_max_delay(self):
+        manager = SmallBatches(self.connection)
+        manager.close(1)
+        manager.close(2)
+        self.assertEqual([], self.connection.killed)
+
+        self.assert_(wait_for(lambda: self.connection.killed))
+        self.assertEqual([[1, 2]], self.connection.killed)
+
+        # the flushing thread starts again for the next batch
+        manager.close(3)
+        self.assert_(wait_for(lambda: len(self.connection.killed) == 2))
+        self.assertEqual([[1, 2], [3]], self.connection.killed)
+        self.assertEqual(3, manager.stats["killed"])
+
+    def test_errors(self):
+        manager = SmallBatches(self.connection)
+        self.connection.fail = True
+        manager.close(1)
+        manager.flush()
+        self.assertEqual(1, manager.stats["errors"])
+        self.assertEqual(1, manager.stats["dropped"])
+        self.assertEqual(0, manager.stats["killed"])
+
+    def test_del(self):
+        manager = SmallBatches(self.connection)
+        manager.close(1)
+        del manager
+        # the flushing thread might briefly hold the last reference
+        self.assert_(wait_for(lambda: self.connection.killed))
+        self.assertEqual([[1]], self.connection.killed)
+
+
+class TestCursorRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.connection = RecordingConnection()
+        self.registry = self.connection.cursor_registry
+        self.collection = self.connection.pymongo_test.test
+
+    def test_track(self):
+        self.assert_(isinstance(self.registry, CursorRegistry))
+        self.assertEqual(0, len(self.registry))
+
+        cursor = self.collection.find(timeout=False)
+        self.assert_(cursor.alive)
+        self.assertEqual({"x": 1}, next(cursor))
+        self.assertEqual(1, len(self.registry))
+
+        [info] = self.registry.cursors()
+        self.assert_(info.cursor is cursor)
+        self.assertEqual(42, info.cursor_id)
+        self.assertEqual("pymongo_test.test", info.namespace)
+        self.assert_(info.no_timeout)
+        self.assertEqual(2, info.documents)
+        self.assert_(info.bytes > 20)
+        self.assert_(info.age >= 0)
+        self.assert_("test_track" in info.stack)
+        self.assertEqual([], self.registry.cursors(min_idle=60))
+
+        # exhausting the cursor stops tracking it
+        self.assertEqual([{"x": 2}, {"x": 3}], list(cursor))
+        self.failIf(cursor.alive)
+        self.assertEqual(0, len(self.registry))
+        self.assertEqual([], self.connection.killed)
+
+    def test_untrack(self):
+        cursor = self.collection.find()
+        next(cursor)
+        self.failIf(self.registry.cursors()[0].no_timeout)
+        cursor.close()
+        self.assertEqual(0, len(self.registry))
+        self.assertEqual([[42]], self.connection.killed)
+        self.assertEqual([], list(cursor))
+
+        cursor = self.collection.find()
+        next(cursor)
+        cursor.rewind()
+        self.assertEqual(0, len(self.registry))
+        self.assertEqual([[42], [42]], self.connection.killed)
+
+        next(cursor)
+        del cursor
+        gc.collect()
+        self.assertEqual(0, len(self.registry))
+        self.assertEqual(3, len(self.connection.killed))
+
+    def test_kill_idle(self):
+        cursor = self.collection.find()
+        next(cursor)
+        self.assertEqual(0, self.registry.kill_idle(60))
+        self.assertEqual(1, self.registry.kill_idle(0))
+        self.assertEqual(0, len(self.registry))
+        self.assertEqual([[42]], self.connection.killed)
+
+        # the cursor returns what it already has, then stops without a
+        # getmore, and isn't killed again
+        self.assert_(cursor.alive)
+        self.assertEqual([{"x": 2}], list(cursor))
+        self.failIf(cursor.alive)
+        cursor.close()
+        self.assertEqual([[42]], self.connection.killed)
+
+        cursor = self.collection.find()
+        next(cursor)
+        self.connection.fail = True
+        self.assertEqual(0, self.registry.kill_idle(0))
+        self.assertEqual(0, len(self.registry))
+
+    def test_stack(self):
+        cursor = self.collection.find()
+        next(cursor)
+        [info] = self.registry.cursors()
+        self.assert_("test_stack" in info.stack)
+        self.failIf("pymongo" + os.sep in info.stack)
+
+        def nested():
+            cursor = self.collection.find()
+            next(cursor)
+            return cursor
+        cursor = nested()
+        self.assert_("nested" in self.registry.cursors()[0].stack)
+
+    def test_reaper(self):
+        cursor = self.collection.find()
+        next(cursor)
+        self.registry.start_reaper(0.05)
+        try:
+            wait_for(lambda: not len(self.registry))
+        finally:
+            self.registry.stop_reaper()
+        self.assertEqual(0, len(self.registry))
+        self.assertEqual([[42]], self.connection.killed)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -31,8 +31,12 @@ from pymongo.connection import Connection
 from pymongo.collection import Collection
 from pymongo.dbref import DBRef
 from pymongo.code import Code
-from pymongo.son_manipulator import AutoReference, NamespaceInjector
+from pymongo.son_manipulator import (AutoReference, NamespaceInjector,
+                                     SONManipulator)
+from pymongo.bson import BSON, _to_dicts
+from pymongo.helpers import _canonical
 from test_connection import get_connection
+from fakes import CannedConnection, reply
 
 
 class TestDatabase(unittest.TestCase):
@@ -291,6 +295,40 @@ class TestDatabase(unittest.TestCase):
         db.test.save(obj)
         self.assertEqual(obj, db.dereference(DBRef("test", 4)))
 
+    def test_deref_many(self):
+        db = self.connection.pymongo_test
+        db.test.remove({})
+        db.test.mike.remove({})
+
+        self.assertEqual([], db.dereference_many([]))
+        self.assertRaises(TypeError, db.dereference_many, [5])
+        self.assertRaises(TypeError, db.dereference_many, [DBRef("test", 1),
+                                                           None])
+
+        a = {"x": 1}
+        b = {"_id": 4}
+        c = {"y": True}
+        db.test.save(a)
+        db.test.save(b)
+        db.test.mike.save(c)
+        self.assertRaises(ValueError, db.dereference_many,
+                          [DBRef("test", a["_id"], "foo")])
+
+        refs = [DBRef("test", b["_id"]),
+                DBRef("test.mike", c["_id"]),
+                DBRef("test", ObjectId()),
+                DBRef("test", a["_id"], "pymongo_test"),
+                DBRef("test", b["_id"])]
+        self.assertEqual([b, c, None, a, b], db.dereference_many(refs))
+        self.assertEqual([db.dereference(ref) for ref in refs],
+                         db.dereference_many(refs))
+
+        d = {"_id": {"embedded": "id"}}
+        db.test.save(d)
+        self.assertEqual([d, a],
+                         db.dereference_many([DBRef("test", d["_id"]),
+                                              DBRef("test", a["_id"])]))
+
     def test_eval(self):
         db = self.connection.pymongo_test
         db.test.remove({})
@@ -435,6 +473,25 @@ class TestDatabase(unittest.TestCase):
         self.assertEqual(db.test.c.find_one()["another test"], b)
         self.assertEqual(db.test.c.find_one(), c)
 
+    def test_auto_deref_list(self):
+        db = self.connection.pymongo_test
+        db.add_son_manipulator(AutoReference(db))
+        db.add_son_manipulator(NamespaceInjector())
+
+        db.test.a.remove({})
+        db.test.b.remove({})
+
+        items = [{"i": i} for i in range(200)]
+        for item in items:
+            db.test.a.save(item)
+        db.test.b.save({"items": items})
+        db.test.b.save({"items": items[:2], "first": items[0]})
+
+        docs = list(db.test.b.find())
+        self.assertEqual(items, docs[0]["items"])
+        self.assertEqual(items[:2], docs[1]["items"])
+        self.assertEqual(items[0], docs[1]["first"])
+
     # some stuff the user marc wanted to be able to do, make sure it works
     def test_marc(self):
         db = self.connection.pymongo_test
@@ -459,5 +516,100 @@ class TestDatabase(unittest.TestCase):
         self.assertEqual("buzz", db.users.find_one()["messages"][0]["title"])
         self.assertEqual("bar", db.users.find_one()["messages"][1]["title"])
 
+
+class StoreConnection(CannedConnection):
+    """Answers ``_id`` queries from `docs`, matching ids like the server
+    does (numbers by value, anything else by type and value), and records
+    each query's namespace."""
+
+    def __init__(self, docs):
+        CannedConnection.__init__(self)
+        self.docs = docs
+        self.queries = []
+
+    def respond(self, message):
+        data = message[1][20:]
+        end = data.index(b"\x00")
+        self.queries.append(data[:end].decode())
+        spec = _to_dicts(data[end + 9:])[0]["query"]["_id"]
+        if isinstance(spec, dict) and "$in" in spec:
+            ids = spec["$in"]
+        else:
+            ids = [spec]
+        keys = [BSON.from_dict({"_id": _canonical(_id)}) for _id in ids]
+        return reply([doc for doc in self.docs
+                      if BSON.from_dict({"_id": _canonical(doc["_id"])})
+                      in keys])
+
+
+class TestDereferenceMany(unittest.TestCase):
+
+    def test_types(self):
+        one = {"_id": 1, "n": "int"}
+        true = {"_id": True, "n": "bool"}
+        embedded = {"_id": {"a": 1}, "n": "embedded"}
+        connection = StoreConnection([one, true, embedded])
+        db = connection.pymongo_test
+
+        refs = [DBRef("test", True), DBRef("test", 1), DBRef("test", 2),
+                DBRef("test", {"a": 1}), DBRef("test", 1)]
+        self.assertEqual([true, one, None, embedded, one],
+                         db.dereference_many(refs))
+        self.assertEqual(["pymongo_test.test"], connection.queries)
+
+        self.assertEqual([None, one], db.dereference_many([DBRef("test", 1.5),
+                                                           DBRef("test", 1)]))
+
+    def test_numbers(self):
+        double = {"_id": 2.0, "n": "double"}
+        big = {"_id": 2 ** 40, "n": "long"}
+        connection = StoreConnection([double, big])
+        db = connection.pymongo_test
+
+        refs = [DBRef("test", 2), DBRef("test", 2.0 ** 40),
+                DBRef("test", 2.0), DBRef("test", 2.5)]
+        self.assertEqual([double, big, double, None],
+                         db.dereference_many(refs))
+        self.assertEqual([db.dereference(ref) for ref in refs],
+                         db.dereference_many(refs))
+
+
+class Counter(SONManipulator):
+
+    def transform_incoming(self, son, collection):
+        son["n"] = son.get("n", 0) + 1
+        return son
+
+
+class TestHandles(unittest.TestCase):
+
+    def setUp(self):
+        self.connection = CannedConnection()
+
+    def test_underscore(self):
+        c = self.connection
+        self.assertRaises(AttributeError, getattr, c, "_foo")
+        self.assertRaises(AttributeError, getattr, c, "__deepcopy__")
+        self.failIf(hasattr(c.db, "__length_hint__"))
+        self.assertRaises(AttributeError, getattr, c.db, "_foo")
+        self.assertRaises(AttributeError, getattr, c.db.coll, "_foo")
+
+        self.assertEqual("_foo", c["_foo"].name)
+        self.assert_(c["_foo"] is c["_foo"])
+        self.assertEqual("_foo", c.db["_foo"].name)
+        self.assertEqual("coll._foo", c.db.coll["_foo"].name)
+        self.assert_(c.db.coll["_foo"] is c.db["coll._foo"])
+
+    def test_add_son_manipulator(self):
+        counter = Counter()
+        self.connection.db.add_son_manipulator(counter)
+        self.connection.db.add_son_manipulator(counter)
+        db = self.connection.db
+        self.assertEqual(1, db._fix_incoming({}, db.test)["n"])
+
+        db.add_son_manipulator(Counter())
+        self.assertEqual(2, db._fix_incoming({}, db.test)["n"])
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,179 @@
+# Copyright 2009 10gen, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test per-operation deadlines."""
+
+import socket
+import struct
+import threading
+import time
+import unittest
+import sys
+sys.path[0:0] = [""]
+
+from pymongo import bson
+from pymongo import helpers
+from pymongo.errors import OperationTimeout
+from pymongo.connection import Connection
+from pymongo.retry import RetryPolicy
+
+
+class SlowServer(object):
+    """Just enough of a server to answer every query with one canned
+    document, `delay` seconds after it arrives."""
+
+    def __init__(self):
+        self.listener = socket.socket()
+        self.listener.bind(("localhost", 0))
+        self.listener.listen(5)
+        self.port = self.listener.getsockname()[1]
+        self.delay = 0
+        self.accepted = 0
+        thread = threading.Thread(target=self.accept)
+        thread.daemon = True
+        thread.start()
+
+    def accept(self):
+        while True:
+            try:
+                (sock, _) = self.listener.accept()
+            except socket.error:
+                return
+            self.accepted += 1
+            thread = threading.Thread(target=self.serve, args=(sock,))
+            thread.daemon = True
+            thread.start()
+
+    def receive(self, sock, length):
+        data = b""
+        while len(data) < length:
+            chunk = sock.recv(length - len(data))
+            if not chunk:
+                raise socket.error("closed")
+            data += chunk
+        return data
+
+    def reply(self, state, namespace, spec):
+        """The document to answer a query with. `state` is a dictionary
+        kept for each socket."""
+        return {"ok": 1, "ismaster": 1, "err": None}
+
+    def serve(self, sock):
+        state = {}
+        try:
+            while True:
+                header = self.receive(sock, 16)
+                (length, request_id, _, opcode) = struct.unpack("<iiii",
+                                                                header)
+                message = self.receive(sock, length - 16)
+                if opcode != 2004:
+                    continue
+                end = message.index(b"\x00", 4)
+                namespace = message[4:end].decode()
+                spec = bson._to_dicts(message[end + 9:])[0]
+                time.sleep(self.delay)
+                doc = self.reply(state, namespace, spec)
+                flags = "$err" in doc and 2 or 0
+                body = (struct.pack("<iqii", flags, 0, 0, 1) +
+                        bson.BSON.from_dict(doc))
+                sock.sendall(struct.pack("<iiii", 16 + len(body), 0,
+                                         request_id, 1) + body)
+        except socket.error:
+            sock.close()
+
+    def close(self):
+        self.listener.close()
+
+
+class TestDeadline(unittest.TestCase):
+
+    def setUp(self):
+        self.server = SlowServer()
+        self.connection = Connection("localhost", self.server.port)
+        self.collection = self.connection.test.test
+
+    def tearDown(self):
+        self.server.close()
+
+    def test_types(self):
+        self.assertRaises(TypeError, self.collection.find, deadline="1")
+        self.assertRaises(TypeError, self.collection.insert, {},
+                          deadline="1")
+        self.assertRaises(ValueError, self.collection.remove, {},
+                          deadline=-1)
+
+    def test_clock(self):
+        # deadlines ignore steps of the wall clock
+        deadline = helpers._deadline(5)
+        wall_clock = time.time
+        time.time = lambda: wall_clock() + 3600
+        try:
+            self.failIf(helpers._timed_out(deadline))
+            self.assert_(4 < helpers._time_left(deadline) <= 5)
+        finally:
+            time.time = wall_clock
+
+    def test_query(self):
+        self.assert_(self.collection.find_one(deadline=1))
+        self.assert_(self.connection.test.command({"ping": 1}, deadline=1))
+        accepted = self.server.accepted
+
+        self.server.delay = 0.5
+        start = time.time()
+        self.assertRaises(OperationTimeout, self.collection.find_one,
+                          deadline=0.1)
+        self.assert_(time.time() - start < 0.4)
+        self.assertRaises(OperationTimeout, self.connection.test.command,
+                          {"ping": 1}, deadline=0.1)
+
+        # the connection isn't reset, but the half read socket is replaced
+        self.server.delay = 0
+        self.assertEqual(("localhost", self.server.port),
+                         self.connection._address)
+        self.assert_(self.collection.find_one(deadline=1))
+        self.assertEqual(accepted + 2, self.server.accepted)
+
+        # other operations aren't affected
+        self.server.delay = 0.2
+        self.assert_(self.collection.find_one())
+
+    def test_safe_write(self):
+        self.collection.insert({"x": 1}, safe=True, deadline=1)
+        self.collection.update({}, {"x": 2}, safe=True, deadline=1)
+
+        self.server.delay = 0.5
+        self.collection.insert({"x": 1}, deadline=0.1)
+        self.assertRaises(OperationTimeout, self.collection.insert,
+                          {"x": 1}, safe=True, deadline=0.1)
+        self.assertRaises(OperationTimeout, self.collection.remove,
+                          {}, safe=True, deadline=0.1)
+        self.assertRaises(OperationTimeout, self.collection.save,
+                          {"_id": 1}, safe=True, deadline=0.1)
+
+    def test_not_retried(self):
+        self.connection.retry_policy = RetryPolicy(backoff=0)
+        self.server.delay = 0.5
+        self.assertRaises(OperationTimeout, self.collection.find_one,
+                          deadline=0.1)
+        self.assertEqual(0, self.connection.retry_policy.stats["retries"])
+
+    def test_cursor(self):
+        cursor = self.collection.find(deadline=0.1)
+        self.assertEqual(1, len(list(cursor.clone())))
+        self.server.delay = 0.5
+        self.assertRaises(OperationTimeout, list, cursor.clone())
+
+
+if __name__ == "__main__":
+    unittest.main()
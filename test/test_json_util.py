@@ -26,9 +26,15 @@ import json
 
 sys.path[0:0] = [""]
 
-from pymongo.json_util import default, object_hook
+from pymongo.json_util import default, object_hook, dumps_bson, loads_to_bson
 from pymongo.objectid import ObjectId
 from pymongo.dbref import DBRef
+from pymongo.binary import Binary
+from pymongo.code import Code
+from pymongo.timestamp import Timestamp
+from pymongo.son import SON
+from pymongo.bson import BSON
+from pymongo.errors import InvalidBSON, InvalidDocument
 
 class TestJsonUtil(unittest.TestCase):
 
@@ -65,6 +71,126 @@ class TestJsonUtil(unittest.TestCase):
         self.assertEqual("a*b", res.pattern)
         self.assertEqual(re.I | re.U, res.flags)
 
+    def test_dumps_bson(self):
+        doc = SON([("_id", ObjectId()),
+                   ("str", "h\u00e9llo \"world\"\n"),
+                   ("int", 5),
+                   ("long", 2 ** 40),
+                   ("float", 1.5),
+                   ("inf", float("inf")),
+                   ("true", True),
+                   ("false", False),
+                   ("none", None),
+                   ("date", datetime.datetime(2010, 1, 2, 3, 4, 5, 678000)),
+                   ("regex", re.compile("a.*b", re.IGNORECASE)),
+                   ("list", [1, {"x": [2, "three"]}, []]),
+                   ("empty", {}),
+                   ("ref", DBRef("coll", ObjectId()))])
+        self.assertEqual(json.dumps(doc, default=default),
+                         dumps_bson(BSON.from_dict(doc)))
+        self.assertEqual(doc, json.loads(dumps_bson(BSON.from_dict(doc)),
+                                         object_hook=object_hook))
+
+    def test_dumps_bson_extended(self):
+        self.assertEqual('{"b": {"$binary": "AQI=", "$type": "02"}}',
+                         dumps_bson(BSON.from_dict({"b": Binary(b"\x01\x02")})))
+        self.assertEqual('{"b": {"$binary": "AQI=", "$type": "80"}}',
+                         dumps_bson(BSON.from_dict({"b": Binary(b"\x01\x02",
+                                                                128)})))
+        self.assertEqual('{"c": {"$code": "f()", "$scope": {"x": 1}}}',
+                         dumps_bson(BSON.from_dict({"c": Code("f()",
+                                                              {"x": 1})})))
+        self.assertEqual('{"t": {"$timestamp": {"t": 20, "i": 4}}}',
+                         dumps_bson(BSON.from_dict({"t": Timestamp(20, 4)})))
+
+    def test_dumps_bson_invalid(self):
+        self.assertRaises(InvalidBSON, dumps_bson, b"\x05\x00\x00")
+        self.assertRaises(InvalidBSON, dumps_bson,
+                          b"\x05\x00\x00\x00\x00\x00")
+        self.assertRaises(InvalidBSON, dumps_bson,
+                          b"\x0c\x00\x00\x00\x99a\x00\x00\x00\x00\x00")
+
+        # corrupt terminators
+        good = BSON.from_dict({"s": "xyz"})
+        self.assertEqual('{"s": "xyz"}', dumps_bson(good))
+        self.assertRaises(InvalidBSON, dumps_bson,
+                          good.replace(b"xyz\x00", b"xyz@"))
+        self.assertRaises(InvalidBSON, dumps_bson, good[:-1] + b"@")
+        nested = BSON.from_dict({"d": {"a": 1}, "n": 2})
+        self.assertRaises(InvalidBSON, dumps_bson,
+                          nested.replace(b"\x01\x00\x00\x00\x00\x10n",
+                                         b"\x01\x00\x00\x00@\x10n"))
+        # a string length of 0 leaves no room for the terminator
+        self.assertRaises(InvalidBSON, dumps_bson,
+                          b"\x0d\x00\x00\x00\x02s\x00\x00\x00\x00\x00"
+                          b"\x00\x00")
+
+    def test_loads_to_bson(self):
+        doc = SON([("_id", ObjectId()),
+                   ("str", "h\u00e9llo \"world\"\n\U0001f600"),
+                   ("int", 5),
+                   ("long", 2 ** 40),
+                   ("float", 1.5),
+                   ("true", True),
+                   ("false", False),
+                   ("none", None),
+                   ("date", datetime.datetime(2010, 1, 2, 3, 4, 5, 678000)),
+                   ("regex", re.compile("a.*b", re.IGNORECASE)),
+                   ("list", [1, {"x": [2, "three"]}, []]),
+                   ("empty", {}),
+                   ("b", Binary(b"\x01\x02")),
+                   ("b128", Binary(b"\x01\x02", 128)),
+                   ("c", Code("f()", {"x": 1})),
+                   ("t", Timestamp(20, 4))])
+        bson = BSON.from_dict(doc)
+        self.assertEqual(bson, loads_to_bson(dumps_bson(bson)))
+
+        # default() doesn't handle Binary, Code or Timestamp
+        plain = SON(list(doc.items())[:12])
+        self.assertEqual(BSON.from_dict(plain),
+                         loads_to_bson(json.dumps(plain, default=default)))
+
+    def test_loads_to_bson_forms(self):
+        self.assertEqual(BSON.from_dict({"a": 1, "b": [2.5, None]}),
+                         loads_to_bson(' { "a" : 1 , "b":[2.5,null] } '))
+        self.assertEqual(BSON.from_dict({"c": Code("x")}),
+                         loads_to_bson('{"c": {"$code": "x", "$scope": {}}}'))
+        self.assertEqual('{"c": {"$code": "x"}}',
+                         dumps_bson(loads_to_bson('{"c": {"$code": "x"}}')))
+        self.assertEqual(BSON.from_dict({"t": Timestamp(20, 4)}),
+                         loads_to_bson('{"t": {"$timestamp": '
+                                       '{"i": 4, "t": 20}}}'))
+        self.assertEqual(BSON.from_dict({"d": datetime.datetime(1970, 1, 1, 0,
+                                                                0, 1)}),
+                         loads_to_bson('{"d": {"$date": 1000}}'))
+        for text in ['{"u": {"$undefined": true}}',
+                     '{"k": [{"$minKey": true}, {"$maxKey": true}]}',
+                     '{"$oid": 1, "$ref": "x"}']:
+            self.assertEqual(text, dumps_bson(loads_to_bson(text)))
+        self.assertEqual(BSON.from_dict({"": {}}), loads_to_bson('{"": {}}'))
+
+    def test_loads_to_bson_invalid(self):
+        self.assertRaises(TypeError, loads_to_bson, b"{}")
+        for text in ['', '[1]', '{"a": 1} x', '{"a": 1,}', '{"a": "\x01"}',
+                     '{"a": "\\ud800"}', '{"a": {"$oid": "zz"}}',
+                     '{"a": {"$regex": "x"}}',
+                     '{"a": {"$minKey": true, "b": 1}}',
+                     '{"a": {"$binary": "AQI=", "$type": "xyz"}}',
+                     '{"a": {"$timestamp": {"t": 1, "t": 2}}}']:
+            self.assertRaises(ValueError, loads_to_bson, text)
+
+        for data in ["AE=", "AAE=6", "A", "AAAAA", "AA=A", "A===", "====",
+                     "AAA=AAAA", "AQ*="]:
+            self.assertRaises(ValueError, loads_to_bson,
+                              '{"b": {"$binary": "%s", "$type": "00"}}' %
+                              data)
+        # longer than a few characters, and each amount of padding
+        for data in [b"", b"\x01", b"\x01\x02", b"\x01\x02\x03",
+                     bytes(range(256))]:
+            bson = BSON.from_dict({"b": Binary(data)})
+            self.assertEqual(bson, loads_to_bson(dumps_bson(bson)))
+        self.assertRaises(OverflowError, loads_to_bson, '{"a": %d}' % 2 ** 63)
+        self.assertRaises(InvalidDocument, loads_to_bson, '{"a\\u0000": 1}')
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,169 @@
+# Copyright 2009 10gen, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test the monitor module."""
+
+import time
+import unittest
+import sys
+sys.path[0:0] = [""]
+
+from pymongo.errors import AutoReconnect
+from pymongo.master_slave_connection import MasterSlaveConnection
+from pymongo.monitor import TopologyMonitor
+from fakes import CannedConnection, wait_for
+
+
+class Topology(object):
+    """Canned ismaster responses, by address. Missing addresses are
+    unreachable."""
+
+    def __init__(self, responses):
+        self.responses = responses
+
+    def probe(self, address, timeout):
+        if address not in self.responses:
+            raise AutoReconnect("%r is down" % (address,))
+        return self.responses[address]
+
+
+class FakeConnection(CannedConnection):
+    """A (possibly paired) connection whose nodes answer from a Topology
+    instead of the network."""
+
+    def __init__(self, topology, nodes):
+        CannedConnection.__init__(self, nodes[0][0], nodes[0][1])
+        # reach in to pair / place the connection without connecting
+        self._Connection__nodes[:] = nodes
+        (self._Connection__host, self._Connection__port) = nodes[0]
+        self.topology = topology
+
+    def _probe(self, address, timeout):
+        return self.topology.probe(address, timeout)
+
+    def respond(self, message):
+        raise AutoReconnect("not connected")
+
+
+A = ("a", 27017)
+B = ("b", 27018)
+
+
+class TestMonitor(unittest.TestCase):
+
+    def test_check(self):
+        topology = Topology({A: {"ismaster": 0, "remote": "b:27018"},
+                             B: {"ismaster": 1}})
+        seen = []
+        monitor = TopologyMonitor([A, B], topology.probe,
+                                  listener=seen.append)
+        self.assertEqual(None, monitor.master)
+        self.assertEqual(0, monitor.checks)
+
+        monitor.check()
+        self.assertEqual(B, monitor.master)
+        self.assertEqual(1, monitor.checks)
+        self.assertEqual([monitor], seen)
+        (a, b) = monitor.nodes
+        self.assert_(a.reachable)
+        self.failIf(a.is_master)
+        self.assertEqual(B, a.remote)
+        self.assert_(b.is_master)
+        self.assert_(b.latency is not None)
+
+        del topology.responses[B]
+        topology.responses[A] = {"ismaster": 1}
+        monitor.check()
+        self.assertEqual(A, monitor.master)
+        (a, b) = monitor.nodes
+        self.failIf(b.reachable)
+        self.assert_(isinstance(b.error, AutoReconnect))
+
+    def test_thread(self):
+        topology = Topology({A: {"ismaster": 1}})
+        monitor = TopologyMonitor([A], topology.probe, interval=60)
+        monitor.start()
+        self.assert_(wait_for(lambda: monitor.checks == 1))
+
+        monitor.wake()
+        self.assert_(wait_for(lambda: monitor.checks == 2))
+
+        monitor.stop()
+        monitor.wake()
+        time.sleep(0.1)
+        self.assertEqual(2, monitor.checks)
+
+    def test_connection_switches_master(self):
+        topology = Topology({A: {"ismaster": 1}, B: {"ismaster": 0}})
+        connection = FakeConnection(topology, [A, B])
+        monitor = connection.start_monitor(interval=60)
+        self.assert_(monitor is connection.monitor)
+        self.assert_(wait_for(lambda: monitor.checks == 1))
+        self.assertEqual(A, connection._address)
+
+        # a failover is picked up by the next check
+        topology.responses = {B: {"ismaster": 1}}
+        monitor.wake()
+        self.assert_(wait_for(lambda: connection._address == B))
+
+        # resetting after a failure uses the cached topology
+        connection._reset()
+        self.assertEqual(B, connection._address)
+
+        # and fails fast when there isn't a master
+        topology.responses = {}
+        monitor.check()
+        self.assertRaises(AutoReconnect, connection._reset)
+        self.assertEqual((None, None), connection._address)
+
+        connection.stop_monitor()
+        self.assertEqual(None, connection.monitor)
+
+    def test_slave_okay(self):
+        topology = Topology({A: {"ismaster": 0}})
+        connection = FakeConnection(topology, [A])
+        connection.start_monitor(interval=60)
+        self.assert_(wait_for(lambda: connection.monitor.checks == 1))
+        self.assertRaises(AutoReconnect, connection._reset)
+
+        connection = FakeConnection(topology, [A])
+        connection._Connection__slave_okay = True
+        connection.start_monitor(interval=60)
+        self.assert_(wait_for(lambda: connection.monitor.checks == 1))
+        connection._reset()
+        self.assertEqual(A, connection._address)
+
+    def test_master_slave(self):
+        slaves = [("s%d" % i, 27017) for i in range(3)]
+        topology = Topology({A: {"ismaster": 1},
+                             slaves[0]: {"ismaster": 0},
+                             slaves[2]: {"ismaster": 0}})
+        connection = MasterSlaveConnection(
+            FakeConnection(topology, [A]),
+            [FakeConnection(topology, [slave]) for slave in slaves])
+        monitor = connection.start_monitor(interval=60)
+        self.assert_(connection.master.monitor is not None)
+        states = connection.routing_policy.states
+        self.assert_(wait_for(lambda: states[1].ejected))
+        self.assertEqual(1, monitor.checks)
+        self.assertEqual([False, True, False],
+                         [state.ejected for state in states])
+
+        connection.stop_monitor()
+        self.assertEqual(None, connection.monitor)
+        self.assertEqual(None, connection.master.monitor)
+
+
+if __name__ == "__main__":
+    unittest.main()
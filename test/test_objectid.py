@@ -14,7 +14,9 @@
 
 """Tests for the objectid module."""
 
+import copy
 import datetime
+import pickle
 import warnings
 import unittest
 import sys
@@ -113,5 +115,69 @@ class TestObjectId(unittest.TestCase):
 
         self.assert_(d2 - d1 < datetime.timedelta(seconds = 2))
 
+    def test_generate_many(self):
+        self.assertEqual([], ObjectId.generate_many(0))
+        self.assertRaises(TypeError, ObjectId.generate_many, 1.5)
+        self.assertRaises(ValueError, ObjectId.generate_many, -1)
+
+        first = ObjectId()
+        many = ObjectId.generate_many(1000)
+        last = ObjectId()
+
+        self.assertEqual(1000, len(many))
+        self.assertEqual(1002, len(set([first, last] + many)))
+        for oid in many:
+            self.assert_(isinstance(oid, ObjectId))
+            self.assertEqual(oid, ObjectId(str(oid)))
+            self.assertEqual(first.binary[:9], oid.binary[:9])
+
+    def test_slots(self):
+        self.failIf(hasattr(ObjectId(), "__dict__"))
+        self.assertRaises(AttributeError, setattr, ObjectId(), "foo", 1)
+
+    def test_ordering(self):
+        a = ObjectId("000000000000000000000001")
+        b = ObjectId("000000000000000000000002")
+        self.assert_(a < b)
+        self.assert_(a <= b)
+        self.assert_(b > a)
+        self.assert_(b >= a)
+        self.assert_(a <= ObjectId(a))
+        self.failIf(a < ObjectId(a))
+        self.assertEqual([a, b], sorted([b, a]))
+
+        many = ObjectId.generate_many(10)
+        self.assertEqual(many, sorted(reversed(many)))
+
+    def test_hash(self):
+        a = ObjectId()
+        self.assertEqual(hash(a), hash(ObjectId(a.binary)))
+        self.assertEqual(1, len(set([a, ObjectId(a.binary), ObjectId(a)])))
+        self.failIf(a == a.binary)
+        self.assert_(a != a.binary)
+
+    def test_pickle_copy(self):
+        a = ObjectId()
+        self.assertEqual(a, pickle.loads(pickle.dumps(a)))
+        self.assertEqual(a, copy.copy(a))
+        self.assertEqual(a, copy.deepcopy(a))
+
+        # pickled by the class before it had __slots__
+        old = (b"\x80\x02cpymongo.objectid\nObjectId\nq\x00)\x81q\x01}q\x02X\r"
+               b"\x00\x00\x00_ObjectId__idq\x03c_codecs\nencode\nq\x04X\x0e"
+               b"\x00\x00\x00K\n\x1b,=N_`q\xc2\x82\xc2\x93\x04q\x05X\x06"
+               b"\x00\x00\x00latin1q\x06\x86q\x07Rq\x08sb.")
+        b = pickle.loads(old)
+        self.assertEqual(ObjectId("4b0a1b2c3d4e5f6071829304"), b)
+        self.assertEqual("4b0a1b2c3d4e5f6071829304", str(b))
+        self.assertEqual("ObjectId('4b0a1b2c3d4e5f6071829304')", repr(b))
+
+    def test_from_binary(self):
+        a = ObjectId()
+        b = ObjectId._from_binary(a.binary)
+        self.assert_(isinstance(b, ObjectId))
+        self.assertEqual(a, b)
+        self.assertEqual(str(a), str(b))
+
 if __name__ == "__main__":
     unittest.main()
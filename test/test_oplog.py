@@ -0,0 +1,92 @@
+# Copyright 2009 10gen, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test the oplog module."""
+
+import unittest
+import sys
+sys.path[0:0] = [""]
+
+#from nose.plugins.skip import SkipTest
+
+from pymongo.timestamp import Timestamp
+from pymongo.oplog import OplogReader, CollectionCheckpoint
+from test_connection import get_connection
+
+
+class TestOplogReader(unittest.TestCase):
+
+    def setUp(self):
+        self.connection = get_connection()
+        self.db = self.connection.pymongo_test
+        local = self.connection.local
+        names = local.collection_names()
+        if "oplog.rs" not in names and "oplog.$main" not in names:
+            # needs a master or replica set member
+            raise SkipTest()
+        self.db.drop_collection("test")
+        self.db.drop_collection("checkpoints")
+
+    def test_types(self):
+        self.assertRaises(TypeError, OplogReader, self.connection,
+                          start=(1, 2))
+        self.assertRaises(ValueError, OplogReader, self.connection,
+                          batch_size=0)
+
+    def test_batches(self):
+        reader = OplogReader(self.connection, spec={"ns": "pymongo_test.test"},
+                             batch_size=3, min_delay=0.001, max_delay=0.01)
+        start = reader.position
+        self.assert_(isinstance(start, Timestamp))
+
+        for i in range(5):
+            self.db.test.insert({"x": i}, safe=True)
+
+        batches = iter(reader)
+        first = next(batches)
+        self.assertEqual([0, 1, 2], [op["o"]["x"] for op in first])
+        self.assertEqual(start, reader.position)
+        second = next(batches)
+        self.assertEqual([3, 4], [op["o"]["x"] for op in second])
+        self.assert_(reader.position > start)
+        batches.close()
+
+    def test_checkpoint(self):
+        checkpoint = CollectionCheckpoint(self.db.checkpoints, "test")
+        self.assertEqual(None, checkpoint.load())
+
+        reader = OplogReader(self.connection, checkpoint,
+                             spec={"ns": "pymongo_test.test"},
+                             checkpoint_interval=0,
+                             min_delay=0.001, max_delay=0.01)
+        for i in range(4):
+            self.db.test.insert({"x": i}, safe=True)
+
+        batches = iter(reader)
+        self.assertEqual(4, len(next(batches)))
+        self.db.test.insert({"x": 4}, safe=True)
+        self.assertEqual(4, next(batches)[0]["o"]["x"])
+        batches.close()
+        self.assertEqual(reader.position, checkpoint.load())
+
+        # a new reader carries on after the checkpoint
+        reader = OplogReader(self.connection, checkpoint,
+                             spec={"ns": "pymongo_test.test"},
+                             min_delay=0.001, max_delay=0.01)
+        batches = iter(reader)
+        self.assertEqual([4], [op["o"]["x"] for op in next(batches)])
+        batches.close()
+
+if __name__ == "__main__":
+    unittest.main()
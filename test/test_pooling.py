@@ -16,12 +16,17 @@
 
 import unittest
 import threading
+import hashlib
 import os
 import random
+import time
 import sys
 sys.path[0:0] = [""]
 
+from pymongo.errors import OperationFailure
+from pymongo.connection import Connection, Pool
 from test_connection import get_connection
+from test_deadline import SlowServer
 
 N = 50
 DB = "pymongo-pooling-tests"
@@ -39,6 +44,7 @@ class SaveAndFind(MongoThread):
 
     def run(self):
         for _ in range(N):
+            self.connection.start_request()
             rand = random.randint(0, N)
             id = self.db.sf.save({"x": rand})
             self.ut.assertEqual(rand, self.db.sf.find_one(id)["x"])
@@ -49,6 +55,7 @@ class Unique(MongoThread):
 
     def run(self):
         for _ in range(N):
+            self.connection.start_request()
             self.db.unique.insert({})
             self.ut.assertEqual(None, self.db.error())
             self.connection.end_request()
@@ -58,6 +65,7 @@ class NonUnique(MongoThread):
 
     def run(self):
         for _ in range(N):
+            self.connection.start_request()
             self.db.unique.insert({"_id": "mike"})
             self.ut.assertNotEqual(None, self.db.error())
             self.connection.end_request()
@@ -70,9 +78,10 @@ class Disconnect(MongoThread):
             self.connection.disconnect()
 
 
-class NoRequest(MongoThread):
+class NoEndRequest(MongoThread):
 
     def run(self):
+        self.connection.start_request()
         errors = 0
         for _ in range(N):
             self.db.unique.insert({"_id": "mike"})
@@ -104,11 +113,274 @@ class TestPooling(unittest.TestCase):
         self.c[DB].unique.find_one()
 
     def test_no_disconnect(self):
-        run_cases(self, [NoRequest, NonUnique, Unique, SaveAndFind])
+        run_cases(self, [NoEndRequest, NonUnique, Unique, SaveAndFind])
 
     def test_disconnect(self):
         run_cases(self, [SaveAndFind, Disconnect, Unique])
 
 
+class TestWarmUp(unittest.TestCase):
+
+    def setUp(self):
+        self.server = SlowServer()
+
+    def tearDown(self):
+        self.server.close()
+
+    def accepted(self, count, server=None):
+        """Wait for `server` to have accepted `count` sockets.
+        """
+        server = server or self.server
+        start = time.time()
+        while server.accepted < count and time.time() - start < 5:
+            time.sleep(0.01)
+        time.sleep(0.05)
+        return server.accepted == count
+
+    def connect(self, **kwargs):
+        return Connection("localhost", self.server.port, **kwargs)
+
+    def test_types(self):
+        self.assertRaises(TypeError, self.connect, min_pool_size="3")
+        self.assertRaises(ValueError, self.connect, min_pool_size=-1)
+        self.assertEqual(0, self.connect().min_pool_size)
+
+    def test_min_pool_size(self):
+        # one socket to find the master, then the pool
+        connection = self.connect(min_pool_size=3)
+        self.assertEqual(3, connection.min_pool_size)
+        self.assert_(self.accepted(4))
+
+        def find():
+            connection.test.test.find_one()
+        threads = [threading.Thread(target=find) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assert_(self.accepted(4))
+
+    def test_warm_up(self):
+        connection = self.connect()
+        self.assert_(self.accepted(1))
+        self.assertEqual(2, connection.warm_up(2))
+        self.assertEqual(0, connection.warm_up(2))
+        self.assert_(self.accepted(3))
+
+        self.assertEqual(None, connection.warm_up(4, background=True))
+        self.assert_(self.accepted(5))
+
+        # a new pool starts out empty again
+        connection.disconnect()
+        self.assertEqual(4, connection.warm_up(4))
+
+    def test_pools_not_shared(self):
+        other = SlowServer()
+        try:
+            self.connect(min_pool_size=2)
+            connection = Connection("localhost", other.port)
+            connection.test.test.find_one()
+            self.assert_(self.accepted(2, other))
+        finally:
+            other.close()
+
+
+class FakeSocket(object):
+
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class TestPool(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = Pool(lambda deadline: FakeSocket())
+
+    def test_checkout(self):
+        sock = self.pool.socket()
+        self.assertNotEqual(sock, self.pool.socket())
+        self.pool.return_socket(sock)
+        self.assertEqual(sock, self.pool.socket())
+        self.pool.discard_socket(sock)
+        self.assert_(sock.closed)
+        self.assertEqual([], self.pool.sockets)
+
+    def test_pin(self):
+        sock = self.pool.socket(pin=True)
+        self.assertEqual(sock, self.pool.socket())
+        self.pool.return_socket(sock)
+        self.assertEqual([], self.pool.sockets)
+
+        # pinned to this thread only
+        other = []
+        thread = threading.Thread(
+            target=lambda: other.append(self.pool.socket()))
+        thread.start()
+        thread.join()
+        self.assertNotEqual(sock, other[0])
+
+        self.pool.release()
+        self.assertEqual([sock], self.pool.sockets)
+        self.pool.release()
+        self.assertEqual([sock], self.pool.sockets)
+
+        sock = self.pool.socket(pin=True)
+        self.pool.discard_socket(sock)
+        self.assertNotEqual(sock, self.pool.socket())
+
+
+class TestRequest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = SlowServer()
+        self.connection = Connection("localhost", self.server.port)
+
+    def tearDown(self):
+        self.server.close()
+
+    def find_in_threads(self, count):
+        """Query from `count` threads, one after the other.
+        """
+        for _ in range(count):
+            thread = threading.Thread(
+                target=self.connection.test.test.find_one)
+            thread.start()
+            thread.join()
+
+    def test_sockets_shared(self):
+        # one socket to find the master, one for all of the threads
+        self.find_in_threads(10)
+        self.assertEqual(2, self.server.accepted)
+
+    def test_request(self):
+        self.connection.start_request()
+        self.connection.test.test.find_one()
+        self.find_in_threads(2)
+        self.assertEqual(3, self.server.accepted)
+
+        self.connection.end_request()
+        self.find_in_threads(2)
+        self.assertEqual(3, self.server.accepted)
+
+    def test_discard_on_error(self):
+        self.connection.test.test.find_one()
+        self.assertEqual(2, self.server.accepted)
+
+        def mismatched(*args):
+            del self.connection._Connection__receive_message_on_socket
+            raise AssertionError("ids don't match")
+        self.connection._Connection__receive_message_on_socket = mismatched
+        self.assertRaises(AssertionError, self.connection.test.test.find_one)
+
+        # the socket could be half way through a reply, so it isn't reused
+        self.connection.test.test.find_one()
+        self.assertEqual(3, self.server.accepted)
+
+
+def md5(string):
+    return hashlib.md5(string.encode()).hexdigest()
+
+
+class AuthServer(SlowServer):
+    """Only answers queries on databases that the socket has authenticated
+    to, as "user" with password "password"."""
+
+    def __init__(self):
+        SlowServer.__init__(self)
+        self.nonces = 0
+        self.logouts = 0
+
+    def reply(self, state, namespace, spec):
+        name = namespace.split(".")[0]
+        authenticated = state.setdefault("authenticated", set())
+        if "getnonce" in spec:
+            self.nonces += 1
+            return {"ok": 1, "nonce": "2375531c32080ae8"}
+        if "authenticate" in spec:
+            digest = md5("user:mongo:password")
+            if spec["key"] == md5("2375531c32080ae8user" + digest):
+                authenticated.add(name)
+                return {"ok": 1}
+            return {"ok": 0, "errmsg": "auth fails"}
+        if "logout" in spec:
+            self.logouts += 1
+            authenticated.discard(name)
+            return {"ok": 1}
+        if "ismaster" in spec or name in authenticated:
+            return SlowServer.reply(self, state, namespace, spec)
+        return {"$err": "unauthorized"}
+
+
+class TestAuthPooling(unittest.TestCase):
+
+    def setUp(self):
+        self.server = AuthServer()
+        self.connection = Connection("localhost", self.server.port)
+        self.db = self.connection.test
+
+    def tearDown(self):
+        self.server.close()
+
+    def find_in_threads(self, count):
+        """Query from `count` threads, each holding its own socket.
+        """
+        errors = []
+        barrier = threading.Barrier(count)
+
+        def find():
+            self.connection.start_request()
+            try:
+                self.db.test.find_one()
+                self.db.test.find_one()
+            except OperationFailure as e:
+                errors.append(e)
+            barrier.wait()
+            self.connection.end_request()
+        threads = [threading.Thread(target=find) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return errors
+
+    def test_authenticate(self):
+        self.assertRaises(OperationFailure, self.db.test.find_one)
+        self.failIf(self.db.authenticate("user", "wrong"))
+        self.assert_(self.db.authenticate("user", "password"))
+        self.assertEqual(2, self.server.nonces)
+
+        # each new socket authenticates once
+        self.assertEqual([], self.find_in_threads(3))
+        self.assertEqual(4, self.server.nonces)
+        self.db.test.find_one()
+        self.assertEqual(4, self.server.nonces)
+
+        # a new pool authenticates again
+        self.connection.disconnect()
+        self.db.test.find_one()
+        self.assertEqual(5, self.server.nonces)
+
+    def test_warm_up(self):
+        self.assert_(self.db.authenticate("user", "password"))
+        self.connection.warm_up(3)
+        self.assertEqual(3, self.server.nonces)
+        self.assertEqual([], self.find_in_threads(3))
+        self.assertEqual(3, self.server.nonces)
+
+    def test_logout(self):
+        self.assert_(self.db.authenticate("user", "password"))
+        self.connection.warm_up(2)
+        self.db.logout()
+        self.assertEqual(1, self.server.logouts)
+        self.assertRaises(OperationFailure, self.db.test.find_one)
+
+        # other sockets log out when they are next used
+        self.assertEqual(2, len(self.find_in_threads(2)))
+        self.assertEqual(2, self.server.logouts)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,177 @@
+# Copyright 2009 10gen, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test the retry module."""
+
+import time
+import unittest
+import sys
+sys.path[0:0] = [""]
+
+from pymongo.errors import AutoReconnect
+from pymongo.retry import RetryPolicy
+from fakes import CannedConnection, reply, error_reply, opcode
+
+
+class FlakyConnection(CannedConnection):
+    """A connection whose next `failures` messages fail. Queries open
+    cursor 42 with two documents, getmores exhaust it."""
+
+    def __init__(self, **kwargs):
+        CannedConnection.__init__(self, **kwargs)
+        self.failures = 0
+        self.not_master = 0
+        self.sent = []
+        self.resets = 0
+
+    def _reset(self):
+        self.resets += 1
+
+    def respond(self, message):
+        self.sent.append(opcode(message))
+        if self.failures:
+            self.failures -= 1
+            raise AutoReconnect("connection reset")
+        if self.not_master:
+            self.not_master -= 1
+            return error_reply("not master")
+
+        if opcode(message) == 2004:
+            return reply([{"ok": 1, "n": 1}, {"ok": 1, "n": 2}], 42)
+        return reply([{"ok": 1, "n": 3}])
+
+
+class TestRetryPolicy(unittest.TestCase):
+
+    def test_run(self):
+        policy = RetryPolicy(max_attempts=3, backoff=0)
+        self.assertEqual(5, policy.run(lambda: 5))
+
+        failures = [AutoReconnect(), AutoReconnect()]
+
+        def flaky():
+            if failures:
+                raise failures.pop()
+            return "done"
+        self.assertEqual("done", policy.run(flaky))
+
+        failures = [AutoReconnect()] * 3
+        self.assertRaises(AutoReconnect, policy.run, flaky)
+
+        def broken():
+            raise ValueError()
+        self.assertRaises(ValueError, policy.run, broken)
+
+        self.assertEqual({"calls": 4, "retries": 4, "recovered": 1,
+                          "failures": 1}, policy.stats)
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, RetryPolicy, 0)
+        self.assertRaises(ValueError, RetryPolicy, 1.5)
+        self.assertRaises(TypeError, FlakyConnection, retry_policy=3)
+        connection = FlakyConnection()
+        self.assertEqual(None, connection.retry_policy)
+
+        def set_policy():
+            connection.retry_policy = "retry"
+        self.assertRaises(TypeError, set_policy)
+
+    def test_backoff(self):
+        attempts = []
+
+        def failing():
+            attempts.append(time.time())
+            raise AutoReconnect()
+
+        policy = RetryPolicy(max_attempts=4, backoff=0.02, max_backoff=0.04)
+        self.assertRaises(AutoReconnect, policy.run, failing)
+        self.assertEqual(4, len(attempts))
+        waits = [b - a for (a, b) in zip(attempts, attempts[1:])]
+        self.assert_(waits[0] >= 0.02)
+        self.assert_(waits[1] >= 0.04)
+        self.assert_(waits[2] >= 0.04)
+
+        # the deadline cuts retries short
+        attempts = []
+        policy = RetryPolicy(max_attempts=10, backoff=0.05, deadline=0.1)
+        self.assertRaises(AutoReconnect, policy.run, failing)
+        self.assertEqual(2, len(attempts))
+
+    def test_clock(self):
+        # the deadline holds even if the wall clock runs backwards
+        attempts = []
+
+        def failing():
+            attempts.append(None)
+            raise AutoReconnect()
+
+        real = time.time
+        steps = [0]
+
+        def backwards():
+            steps[0] += 1
+            return real() - 3600 * steps[0]
+        time.time = backwards
+        try:
+            policy = RetryPolicy(max_attempts=10, backoff=0.05, deadline=0.1)
+            self.assertRaises(AutoReconnect, policy.run, failing)
+        finally:
+            time.time = real
+        self.assertEqual(2, len(attempts))
+
+    def test_queries_retried(self):
+        connection = FlakyConnection(retry_policy=RetryPolicy(backoff=0))
+        connection.failures = 2
+        self.assertEqual(1, connection.test.test.find_one()["n"])
+        self.assertEqual([2004] * 3, connection.sent)
+
+        connection.not_master = 1
+        self.assertEqual(1, connection.test.test.find_one()["n"])
+        self.assertEqual(1, connection.resets)
+
+        connection.failures = 3
+        self.assertRaises(AutoReconnect, connection.test.test.find_one)
+        self.assertEqual({"calls": 3, "retries": 5, "recovered": 2,
+                          "failures": 1},
+                         connection.retry_policy.stats)
+
+    def test_getmore_not_retried(self):
+        connection = FlakyConnection(retry_policy=RetryPolicy(backoff=0))
+        cursor = connection.test.test.find()
+        self.assertEqual(1, next(cursor)["n"])
+        self.assertEqual(2, next(cursor)["n"])
+        connection.failures = 1
+        self.assertRaises(AutoReconnect, next, cursor)
+        self.assertEqual([2004, 2005], connection.sent)
+
+    def test_commands(self):
+        connection = FlakyConnection(retry_policy=RetryPolicy(backoff=0))
+        connection.failures = 1
+        connection.test.command({"count": "test"})
+        self.assertEqual(2, len(connection.sent))
+
+        connection.failures = 1
+        self.assertRaises(AutoReconnect, connection.test.command,
+                          {"drop": "test"})
+        self.assertEqual(3, len(connection.sent))
+
+    def test_no_policy(self):
+        connection = FlakyConnection()
+        connection.failures = 1
+        self.assertRaises(AutoReconnect, connection.test.test.find_one)
+        self.assertEqual(1, connection.test.test.find_one()["n"])
+
+
+if __name__ == "__main__":
+    unittest.main()
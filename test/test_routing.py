@@ -0,0 +1,214 @@
+# Copyright 2009 10gen, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test the routing module."""
+
+import time
+import unittest
+import sys
+sys.path[0:0] = [""]
+
+from pymongo.errors import AutoReconnect
+from pymongo.master_slave_connection import MasterSlaveConnection
+from pymongo.routing import (RoutingPolicy,
+                             RoundRobinPolicy,
+                             LeastOutstandingPolicy,
+                             LatencyPolicy,
+                             LagBoundedPolicy)
+from fakes import CannedConnection, reply, wait_for
+
+
+class FakeConnection(CannedConnection):
+    """A connection that answers every query with one document saying
+    which connection it came from."""
+
+    def __init__(self, name):
+        CannedConnection.__init__(self)
+        self.name = name
+        self.fail = False
+
+    def respond(self, message):
+        if self.fail:
+            raise AutoReconnect("%s is down" % self.name)
+        return reply([{"ok": 1, "name": self.name}])
+
+
+class QuickEjection(RoutingPolicy):
+    eject_time = 0.05
+    max_eject_time = 0.1
+
+
+class TestRouting(unittest.TestCase):
+
+    def setUp(self):
+        self.master = FakeConnection("master")
+        self.slaves = [FakeConnection("slave%d" % i) for i in range(3)]
+
+    def connect(self, policy):
+        return MasterSlaveConnection(self.master, self.slaves, policy)
+
+    def read(self, connection):
+        return connection.test.test.find_one()["name"]
+
+    def test_set_routing_policy(self):
+        connection = MasterSlaveConnection(self.master, self.slaves)
+        self.assert_(isinstance(connection.routing_policy, RoutingPolicy))
+        self.assertRaises(TypeError, connection.set_routing_policy, object)
+        self.assertRaises(TypeError, MasterSlaveConnection, self.master,
+                          self.slaves, object)
+
+        connection.set_routing_policy(RoundRobinPolicy)
+        self.assert_(isinstance(connection.routing_policy, RoundRobinPolicy))
+        self.assertEqual(3, len(connection.routing_policy.states))
+
+    def test_random(self):
+        connection = self.connect(RoutingPolicy)
+        names = set([self.read(connection) for _ in range(100)])
+        self.assertEqual(set(["slave0", "slave1", "slave2"]), names)
+
+        states = connection.routing_policy.states
+        self.assertEqual(100, sum([state.requests for state in states]))
+        self.assertEqual([0, 0, 0], [state.outstanding for state in states])
+        for state in states:
+            self.assert_(state.latency is not None)
+
+    def test_round_robin(self):
+        connection = self.connect(RoundRobinPolicy)
+        self.assertEqual(["slave0", "slave1", "slave2", "slave0"],
+                         [self.read(connection) for _ in range(4)])
+
+    def test_least_outstanding(self):
+        connection = self.connect(LeastOutstandingPolicy)
+        policy = connection.routing_policy
+        policy._begin(0)
+        policy._begin(2)
+        self.assertEqual(["slave1"] * 5,
+                         [self.read(connection) for _ in range(5)])
+        policy._finished(0, None)
+        self.assert_(self.read(connection) in ["slave0", "slave1"])
+
+    def test_latency(self):
+        connection = self.connect(LatencyPolicy)
+        policy = connection.routing_policy
+
+        # untried slaves come first
+        self.assertEqual(set(["slave0", "slave1", "slave2"]),
+                         set([self.read(connection) for _ in range(3)]))
+
+        for (index, latency) in enumerate([0.5, 0.1, 0.3]):
+            policy.states[index].latency = latency
+        self.assertEqual("slave1", self.read(connection))
+
+        # a slow response moves the average
+        policy._begin(1)
+        policy._finished(1, 2.0)
+        self.assertEqual("slave2", self.read(connection))
+
+    def test_clock(self):
+        # the wall clock running backwards doesn't affect latencies or
+        # bringing ejected slaves back
+        real = time.time
+        steps = [0]
+
+        def backwards():
+            steps[0] += 1
+            return real() - 3600 * steps[0]
+        time.time = backwards
+        try:
+            connection = self.connect(QuickEjection)
+            policy = connection.routing_policy
+            for _ in range(6):
+                self.read(connection)
+            for state in policy.states:
+                self.assert_(state.latency >= 0)
+
+            self.slaves[1].fail = True
+            while not policy.states[1].ejected:
+                try:
+                    self.read(connection)
+                except AutoReconnect:
+                    pass
+            self.slaves[1].fail = False
+            self.assert_(wait_for(lambda: not policy.states[1].ejected))
+        finally:
+            time.time = real
+
+    def test_ejection(self):
+        connection = self.connect(QuickEjection)
+        policy = connection.routing_policy
+
+        self.slaves[1].fail = True
+        for _ in range(20):
+            try:
+                self.assertNotEqual("slave1", self.read(connection))
+            except AutoReconnect:
+                pass
+        state = policy.states[1]
+        self.assert_(state.ejected)
+        self.assertEqual(1, state.errors)
+        self.assertEqual(1, state.ejections)
+        self.assertEqual(0, state.outstanding)
+
+        # reads go to the master while every slave is ejected
+        self.slaves[0].fail = True
+        self.slaves[2].fail = True
+        for _ in range(2):
+            self.assertRaises(AutoReconnect, self.read, connection)
+        self.assertEqual("master", self.read(connection))
+
+        # and the slaves come back once they answer again
+        for slave in self.slaves:
+            slave.fail = False
+        self.assert_(wait_for(lambda: not [state for state in policy.states
+                                           if state.ejected]))
+        self.assertNotEqual("master", self.read(connection))
+
+    def test_lag_bounded(self):
+        lags = {"slave0": 30, "slave1": 1, "slave2": None}
+
+        class FreshPolicy(LagBoundedPolicy, RoundRobinPolicy):
+            max_lag = 5
+            lag_interval = 0.05
+
+            def _newest(self, master):
+                return 1000
+
+            def _synced(self, slave):
+                lag = lags[slave.name]
+                if lag is None:
+                    raise AutoReconnect()
+                return 1000 - lag
+
+        connection = self.connect(FreshPolicy)
+        policy = connection.routing_policy
+        self.assert_(wait_for(lambda: policy.states[0].lag == 30))
+        self.assertEqual(1, policy.states[1].lag)
+        self.assertEqual(None, policy.states[2].lag)
+
+        names = set([self.read(connection) for _ in range(6)])
+        self.assertEqual(set(["slave1", "slave2"]), names)
+
+        lags["slave0"] = 0
+        self.assert_(wait_for(lambda: policy.states[0].lag == 0))
+        names = set([self.read(connection) for _ in range(6)])
+        self.assertEqual(set(["slave0", "slave1", "slave2"]), names)
+
+        # an empty oplog means no slave can be behind
+        FreshPolicy._newest = lambda self, master: None
+        self.assert_(wait_for(lambda: policy.states[2].lag == 0))
+        self.assertEqual([0, 0, 0], [state.lag for state in policy.states])
+
+
+if __name__ == "__main__":
+    unittest.main()
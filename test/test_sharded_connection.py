@@ -0,0 +1,289 @@
+# Copyright 2009 10gen, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test the sharded_connection module."""
+
+import struct
+import threading
+import time
+import unittest
+import sys
+sys.path[0:0] = [""]
+
+from pymongo import bson
+from pymongo.errors import InvalidOperation
+from pymongo.helpers import _canonical
+from pymongo.sharded_connection import ShardedConnection, _SortKey
+from fakes import CannedConnection, reply
+
+
+def _c_string(data, position):
+    end = data.index(b"\x00", position)
+    return (data[position:end].decode(), end + 1)
+
+
+def _matches(doc, spec):
+    return all(doc.get(key) == value for (key, value) in spec.items())
+
+
+class FakeShard(CannedConnection):
+    """Keeps every collection in memory, in insertion order, and answers
+    each query with all of the results in one batch."""
+
+    def __init__(self):
+        CannedConnection.__init__(self)
+        self.collections = {}
+        self.queries = 0
+        self.delay = 0
+        self.lock = threading.Lock()
+
+    def docs(self, namespace):
+        return self.collections.setdefault(namespace, [])
+
+    def _send_message(self, message, with_last_error=False, **kwargs):
+        data = message[1]
+        (length, _, _, operation) = struct.unpack("<iiii", data[:16])
+        data = data[16:length]
+        (namespace, position) = _c_string(data, 4)
+        if operation == 2002:
+            self.docs(namespace).extend(bson._to_dicts(data[position:]))
+        elif operation == 2001:
+            options = struct.unpack("<i", data[position:position + 4])[0]
+            (spec, document) = bson._to_dicts(data[position + 4:])
+            self.update(namespace, spec, document, options & 1, options & 2)
+        elif operation == 2006:
+            spec = bson._to_dicts(data[position + 4:])[0]
+            self.collections[namespace] = [doc for doc in self.docs(namespace)
+                                           if not _matches(doc, spec)]
+
+    def update(self, namespace, spec, document, upsert, multi):
+        found = False
+        for doc in self.docs(namespace):
+            if _matches(doc, spec):
+                found = True
+                if "$set" in document:
+                    doc.update(document["$set"])
+                else:
+                    doc.clear()
+                    doc.update(spec)
+                    doc.update(document)
+                if not multi:
+                    return
+        if upsert and not found:
+            doc = dict(spec)
+            doc.update(document.get("$set", document))
+            self.docs(namespace).append(doc)
+
+    def respond(self, message):
+        with self.lock:
+            self.queries += 1
+        time.sleep(self.delay)
+        data = message[1][16:]
+        (namespace, position) = _c_string(data, 4)
+        (skip, limit) = struct.unpack("<ii", data[position:position + 8])
+        spec = bson._to_dicts(data[position + 8:])[0]
+
+        if namespace.endswith(".$cmd"):
+            collection = "%s.%s" % (namespace[:-5], spec.get("count"))
+            count = len([doc for doc in self.docs(collection)
+                         if _matches(doc, spec.get("query") or {})])
+            results = [{"ok": 1, "n": count}]
+        else:
+            ordering = []
+            if "query" in spec:
+                ordering = list(spec.get("orderby", {}).items())
+                spec = spec["query"]
+            results = [doc for doc in self.docs(namespace)
+                       if _matches(doc, spec)]
+            if ordering:
+                results.sort(key=lambda doc: _SortKey(doc, ordering))
+            results = results[skip:]
+            if limit:
+                results = results[:abs(limit)]
+
+        return reply(results)
+
+
+class TestShardedConnection(unittest.TestCase):
+
+    def setUp(self):
+        self.shards = [FakeShard() for _ in range(3)]
+        self.connection = ShardedConnection(self.shards, "user")
+        self.collection = self.connection.test.test
+
+    def shard_of(self, doc):
+        for (index, shard) in enumerate(self.shards):
+            if doc in shard.docs("test.test"):
+                return index
+
+    def test_types(self):
+        self.assertRaises(TypeError, ShardedConnection, [], "user")
+        self.assertRaises(TypeError, ShardedConnection, self.shards[0], "user")
+        self.assertRaises(TypeError, ShardedConnection, [None], "user")
+        self.assertRaises(TypeError, ShardedConnection, self.shards, 5)
+        self.assertRaises(TypeError, self.collection.find, 5)
+        self.assertRaises(TypeError, self.collection.find().limit, "1")
+        self.assertEqual("user", self.connection.shard_key)
+        self.assertEqual(self.shards, self.connection.shards)
+        self.assertEqual(self.collection, self.connection["test"]["test"])
+        self.assertEqual("test.test", self.collection.full_name)
+        self.assertRaises(AttributeError, getattr, self.connection, "_test")
+        self.assertRaises(AttributeError, getattr, self.connection.test,
+                          "__deepcopy__")
+        self.assertEqual("_test.test",
+                         self.connection["_test"]["test"].full_name)
+
+    def test_insert_routed(self):
+        docs = [{"user": n, "n": n} for n in range(30)]
+        ids = self.collection.insert(docs)
+        self.assertEqual([doc["_id"] for doc in docs], ids)
+        sizes = [len(shard.docs("test.test")) for shard in self.shards]
+        self.assertEqual(30, sum(sizes))
+        self.failIf(0 in sizes)
+
+        # the same key always lands on the same shard
+        self.collection.insert({"user": 7, "n": 100})
+        self.assertEqual(self.shard_of(docs[7]),
+                         self.shard_of(self.collection.find_one({"n": 100})))
+
+        self.assertRaises(InvalidOperation, self.collection.insert, {"n": 1})
+        self.assertRaises(InvalidOperation, self.collection.insert,
+                          [{"user": 1}, {"n": 1}])
+        self.assertEqual(31, self.collection.count())
+
+    def test_equal_numbers(self):
+        self.collection.insert({"user": 1, "n": 1})
+        self.collection.insert({"user": 2 ** 40, "n": 2})
+        self.assertEqual(1, self.collection.find_one({"user": 1.0})["n"])
+        self.assertEqual(2, self.collection.find_one({"user": 2.0 ** 40})["n"])
+        self.assertEqual(1, _canonical(1.0))
+        self.assertEqual(True, _canonical(True))
+        self.assertEqual(1.5, _canonical(1.5))
+        self.assertEqual(self.connection._shard_for({"user": [1]}),
+                         self.connection._shard_for({"user": [1.0]}))
+
+    def test_close(self):
+        self.collection.insert([{"user": n} for n in range(10)])
+        self.assertEqual(10, self.collection.count())
+        self.connection.close()
+        self.connection.close()
+        self.assertEqual(10, self.collection.count())
+        self.connection.close()
+
+    def test_find_one_routed(self):
+        self.collection.insert([{"user": n} for n in range(10)])
+        queries = [shard.queries for shard in self.shards]
+        self.assertEqual(3, self.collection.find_one({"user": 3})["user"])
+        self.assertEqual(sum(queries) + 1,
+                         sum([shard.queries for shard in self.shards]))
+
+        self.assertEqual(None, self.collection.find_one({"user": 11}))
+        self.assert_(self.collection.find_one())
+        self.assertEqual(sum(queries) + 5,
+                         sum([shard.queries for shard in self.shards]))
+
+    def test_find_sorted(self):
+        self.collection.insert([{"user": n, "n": (n * 7) % 20}
+                                for n in range(20)])
+        self.assertEqual(list(range(20)),
+                         [doc["n"] for doc in self.collection.find().sort("n")])
+        self.assertEqual(list(range(19, -1, -1)),
+                         [doc["n"] for doc in
+                          self.collection.find().sort("n", -1)])
+
+        cursor = self.collection.find().sort("n").skip(5).limit(4)
+        self.assertEqual([5, 6, 7, 8], [doc["n"] for doc in cursor])
+        self.assertEqual([], list(cursor))
+        self.assertEqual([5, 6, 7, 8], [doc["n"] for doc in cursor.rewind()])
+        self.assertRaises(InvalidOperation, cursor.limit, 1)
+
+        cursor = self.collection.find(skip=18).sort([("n", 1)])
+        self.assertEqual([18, 19], [doc["n"] for doc in cursor])
+        self.assertEqual(6, len(list(self.collection.find(limit=6))))
+
+    def test_count(self):
+        self.collection.insert([{"user": n, "odd": n % 2} for n in range(20)])
+        self.assertEqual(20, self.collection.count())
+        self.assertEqual(10, self.collection.find({"odd": 1}).count())
+        self.assertEqual(1, self.collection.find({"user": 5}).count())
+        cursor = self.collection.find().skip(15).limit(3)
+        self.assertEqual(20, cursor.count())
+        self.assertEqual(3, cursor.count(True))
+        self.assertEqual(5, self.collection.find().skip(15).count(True))
+
+    def test_update(self):
+        self.collection.insert([{"user": n, "x": 0} for n in range(10)])
+        self.collection.update({"user": 4}, {"$set": {"x": 1}})
+        self.assertEqual(1, self.collection.find_one({"user": 4})["x"])
+        self.collection.update({"user": 40}, {"$set": {"x": 1}}, upsert=True)
+        self.assertEqual(1, self.collection.find_one({"user": 40})["x"])
+
+        self.assertRaises(InvalidOperation, self.collection.update,
+                          {"x": 0}, {"$set": {"x": 2}})
+        self.assertRaises(InvalidOperation, self.collection.update,
+                          {"x": 0}, {"$set": {"x": 2}}, upsert=True,
+                          multi=True)
+        self.collection.update({"x": 0}, {"$set": {"x": 2}}, multi=True)
+        self.assertEqual(9, self.collection.find({"x": 2}).count())
+
+    def test_remove(self):
+        docs = [{"user": n, "odd": n % 2} for n in range(10)]
+        self.collection.insert(docs)
+        self.collection.remove({"user": 3})
+        self.assertEqual(9, self.collection.count())
+        self.collection.remove({"odd": 0})
+        self.assertEqual(4, self.collection.count())
+        self.collection.remove(docs[1]["_id"])
+        self.assertEqual(3, self.collection.count())
+        self.collection.remove()
+        self.assertEqual(0, self.collection.count())
+
+    def test_shard_function(self):
+        def by_parity(doc):
+            if isinstance(doc.get("n"), int):
+                return doc["n"] % 2
+            return None
+        connection = ShardedConnection(self.shards[:2], by_parity)
+        collection = connection.test.test
+        collection.insert([{"n": n} for n in range(10)])
+        self.assertEqual([0, 2, 4, 6, 8],
+                         [doc["n"] for doc in self.shards[0].docs("test.test")])
+        self.assertEqual([1, 3, 5, 7, 9],
+                         [doc["n"] for doc in self.shards[1].docs("test.test")])
+        self.assertEqual(3, collection.find_one({"n": 3})["n"])
+        self.assertEqual(list(range(10)),
+                         [doc["n"] for doc in collection.find().sort("n")])
+
+    def test_parallel(self):
+        self.collection.insert([{"user": n} for n in range(10)])
+        for shard in self.shards:
+            shard.delay = 0.3
+        start = time.time()
+        self.assertEqual(10, len(list(self.collection.find())))
+        self.assertEqual(10, self.collection.count())
+        self.assert_(time.time() - start < 1.5)
+
+    def test_sort_key(self):
+        ordering = [("a", 1), ("b", -1)]
+        docs = [{"a": 2, "b": 1}, {"b": 5}, {"a": 1, "b": 1},
+                {"a": "x"}, {"a": 1, "b": 2}, {"a": None}]
+        docs.sort(key=lambda doc: _SortKey(doc, ordering))
+        # a missing field sorts like None
+        self.assertEqual([{"b": 5}, {"a": None}, {"a": 1, "b": 2},
+                          {"a": 1, "b": 1}, {"a": 2, "b": 1}, {"a": "x"}],
+                         docs)
+
+
+if __name__ == "__main__":
+    unittest.main()
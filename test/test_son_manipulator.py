@@ -105,5 +105,39 @@ class TestSONManipulator(unittest.TestCase):
         qcheck.check_unittest(self, outgoing_is_identity,
                               qcheck.gen_mongo_dict(3))
 
+    def test_batches(self):
+        collection = self.db.test
+
+        docs = [{}, {"_id": 5}]
+        self.assert_(docs is
+                     ObjectIdInjector().transform_incoming_many(docs,
+                                                                collection))
+        self.assert_("_id" in docs[0])
+        self.assertEqual(5, docs[1]["_id"])
+
+        docs = NamespaceInjector().transform_incoming_many([{}, {}],
+                                                           collection)
+        self.assertEqual(["test", "test"], [doc["_ns"] for doc in docs])
+
+        # no outgoing manipulators by default, so this is a no-op
+        docs = [{"x": 1}]
+        self.assert_(docs is self.db._fix_outgoing_many(docs, collection))
+        self.assert_(docs[0] is self.db._fix_outgoing(docs[0], collection))
+
+        class BatchOnly(SONManipulator):
+            def transform_outgoing_many(self, sons, collection):
+                return [SON([("n", len(sons))]) for _ in sons]
+
+        self.db.add_son_manipulator(BatchOnly())
+        self.assertEqual([{"n": 2}, {"n": 2}],
+                         self.db._fix_outgoing_many([{}, {}], collection))
+
+        self.db.add_son_manipulator(NamespaceInjector())
+        docs = self.db._fix_incoming_many([{}, {"_id": 1}], collection)
+        self.assertEqual(["test", "test"], [doc["_ns"] for doc in docs])
+        self.assert_("_id" in docs[0])
+        self.assertEqual(docs[1], self.db._fix_incoming({"_id": 1},
+                                                        collection))
+
 if __name__ == "__main__":
     unittest.main()
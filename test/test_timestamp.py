@@ -0,0 +1,89 @@
+# Copyright 2009 10gen, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the timestamp module."""
+
+import copy
+import datetime
+import pickle
+import unittest
+import sys
+sys.path[0:0] = [""]
+
+from pymongo.timestamp import Timestamp
+from pymongo.bson import BSON
+
+
+class TestTimestamp(unittest.TestCase):
+
+    def test_timestamp(self):
+        t = Timestamp(123, 456)
+        self.assertEqual(123, t.time)
+        self.assertEqual(456, t.inc)
+        self.assertEqual("Timestamp(123, 456)", repr(t))
+        self.assertEqual(t, pickle.loads(pickle.dumps(t)))
+        self.assertEqual(t, copy.deepcopy(t))
+        self.assertEqual(1, len(set([t, Timestamp(123, 456)])))
+        self.assertNotEqual(t, Timestamp(456, 123))
+
+        # not a tuple, so code written for the old (inc, time) tuples fails
+        # instead of silently getting the fields swapped
+        self.failIf(isinstance(t, tuple))
+        self.assertNotEqual((123, 456), t)
+        self.assertRaises(TypeError, lambda: t[0])
+        self.assertRaises(TypeError, tuple, t)
+        self.assertRaises(TypeError, lambda: t < (124, 0))
+        self.assertEqual(datetime.datetime(1970, 1, 1, 0, 2, 3),
+                         t.as_datetime())
+
+    def test_datetime(self):
+        d = datetime.datetime(2010, 5, 5, 5, 5, 5)
+        t = Timestamp(d, 0)
+        self.assertEqual(1273035905, t.time)
+        self.assertEqual(d, t.as_datetime())
+
+    def test_exceptions(self):
+        self.assertRaises(TypeError, Timestamp)
+        self.assertRaises(TypeError, Timestamp, None, 123)
+        self.assertRaises(TypeError, Timestamp, 1.2, 123)
+        self.assertRaises(TypeError, Timestamp, 123, None)
+        self.assertRaises(TypeError, Timestamp, 123, 1.2)
+        self.assertRaises(ValueError, Timestamp, 0, -1)
+        self.assertRaises(ValueError, Timestamp, -1, 0)
+        self.assertRaises(ValueError, Timestamp, 2 ** 32, 0)
+        self.assert_(Timestamp(0, 0))
+
+    def test_ordering(self):
+        self.assert_(Timestamp(1, 5) < Timestamp(2, 0))
+        self.assert_(Timestamp(1, 5) < Timestamp(1, 6))
+        self.assertEqual([Timestamp(1, 1), Timestamp(1, 2), Timestamp(2, 0)],
+                         sorted([Timestamp(2, 0), Timestamp(1, 2),
+                                 Timestamp(1, 1)]))
+
+    def test_bson(self):
+        # inc comes first on the wire
+        self.assertEqual(BSON(b"\x13\x00\x00\x00\x11\x74\x65\x73\x74\x00\x04"
+                              b"\x00\x00\x00\x14\x00\x00\x00\x00"),
+                         BSON.from_dict({"test": Timestamp(20, 4)}))
+        decoded = BSON.from_dict({"test": Timestamp(20, 4)}).to_dict()
+        self.assertEqual({"test": Timestamp(20, 4)}, decoded)
+        self.assert_(isinstance(decoded["test"], Timestamp))
+        self.assertEqual(20, decoded["test"].time)
+        self.assertEqual(Timestamp(2 ** 32 - 1, 2 ** 31),
+                         BSON.from_dict({"test": Timestamp(2 ** 32 - 1,
+                                                           2 ** 31)}
+                                        ).to_dict()["test"])
+
+if __name__ == "__main__":
+    unittest.main()
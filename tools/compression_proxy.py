@@ -0,0 +1,177 @@
+# Copyright 2009 10gen, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Sidecar proxy adding wire compression to a MongoDB server.
+
+Run it next to a mongod that doesn't support compression itself, and point
+connections created with ``compression="zlib"`` (or another compressor) at
+the proxy instead of the server. Compressed messages from the client are
+decompressed and passed on; replies to them are compressed with the same
+compressor on the way back. Uncompressed messages pass through untouched,
+so plain connections can use the proxy too::
+
+  $ python tools/compression_proxy.py --port 27018 --mongod localhost:27017
+"""
+
+import optparse
+import socket
+import struct
+import threading
+import sys
+sys.path[0:0] = [""]
+
+from pymongo import message
+from pymongo.errors import ConnectionFailure
+
+# compressor id -> name
+_NAMES = dict([(compressor_id, name) for
+               (name, (compressor_id, _, _)) in message._COMPRESSORS.items()])
+# opcodes of the messages the server replies to (query and getmore)
+_REPLIED = (2004, 2005)
+
+
+def _receive(sock, length):
+    data = b""
+    while len(data) < length:
+        chunk = sock.recv(length - len(data))
+        if not chunk:
+            raise socket.error("connection closed")
+        data += chunk
+    return data
+
+
+def _receive_message(sock):
+    """Read one whole message, header included, from `sock`.
+    """
+    header = _receive(sock, 16)
+    length = struct.unpack("<i", header[:4])[0]
+    return header + _receive(sock, length - 16)
+
+
+class CompressionProxy(object):
+    """Accepts connections on `port`, relaying each one to a new connection
+    to the server at `mongod` (a ``(host, port)`` pair).
+    """
+
+    def __init__(self, mongod, host="localhost", port=0):
+        self.__mongod = mongod
+        self.__listener = socket.socket()
+        self.__listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.__listener.bind((host, port))
+        self.__listener.listen(64)
+        self.compressed = 0
+        self.decompressed = 0
+
+    def port(self):
+        """The port the proxy is listening on.
+        """
+        return self.__listener.getsockname()[1]
+    port = property(port)
+
+    def serve_forever(self):
+        while True:
+            try:
+                (client, _) = self.__listener.accept()
+            except socket.error:
+                return
+            self.__start(self.__relay, client)
+
+    def start(self):
+        """Serve from a background thread.
+        """
+        self.__start(self.serve_forever)
+
+    def close(self):
+        self.__listener.close()
+
+    def __start(self, target, *args):
+        thread = threading.Thread(target=target, args=args)
+        thread.daemon = True
+        thread.start()
+
+    def __relay(self, client):
+        try:
+            server = socket.create_connection(self.__mongod)
+        except socket.error:
+            client.close()
+            return
+        for sock in (client, server):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        # request id -> compressor id, for the requests that came compressed
+        compressors = {}
+        self.__start(self.__upstream, client, server, compressors)
+        self.__downstream(server, client, compressors)
+
+    def __upstream(self, client, server, compressors):
+        """Decompress messages from the client and pass them on.
+        """
+        try:
+            while True:
+                data = _receive_message(client)
+                (request_id, response_to, operation) = \
+                    struct.unpack("<iii", data[4:16])
+                if operation == message.OP_COMPRESSED:
+                    compressor_id = struct.unpack("<B", data[24:25])[0]
+                    (operation, body) = message.decompress(data[16:])
+                    data = struct.pack("<iiii", 16 + len(body), request_id,
+                                       response_to, operation) + body
+                    if operation in _REPLIED:
+                        compressors[request_id] = compressor_id
+                    self.decompressed += 1
+                server.sendall(data)
+        except (socket.error, IOError, ConnectionFailure):
+            # including compressed messages we can't read
+            pass
+        finally:
+            client.close()
+            server.close()
+
+    def __downstream(self, server, client, compressors):
+        """Pass replies back, compressed if the request was.
+        """
+        try:
+            while True:
+                data = _receive_message(server)
+                response_to = struct.unpack("<i", data[8:12])[0]
+                compressor_id = compressors.pop(response_to, None)
+                if compressor_id is not None:
+                    data = message.compress(data, _NAMES[compressor_id])
+                    self.compressed += 1
+                client.sendall(data)
+        except (socket.error, IOError, ConnectionFailure):
+            pass
+        finally:
+            client.close()
+            server.close()
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option("--host", default="localhost",
+                      help="address to listen on [default: %default]")
+    parser.add_option("--port", type="int", default=27018,
+                      help="port to listen on [default: %default]")
+    parser.add_option("--mongod", default="localhost:27017",
+                      help="server to relay to [default: %default]")
+    (options, _) = parser.parse_args()
+
+    (host, port) = options.mongod.split(":")
+    proxy = CompressionProxy((host, int(port)), options.host, options.port)
+    print("relaying %s:%d -> %s (compressors: %s)" %
+          (options.host, proxy.port, options.mongod,
+           ", ".join(sorted(message._COMPRESSORS.keys()))))
+    proxy.serve_forever()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+# Copyright 2009 10gen, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark getting Database and Collection handles.
+
+Compares the cached attribute lookups (``connection.db.collection``) with
+building fresh handles the way every lookup used to. Doesn't need a running
+server.
+"""
+
+import datetime
+import sys
+sys.path[0:0] = [""]
+
+from pymongo.connection import Connection
+from pymongo.database import Database
+from pymongo.collection import Collection
+
+trials = 100000
+
+
+def run(name, function):
+    start = datetime.datetime.now()
+    for _ in range(trials):
+        function()
+    took = datetime.datetime.now() - start
+    per_call = (took.seconds + took.microseconds / 1000000.0) / trials
+    print("%-12s took: %s (%.2f us per lookup)" % (name, took,
+                                                  per_call * 1000000))
+
+
+def main():
+    connection = Connection(_connect=False)
+
+    run("cached", lambda: connection.pymongo_test.test)
+    run("uncached",
+        lambda: Collection(Database(connection, "pymongo_test"), "test"))
+    run("sub cached", lambda: connection.pymongo_test.fs.files)
+
+if __name__ == "__main__":
+    main()